@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SpendingInsight
+from .models import SpendingInsight, InsightJob
 
 
 @admin.register(SpendingInsight)
@@ -8,3 +8,11 @@ class SpendingInsightAdmin(admin.ModelAdmin):
     list_filter = ['insight_type', 'is_read', 'created_at']
     search_fields = ['user__username', 'title', 'message']
     readonly_fields = ['created_at']
+
+
+@admin.register(InsightJob)
+class InsightJobAdmin(admin.ModelAdmin):
+    list_display = ['user', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['status']
+    search_fields = ['user__username', 'last_error']
+    readonly_fields = ['created_at', 'updated_at']
@@ -0,0 +1,76 @@
+"""
+Unusual expense alerts raised as transactions are written.
+
+Each expense is compared with the UserCategoryStats row of its category as
+it was before the write added it: the other expenses' count, mean and
+spread, updated in constant time in the same database transaction (see
+transactions/spread.py). It is unusual when it is well above the mean
+(``Z_THRESHOLD`` standard deviations) and above the estimate of the
+``QUANTILE`` quantile; it is then stored as an 'anomaly' SpendingInsight.
+No history is read on the write path.
+"""
+from transactions.categories import category_registry
+from transactions.spread import QUANTILE, sketch_quantile, standard_deviation
+from .models import SpendingInsight
+
+
+# Expenses a category needs before its amounts are judged
+MIN_HISTORY = 10
+Z_THRESHOLD = 3.0
+# Floor of the standard deviation, relative to the mean, so a category of
+# identical amounts does not flag every small increase
+MIN_SPREAD = 0.1
+
+
+def is_unusual(stats, amount):
+    """Whether ``amount`` stands out from the expenses ``stats`` describe."""
+    if stats.count < MIN_HISTORY:
+        return False
+    spread = max(standard_deviation(stats), MIN_SPREAD * stats.mean)
+    return amount > stats.mean + Z_THRESHOLD * spread and amount > sketch_quantile(stats.sketch)
+
+
+def _anomaly_key(transaction_id):
+    return f'anomaly:{transaction_id}'
+
+
+def anomaly_insight(stats, transaction_id, day, amount):
+    category = category_registry.get(stats.category_id)
+    name = category.name if category else 'this category'
+    return SpendingInsight(
+        user_id=stats.user_id,
+        insight_type='anomaly',
+        title=f'Unusual Expense: {name}',
+        subject_key=_anomaly_key(transaction_id),
+        period=day.strftime('%Y-%m'),
+        message=(
+            f'GH₵{amount:.2f} on {day:%b %d, %Y} is much more than you usually spend on {name} '
+            f'(about GH₵{stats.mean:.2f} on average; {QUANTILE:.0%} of these expenses are under '
+            f'GH₵{sketch_quantile(stats.sketch):.2f}).'
+        ),
+        amount=amount,
+    )
+
+
+def record_change(transaction_id, old_state=None, new_state=None, stats=None):
+    """
+    Raise or withdraw the unusual expense alert of a single transaction
+    write. States are ``Transaction.rollup_state()`` tuples: ``old_state``
+    before the write (None on create), ``new_state`` after it (None on
+    delete); ``stats`` are the statistics of ``new_state``'s category before
+    the write. Returns the alert raised, if any.
+    """
+    if old_state == new_state:
+        return None
+    if old_state is not None and old_state[2] == 'expense':
+        SpendingInsight.objects.filter(
+            user_id=old_state[0], insight_type='anomaly', subject_key=_anomaly_key(transaction_id),
+        ).delete()
+    if new_state is None or new_state[2] != 'expense' or stats is None:
+        return None
+    _, _, _, day, amount = new_state
+    if not is_unusual(stats, float(amount)):
+        return None
+    insight = anomaly_insight(stats, transaction_id, day, amount)
+    insight.save()
+    return insight
@@ -0,0 +1,153 @@
+"""
+Insight generation for all users, ahead of traffic.
+
+Users are split into fixed id ranges (``[start, start + range_size)``) which
+are handed to a process pool. Each worker opens its own database connection
+and generates a range in batches with ``generate_insights_for_users``, whose
+query count does not depend on the batch size. Completed ranges are recorded
+in a checkpoint file, so an interrupted run can be resumed.
+"""
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models import Max, Min
+
+from .utils import current_period, generate_insights_for_users
+
+
+def id_ranges(range_size):
+    """
+    Start ids of the ranges covering all active users. Starts are multiples of
+    ``range_size``, so the same ranges come out of every run.
+    """
+    bounds = User.objects.filter(is_active=True).aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    return list(range(bounds['low'] - bounds['low'] % range_size, bounds['high'] + 1, range_size))
+
+
+def generate_range(start, end, batch_size=500, force=False):
+    """
+    Generate insights for the active users with ``start <= id < end``.
+    Returns ``(start, users, generated)``.
+    """
+    users = generated = 0
+    last_id = start - 1
+    while True:
+        batch = list(
+            User.objects
+            .filter(is_active=True, id__gt=last_id, id__lt=end)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not batch:
+            return start, users, generated
+        users += len(batch)
+        generated += len(generate_insights_for_users(batch, force=force))
+        last_id = batch[-1]
+
+
+def _init_worker():
+    # Processes started with "spawn" import Django afresh
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _run_range(start, end, batch_size, force):
+    try:
+        return generate_range(start, end, batch_size=batch_size, force=force)
+    finally:
+        connections.close_all()
+
+
+class Checkpoint:
+    """
+    The ranges completed in the current period, stored as JSON. A checkpoint
+    from another period or range size is ignored.
+    """
+
+    def __init__(self, path, period, range_size):
+        self.path = path
+        self.period = period
+        self.range_size = range_size
+        self.completed = set()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if data.get('period') == self.period and data.get('range_size') == self.range_size:
+            self.completed = set(data.get('completed', []))
+        return self
+
+    def record(self, start):
+        self.completed.add(start)
+        data = {'period': self.period, 'range_size': self.range_size, 'completed': sorted(self.completed)}
+        # Write then rename, so an interrupted write never loses the checkpoint
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.checkpoint-', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+def generate_all(workers=1, range_size=5000, batch_size=500, force=False, checkpoint_path=None,
+                 resume=False, progress=None):
+    """
+    Generate insights for every active user. With more than one worker the
+    ranges run in a process pool. ``progress`` is called with a dict of
+    running totals after each completed range.
+
+    Returns the final totals: ranges, ranges_done, users, generated, seconds.
+    """
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = Checkpoint(checkpoint_path, current_period(), range_size)
+        if resume:
+            checkpoint.load()
+
+    starts = id_ranges(range_size)
+    pending = [start for start in starts if not checkpoint or start not in checkpoint.completed]
+    totals = {
+        'ranges': len(starts),
+        'ranges_done': len(starts) - len(pending),
+        'users': 0,
+        'generated': 0,
+        'seconds': 0.0,
+    }
+    started = time.perf_counter()
+
+    def completed(start, users, generated):
+        totals['ranges_done'] += 1
+        totals['users'] += users
+        totals['generated'] += generated
+        totals['seconds'] = time.perf_counter() - started
+        if checkpoint:
+            checkpoint.record(start)
+        if progress:
+            progress(dict(totals))
+
+    if workers <= 1:
+        for start in pending:
+            completed(*generate_range(start, start + range_size, batch_size=batch_size, force=force))
+        return totals
+
+    # Connections must not be shared with the forked workers
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = [
+            executor.submit(_run_range, start, start + range_size, batch_size, force)
+            for start in pending
+        ]
+        for future in as_completed(futures):
+            completed(*future.result())
+    return totals
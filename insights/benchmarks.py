@@ -0,0 +1,197 @@
+"""
+Benchmarks of the main views, insight functions and transaction table
+rendering.
+
+Each scenario is run a number of times against a user with a given amount
+of data. Latency percentiles come from the timed runs; the query count from
+the last of them; peak memory from one extra run under ``tracemalloc``
+(kept out of the timed runs because tracing slows Python down).
+"""
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from transactions.caching import INSIGHTS_NAMESPACE, bump_user_version
+from transactions.categories import category_registry
+from transactions.models import Transaction
+from transactions.seeding import ensure_categories, seed_user
+from transactions.templatetags.transaction_tags import transaction_rows
+from .utils import (
+    calculate_spending_prediction,
+    check_overspending_alerts,
+    generate_insights_for_user,
+    generate_investment_recommendation,
+)
+
+
+# Scenario name -> URL name, requested as the benchmark user
+VIEW_SCENARIOS = {
+    'home': 'home',
+    'transactions_list': 'transactions_list',
+    'budgets_list': 'budgets_list',
+    'insights_dashboard': 'insights_dashboard',
+}
+
+# Scenario name -> function called with the benchmark user
+FUNCTION_SCENARIOS = {
+    'calculate_spending_prediction': calculate_spending_prediction,
+    'check_overspending_alerts': check_overspending_alerts,
+    'generate_investment_recommendation': generate_investment_recommendation,
+    'generate_insights_for_user': lambda user: generate_insights_for_user(user, force=True),
+}
+
+# Scenario name -> whether the transactions table rows are rendered by the
+# compiled renderer or the template, over ROWS_PER_RENDER rows
+RENDER_SCENARIOS = {
+    'transaction_rows_template': False,
+    'transaction_rows_compiled': True,
+}
+ROWS_PER_RENDER = 1000
+
+CACHED_AUTH_BACKEND = 'users.backends.CachedModelBackend'
+
+SCENARIOS = tuple(VIEW_SCENARIOS) + tuple(FUNCTION_SCENARIOS) + tuple(RENDER_SCENARIOS)
+
+
+def percentile(samples, q):
+    """Linearly interpolated ``q``-th percentile (0-100) of ``samples``."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def bench_user(size, rng=None, prefix='bench_'):
+    """
+    Return the benchmark user for ``size`` transactions, seeding it first if
+    it has fewer.
+    """
+    user, _ = User.objects.get_or_create(username=f'{prefix}{size}')
+    missing = size - Transaction.objects.filter(user=user).count()
+    if missing > 0:
+        seed_user(user, ensure_categories(), missing, rng=rng)
+    return user
+
+
+def render_sample(user, rows=ROWS_PER_RENDER):
+    """
+    ``rows`` of the user's latest transactions (repeated if there are fewer),
+    with categories attached as on the transactions page.
+    """
+    transactions = list(Transaction.objects.filter(user=user).order_by('-date', '-created_at', '-id')[:rows])
+    category_registry.attach(transactions)
+    if transactions:
+        transactions = (transactions * -(-rows // len(transactions)))[:rows]
+    return transactions
+
+
+def _scenario_callable(name, user, client):
+    if name in VIEW_SCENARIOS:
+        url = reverse(VIEW_SCENARIOS[name])
+
+        def request():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+            return response
+        return request
+    if name in RENDER_SCENARIOS:
+        rows = render_sample(user)
+        return lambda: transaction_rows(rows, compiled=RENDER_SCENARIOS[name])
+    func = FUNCTION_SCENARIOS[name]
+    return lambda: func(user)
+
+
+def measure(func, iterations=20, warmup=2, before=None):
+    """
+    Time ``func`` and return latency percentiles (ms), the query count of
+    the last run and the peak traced memory (KiB) of one extra run.
+    ``before`` is called ahead of every run, outside the timing.
+    """
+    for _ in range(warmup):
+        if before:
+            before()
+        func()
+
+    timings = []
+    queries = 0
+    for _ in range(iterations):
+        if before:
+            before()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = len(captured)
+
+    if before:
+        before()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': queries,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(user, scenarios=SCENARIOS, iterations=20, warmup=2, warm_cache=False,
+                   concurrent_queries=True, session_backend=None, auth_user_cache_timeout=None):
+    """
+    Run ``scenarios`` for ``user`` and return one result dict per scenario.
+    Unless ``warm_cache`` is set, the user's cached page payloads are
+    invalidated before every run so views are measured computing them;
+    with it, payloads are cached even if the cache is not shared (the
+    benchmark runs in one process).
+    ``concurrent_queries=False`` makes async views run their queries one
+    after another, for comparison. ``session_backend`` (a key of
+    ``SESSION_BACKENDS``) and ``auth_user_cache_timeout`` override how
+    sessions and the logged-in user are loaded; a timeout selects the cached
+    authentication backend whether or not the cache is shared.
+    """
+    client = Client()
+
+    def invalidate():
+        bump_user_version(user.id)
+        bump_user_version(user.id, INSIGHTS_NAMESPACE)
+
+    overrides = {'ALLOWED_HOSTS': ['*'], 'ASYNC_CONCURRENT_QUERIES': concurrent_queries}
+    if warm_cache:
+        overrides['CACHE_SHARED'] = True
+    if session_backend is not None:
+        overrides['SESSION_ENGINE'] = settings.SESSION_BACKENDS[session_backend]
+    if auth_user_cache_timeout is not None:
+        overrides['AUTHENTICATION_BACKENDS'] = [CACHED_AUTH_BACKEND]
+        overrides['AUTH_USER_CACHE_TIMEOUT'] = auth_user_cache_timeout
+
+    results = []
+    # The test client's host is not in production ALLOWED_HOSTS
+    with override_settings(**overrides):
+        client.force_login(user)
+        for name in scenarios:
+            stats = measure(
+                _scenario_callable(name, user, client),
+                iterations=iterations,
+                warmup=warmup,
+                before=None if warm_cache else invalidate,
+            )
+            results.append({'scenario': name, **stats})
+    return results
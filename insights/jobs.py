@@ -0,0 +1,168 @@
+"""
+Database-backed job queue for insight generation.
+
+Writes to a user's transactions or budgets enqueue a deduplicated job; the
+``run_insight_worker`` command claims and runs them outside the request path.
+Claiming uses a conditional UPDATE, so it works on SQLite and PostgreSQL
+without an external broker.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from mydjango.metrics import registry as metrics
+from .models import InsightJob
+from .utils import generate_insights_for_user
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_insight_job(user_id):
+    """
+    Queue an insight regeneration for a user.
+    Does nothing if a pending job for the user already exists.
+    """
+    if getattr(settings, 'INSIGHT_JOBS_EAGER', False):
+        from django.contrib.auth.models import User
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            _generate(user)
+        return None
+
+    try:
+        with transaction.atomic():
+            job, _ = InsightJob.objects.get_or_create(user_id=user_id, status='pending')
+    except IntegrityError:
+        # Another writer enqueued the same user concurrently
+        return None
+    return job
+
+
+def enqueue_on_commit(user_id):
+    """
+    Queue an insight regeneration once the current transaction commits.
+    """
+    transaction.on_commit(lambda: enqueue_insight_job(user_id))
+
+
+def claim_jobs(limit):
+    """
+    Claim up to ``limit`` due jobs for this worker.
+    A job is claimed only if this worker's UPDATE moved it out of 'pending'.
+    """
+    now = timezone.now()
+    candidates = (
+        InsightJob.objects
+        .filter(status='pending', run_after__lte=now)
+        .order_by('run_after')
+        .values_list('pk', flat=True)[:limit]
+    )
+    claimed = []
+    for pk in list(candidates):
+        updated = InsightJob.objects.filter(pk=pk, status='pending').update(
+            status='running',
+            attempts=F('attempts') + 1,
+            locked_at=now,
+        )
+        if updated:
+            claimed.append(pk)
+    return list(InsightJob.objects.filter(pk__in=claimed).select_related('user'))
+
+
+def _retry_delay(attempts):
+    base = getattr(settings, 'INSIGHT_JOB_RETRY_BACKOFF', 30)
+    return timedelta(seconds=base * 2 ** max(attempts - 1, 0))
+
+
+def _mark_failed(job, error):
+    max_attempts = getattr(settings, 'INSIGHT_JOB_MAX_ATTEMPTS', 5)
+    job.last_error = error
+    job.locked_at = None
+    if job.attempts >= max_attempts:
+        job.status = 'failed'
+        job.save(update_fields=['status', 'last_error', 'locked_at', 'updated_at'])
+        return
+
+    job.status = 'pending'
+    job.run_after = timezone.now() + _retry_delay(job.attempts)
+    try:
+        with transaction.atomic():
+            job.save(update_fields=['status', 'run_after', 'last_error', 'locked_at', 'updated_at'])
+    except IntegrityError:
+        # A newer pending job for this user already covers the retry
+        job.delete()
+
+
+def _generate(user):
+    """
+    Generate a user's insights, recording the run in the metrics.
+    """
+    started = time.perf_counter()
+    result = 'failed'
+    try:
+        result = 'generated' if generate_insights_for_user(user) else 'skipped'
+        return result
+    finally:
+        metrics.inc('insight_generation_runs_total', {'result': result})
+        metrics.observe('insight_generation_duration_seconds', time.perf_counter() - started)
+
+
+def run_job(job):
+    """
+    Run a claimed job. Successful jobs are removed from the queue, failed ones
+    are retried with exponential backoff until the attempt limit is reached.
+    """
+    try:
+        _generate(job.user)
+    except Exception as exc:
+        logger.exception('Insight job %s for user %s failed', job.pk, job.user_id)
+        _mark_failed(job, f'{type(exc).__name__}: {exc}')
+        return False
+    job.delete()
+    return True
+
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+
+def requeue_stale_jobs():
+    """
+    Return jobs left 'running' by a worker that died back to the queue.
+    """
+    timeout = getattr(settings, 'INSIGHT_JOB_LOCK_TIMEOUT', 600)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    requeued = 0
+    for job in InsightJob.objects.filter(status='running', locked_at__lt=cutoff):
+        _mark_failed(job, 'Worker lock expired')
+        requeued += 1
+    return requeued
+
+
+def process_jobs(limit=None, concurrency=None):
+    """
+    Claim and run a batch of due jobs.
+    Returns a ``(succeeded, failed)`` tuple.
+    """
+    concurrency = concurrency or getattr(settings, 'INSIGHT_WORKER_CONCURRENCY', 1)
+    jobs = claim_jobs(limit or concurrency * 10)
+    if not jobs:
+        return 0, 0
+
+    if concurrency <= 1:
+        results = [run_job(job) for job in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(_run_in_thread, jobs))
+
+    succeeded = sum(1 for result in results if result)
+    return succeeded, len(results) - succeeded
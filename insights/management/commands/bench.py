@@ -0,0 +1,144 @@
+import json
+import platform
+import random
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from insights.benchmarks import CACHED_AUTH_BACKEND, SCENARIOS, bench_user, run_benchmarks
+from mydjango.concurrency import concurrent_queries_enabled
+
+
+def _int_list(value):
+    try:
+        sizes = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise CommandError(f"Invalid size list '{value}'")
+    if not sizes or min(sizes) < 0:
+        raise CommandError(f"Invalid size list '{value}'")
+    return sizes
+
+
+def _compare(size, concurrent, sequential):
+    """Latency of one scenario with concurrent queries relative to sequential ones."""
+    comparison = {'size': size, 'scenario': concurrent['scenario']}
+    for stat in ('p50_ms', 'p95_ms'):
+        comparison[f'concurrent_{stat}'] = concurrent[stat]
+        comparison[f'sequential_{stat}'] = sequential[stat]
+        comparison[f'{stat[:3]}_change_pct'] = (
+            round((concurrent[stat] - sequential[stat]) / sequential[stat] * 100, 1)
+            if sequential[stat] else None
+        )
+    return comparison
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the main views and insight functions and reports latency, queries and memory as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000',
+            help='Comma-separated transaction counts; a bench_<size> user is seeded for each',
+        )
+        parser.add_argument('--iterations', type=int, default=20, help='Timed runs per scenario')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed runs per scenario')
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS),
+            help=f'Comma-separated scenarios (default: all of {", ".join(SCENARIOS)})',
+        )
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Measure views served from the page cache instead of recomputing them',
+        )
+        query_modes = parser.add_mutually_exclusive_group()
+        query_modes.add_argument(
+            '--sequential-queries', action='store_true',
+            help='Run the queries of async views one after another (compare with the default to '
+                 'measure concurrent queries; they are always sequential on SQLite)',
+        )
+        query_modes.add_argument(
+            '--compare-query-modes', action='store_true',
+            help='Run every scenario with concurrent and with sequential queries and report '
+                 'the latency change',
+        )
+        parser.add_argument(
+            '--session-backend', choices=sorted(settings.SESSION_BACKENDS),
+            help='Session storage to measure with (default: the SESSION_BACKEND setting)',
+        )
+        parser.add_argument(
+            '--auth-user-cache', type=int, metavar='SECONDS',
+            help='Seconds the logged-in user is cached, 0 to load it on every request '
+                 '(default: the AUTH_USER_CACHE_TIMEOUT setting)',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for generated data')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        sizes = _int_list(options['sizes'])
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = sorted(set(scenarios) - set(SCENARIOS))
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        rng = random.Random(options['seed'])
+        report = {
+            'meta': {
+                'started_at': timezone.now().isoformat(),
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'warm_cache': options['warm_cache'],
+                'concurrent_queries': (
+                    'compared' if options['compare_query_modes']
+                    else not options['sequential_queries'] and concurrent_queries_enabled()
+                ),
+                'session_backend': options['session_backend'] or settings.SESSION_BACKEND,
+                'auth_user_cache_timeout': (
+                    options['auth_user_cache'] if options['auth_user_cache'] is not None
+                    else settings.AUTH_USER_CACHE_TIMEOUT if CACHED_AUTH_BACKEND in settings.AUTHENTICATION_BACKENDS
+                    else 0
+                ),
+            },
+            'results': [],
+        }
+        if options['compare_query_modes']:
+            query_modes = [True, False]
+            report['comparison'] = []
+        else:
+            query_modes = [not options['sequential_queries']]
+        for size in sizes:
+            self.stderr.write(f'Benchmarking {size} transactions...')
+            user = bench_user(size, rng=rng)
+            by_mode = {}
+            for concurrent in query_modes:
+                by_mode[concurrent] = run_benchmarks(
+                    user, scenarios,
+                    iterations=options['iterations'],
+                    warmup=max(options['warmup'], 0),
+                    warm_cache=options['warm_cache'],
+                    concurrent_queries=concurrent,
+                    session_backend=options['session_backend'],
+                    auth_user_cache_timeout=options['auth_user_cache'],
+                )
+                for result in by_mode[concurrent]:
+                    if options['compare_query_modes']:
+                        result = {**result, 'concurrent_queries': concurrent}
+                    report['results'].append({'size': size, **result})
+            if options['compare_query_modes']:
+                for concurrent, sequential in zip(by_mode[True], by_mode[False]):
+                    report['comparison'].append(_compare(size, concurrent, sequential))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"✅ Benchmark report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,67 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from insights.batch import generate_all
+from mydjango.metrics import registry as metrics
+
+
+class Command(BaseCommand):
+    help = 'Generates insights for all active users, split into id ranges run in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Generate insights for every active user')
+        parser.add_argument(
+            '--workers', type=int,
+            help='Worker processes (default: one per CPU on PostgreSQL, 1 on SQLite)',
+        )
+        parser.add_argument('--range-size', type=int, default=5000, help='User ids per work unit')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users generated per set of queries')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate users whose insights are already current',
+        )
+        parser.add_argument('--checkpoint', help='File recording completed ranges')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help="Skip the ranges recorded in --checkpoint by an earlier run today",
+        )
+
+    def handle(self, *args, **options):
+        if not options['all']:
+            raise CommandError('Pass --all to generate insights for every active user')
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume needs --checkpoint')
+        if options['range_size'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--range-size and --batch-size must be at least 1')
+
+        workers = options['workers']
+        if workers is None:
+            workers = 1 if connection.vendor == 'sqlite' else os.cpu_count() or 1
+        workers = max(workers, 1)
+        self.stdout.write(f'Generating insights with {workers} worker(s)')
+
+        def progress(totals):
+            rate = totals['users'] / totals['seconds'] if totals['seconds'] else 0
+            self.stdout.write(
+                f"[{totals['ranges_done']}/{totals['ranges']}] {totals['users']} users, "
+                f"{totals['generated']} regenerated ({rate:.0f} users/s)"
+            )
+
+        totals = generate_all(
+            workers=workers,
+            range_size=options['range_size'],
+            batch_size=options['batch_size'],
+            force=options['force'],
+            checkpoint_path=options['checkpoint'],
+            resume=options['resume'],
+            progress=progress,
+        )
+        metrics.inc('insight_generation_runs_total', {'result': 'generated'}, totals['generated'])
+        metrics.inc('insight_generation_runs_total', {'result': 'skipped'}, totals['users'] - totals['generated'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Processed {totals['users']} users ({totals['generated']} regenerated) "
+            f"in {totals['seconds']:.1f}s"
+        ))
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from insights.jobs import process_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs queued insight generation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'INSIGHT_WORKER_CONCURRENCY', 1),
+            help='Number of jobs to run in parallel (use 1 on SQLite)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Seconds to wait when the queue is empty',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process the currently due jobs and exit',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        self.stdout.write(f'Insight worker started (concurrency={concurrency})')
+
+        try:
+            while True:
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'⚠️  Requeued {requeued} stale jobs'))
+
+                succeeded, failed = process_jobs(concurrency=concurrency)
+                if succeeded or failed:
+                    self.stdout.write(f'Processed {succeeded + failed} jobs ({failed} failed)')
+
+                if options['once']:
+                    if not (succeeded or failed):
+                        break
+                    continue
+                if not (succeeded or failed):
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Insight worker stopped')
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('insights', '0002_insightjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InsightGenerationState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='insight_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('data_version', models.PositiveBigIntegerField(default=0)),
+                ('period', models.CharField(max_length=10)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
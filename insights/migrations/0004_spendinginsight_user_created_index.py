@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insights', '0003_insightgenerationstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='spendinginsight',
+            index=models.Index(fields=['user', '-created_at'], name='insight_user_created'),
+        ),
+    ]
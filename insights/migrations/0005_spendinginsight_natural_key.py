@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insights', '0004_spendinginsight_user_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spendinginsight',
+            name='period',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='spendinginsight',
+            name='subject_key',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='spendinginsight',
+            constraint=models.UniqueConstraint(fields=('user', 'insight_type', 'subject_key', 'period'), name='unique_insight_subject_period'),
+        ),
+    ]
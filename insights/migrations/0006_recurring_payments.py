@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('insights', '0005_spendinginsight_natural_key'),
+        ('transactions', '0007_transaction_user_updated_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringDetectionState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recurring_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('scanned_at', models.DateTimeField()),
+                ('expense_count', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='spendinginsight',
+            name='insight_type',
+            field=models.CharField(choices=[('prediction', 'Spending Prediction'), ('alert', 'Overspending Alert'), ('recommendation', 'Investment Recommendation'), ('recurring', 'Recurring Payment'), ('tip', 'Financial Tip')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='RecurringPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('note_key', models.CharField(blank=True, max_length=100)),
+                ('label', models.CharField(max_length=255)),
+                ('period', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], max_length=7)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('occurrences', models.PositiveIntegerField()),
+                ('last_date', models.DateField()),
+                ('next_date', models.DateField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_payments', to='transactions.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_payments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'category', 'note_key'), name='unique_recurring_payment')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insights', '0006_recurring_payments'),
+        ('transactions', '0007_transaction_user_updated_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='spendinginsight',
+            name='insight_type',
+            field=models.CharField(choices=[('prediction', 'Spending Prediction'), ('alert', 'Overspending Alert'), ('recommendation', 'Investment Recommendation'), ('recurring', 'Recurring Payment'), ('anomaly', 'Unusual Expense'), ('tip', 'Financial Tip')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='CategorySpendingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0.0)),
+                ('m2', models.FloatField(default=0.0)),
+                ('sketch', models.JSONField(default=dict)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_stats', to='transactions.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='unique_category_spending_stats')],
+            },
+        ),
+    ]
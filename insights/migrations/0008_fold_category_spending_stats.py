@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insights', '0007_category_spending_stats'),
+        # Spreads are recomputed into UserCategoryStats from the raw transactions
+        ('transactions', '0011_user_category_stats_spread'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='CategorySpendingStats',
+        ),
+    ]
@@ -1,20 +1,35 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class SpendingInsight(models.Model):
     """
     Stores insights about user spending patterns and predictions.
+    
+    Generated insights (predictions, alerts, recommendations, recurring
+    payments) are identified by user, type, ``subject_key`` (what they are
+    about, e.g. a budget) and ``period``, and are updated in place when
+    regenerated. Insights without a subject key are never deduplicated.
+    Unusual expense alerts are raised when a transaction is saved (see
+    anomalies.py) and are left alone by regeneration.
     """
+    GENERATED_TYPES = ('prediction', 'alert', 'recommendation', 'recurring')
+    
     INSIGHT_TYPE_CHOICES = [
         ('prediction', 'Spending Prediction'),
         ('alert', 'Overspending Alert'),
         ('recommendation', 'Investment Recommendation'),
+        ('recurring', 'Recurring Payment'),
+        ('anomaly', 'Unusual Expense'),
         ('tip', 'Financial Tip'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     insight_type = models.CharField(max_length=20, choices=INSIGHT_TYPE_CHOICES)
     title = models.CharField(max_length=200)
+    # NULL for insights that are not generated: NULLs never collide in the unique constraint
+    subject_key = models.CharField(max_length=50, null=True, blank=True)
+    period = models.CharField(max_length=10, blank=True, default='')
     message = models.TextField()
     amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -22,6 +37,116 @@ class SpendingInsight(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's insights newest first (dashboard) and by age (clean-up).
+            # is_read is not indexed: SQLite cannot match ``NOT is_read`` to it.
+            models.Index(fields=['user', '-created_at'], name='insight_user_created'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'insight_type', 'subject_key', 'period'],
+                name='unique_insight_subject_period',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.get_insight_type_display()} for {self.user.username}"
+
+
+class InsightJob(models.Model):
+    """
+    A queued request to regenerate a user's insights.
+    Consumed by the ``run_insight_worker`` management command.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='insight_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='insight_job_status_run_after'),
+        ]
+        constraints = [
+            # At most one pending job per user, so repeated writes collapse into one run
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_insight_job',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Insight job for {self.user.username} ({self.status})"
+
+
+class InsightGenerationState(models.Model):
+    """
+    Records which data version and calendar period a user's stored insights
+    were generated for, so unchanged users can be skipped.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='insight_state')
+    data_version = models.PositiveBigIntegerField(default=0)
+    period = models.CharField(max_length=10)
+    generated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Insights for {self.user.username} at version {self.data_version} ({self.period})"
+
+
+class RecurringPayment(models.Model):
+    """
+    An expense repeating on a weekly, monthly or yearly schedule, detected
+    from a user's transactions with the same category and note (see
+    recurring.py).
+    """
+    PERIOD_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('yearly', 'Yearly'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_payments')
+    category = models.ForeignKey('transactions.Category', on_delete=models.CASCADE, related_name='recurring_payments')
+    # Normalized note the transactions are grouped by; blank groups a category's notes-less expenses
+    note_key = models.CharField(max_length=100, blank=True)
+    label = models.CharField(max_length=255)
+    period = models.CharField(max_length=7, choices=PERIOD_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    occurrences = models.PositiveIntegerField()
+    last_date = models.DateField()
+    next_date = models.DateField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'note_key'], name='unique_recurring_payment'),
+        ]
+    
+    def __str__(self):
+        return f"{self.label} ({self.period}) for {self.user.username}"
+
+
+class RecurringDetectionState(models.Model):
+    """
+    When a user's expenses were last scanned for recurring payments and how
+    many there were, so the next scan can look at new expenses only.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='recurring_state')
+    scanned_at = models.DateTimeField()
+    expense_count = models.PositiveIntegerField()
+    
+    def __str__(self):
+        return f"Recurring scan of {self.user.username} at {self.scanned_at}"
@@ -0,0 +1,246 @@
+"""
+Detection of recurring payments (subscriptions, bills) in expense history.
+
+A user's expenses are grouped by category and normalized note. The rows of
+every group are sorted by date in one NumPy sort, so the gaps between
+consecutive payments of all groups are a single ``diff``. A group is
+recurring when most of its gaps are close to a week, a month or a year and
+its amounts are steady. No pair of transactions is ever compared, so the
+cost grows with the number of rows, not its square.
+
+Detection is incremental. RecurringDetectionState records when a user was
+last scanned and how many expenses they had then:
+
+* if expenses were only added since, just the groups of the new expenses are
+  read and detected again;
+* if any were edited or deleted (an older row changed, or the count does not
+  add up), all of the user's expenses are scanned again.
+
+Results are upserted into RecurringPayment by (user, category, note), so a
+payment keeps its id, and its insight, across scans.
+"""
+import re
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from transactions.categories import category_registry
+from transactions.models import Transaction, UserCategoryStats
+from .models import RecurringDetectionState, RecurringPayment
+
+
+# period: (length in days, tolerance in days, minimum occurrences)
+PERIODS = {
+    'weekly': (7.0, 1.0, 4),
+    'monthly': (30.44, 3.0, 3),
+    'yearly': (365.25, 10.0, 2),
+}
+PERIOD_NAMES = list(PERIODS)
+# Share of a group's gaps that must match the period
+MIN_REGULARITY = 0.75
+# Largest standard deviation of a group's amounts, relative to their mean
+MAX_AMOUNT_SPREAD = 0.35
+# A payment lapses when it is this many tolerances overdue
+LAPSE_TOLERANCES = 2
+
+_NON_LETTERS = re.compile(r'[^a-z]+')
+
+
+@lru_cache(maxsize=4096)
+def normalize_note(note):
+    """
+    Grouping key of a note: lower-cased letters only, so "Netflix #4411" and
+    "NETFLIX" match.
+    """
+    return _NON_LETTERS.sub(' ', note.lower()).strip()[:100]
+
+
+def find_periodic_groups(groups, days, amounts):
+    """
+    Detect which groups of rows repeat on a schedule.
+
+    ``groups`` holds each row's group number (every number from 0 to
+    ``groups.max()`` used), ``days`` its date as an ordinal and ``amounts``
+    its amount. Returns ``(period, last_row, next_day, occurrences)`` arrays
+    with one entry per group: ``period`` indexes ``PERIOD_NAMES`` (-1 when
+    not recurring), ``last_row`` is the row of the group's latest payment
+    and ``next_day`` the ordinal its next payment is expected on.
+    """
+    order = np.lexsort((days, groups))
+    groups, days, amounts = groups[order], days[order], amounts[order]
+    size = int(groups[-1]) + 1
+    occurrences = np.bincount(groups, minlength=size)
+    last = np.flatnonzero(np.r_[groups[1:] != groups[:-1], True])
+
+    same_group = groups[1:] == groups[:-1]
+    gaps = np.diff(days)[same_group].astype(float)
+    gap_groups = groups[1:][same_group]
+    gap_counts = np.maximum(occurrences - 1, 1)
+
+    mean_amount = np.bincount(groups, amounts, size) / occurrences
+    variance = np.bincount(groups, amounts ** 2, size) / occurrences - mean_amount ** 2
+    spread = np.sqrt(np.maximum(variance, 0.0)) / np.maximum(mean_amount, 0.01)
+
+    regularity = np.zeros((len(PERIODS), size))
+    mean_gap = np.zeros((len(PERIODS), size))
+    for i, (length, tolerance, minimum) in enumerate(PERIODS.values()):
+        hits = np.abs(gaps - length) <= tolerance
+        hit_counts = np.bincount(gap_groups, hits, size)
+        regularity[i] = np.where(occurrences >= minimum, hit_counts / gap_counts, 0.0)
+        mean_gap[i] = np.where(
+            hit_counts > 0, np.bincount(gap_groups, gaps * hits, size) / np.maximum(hit_counts, 1), length
+        )
+
+    columns = np.arange(size)
+    best = regularity.argmax(axis=0)
+    recurring = (regularity[best, columns] >= MIN_REGULARITY) & (spread <= MAX_AMOUNT_SPREAD)
+    next_day = days[last] + np.rint(mean_gap[best, columns]).astype(int)
+    return np.where(recurring, best, -1), order[last], next_day, occurrences
+
+
+def is_active(payment, today=None):
+    """Whether a payment is still being made (its next one is not long overdue)."""
+    today = today or date.today()
+    tolerance = PERIODS[payment.period][1]
+    return (today - payment.next_date).days <= LAPSE_TOLERANCES * tolerance
+
+
+def _scan_plan(user_ids, scanned_at):
+    """
+    Decide which users need a full scan and which groups of the others
+    changed. Returns ``(full_users, touched, counts)``: ``touched`` maps a
+    user to the ``(category_id, note_key)`` groups to detect again and
+    ``counts`` holds the expense counts of the users scanned before.
+    """
+    states = {state.user_id: state for state in RecurringDetectionState.objects.filter(user_id__in=user_ids)}
+    full_users = {user_id for user_id in user_ids if user_id not in states}
+    if not states:
+        return full_users, {}, {}
+
+    counts = dict(
+        UserCategoryStats.objects
+        .filter(user_id__in=list(states), type='expense')
+        .values('user_id').annotate(count=Sum('count')).order_by()
+        .values_list('user_id', 'count')
+    )
+    # Users scanned in the same batch share a watermark, so this stays a few terms
+    watermarks = {}
+    for user_id, state in states.items():
+        watermarks.setdefault(state.scanned_at, []).append(user_id)
+    changed = Transaction.objects.filter(
+        Q(*[Q(user_id__in=ids, updated_at__gt=watermark) for watermark, ids in watermarks.items()],
+          _connector=Q.OR),
+        updated_at__lte=scanned_at,
+    ).values_list('user_id', 'category_id', 'type', 'note', 'created_at')
+
+    touched = {user_id: set() for user_id in states}
+    added = dict.fromkeys(states, 0)
+    for user_id, category_id, type_, note, created_at in changed:
+        if created_at <= states[user_id].scanned_at:
+            # An expense seen by the last scan was edited: its old group is unknown
+            full_users.add(user_id)
+        elif type_ == 'expense':
+            touched[user_id].add((category_id, normalize_note(note)))
+            added[user_id] += 1
+    for user_id, state in states.items():
+        if counts.get(user_id, 0) != state.expense_count + added[user_id]:
+            # Expenses were deleted, or written while the last scan ran
+            full_users.add(user_id)
+    touched = {user_id: groups for user_id, groups in touched.items() if groups and user_id not in full_users}
+    return full_users, touched, counts
+
+
+def detect_recurring_payments(user_ids, today=None):
+    """
+    Update the recurring payments of ``user_ids`` (see above) and return
+    ``{user_id: [active RecurringPayment, ...]}``, highest monthly cost first.
+    """
+    user_ids = list(user_ids)
+    today = today or date.today()
+    scanned_at = timezone.now()
+    full_users, touched, counts = _scan_plan(user_ids, scanned_at)
+
+    expense_counts = {**counts, **dict.fromkeys(full_users, 0)}
+    payments = []
+    if full_users or touched:
+        # Touched groups are narrowed down to their notes below
+        scope = Q(user_id__in=full_users) | Q(
+            user_id__in=list(touched),
+            category_id__in={category_id for groups in touched.values() for category_id, _ in groups},
+        )
+        rows = (
+            Transaction.objects
+            .filter(scope, type='expense', created_at__lte=scanned_at)
+            .values_list('user_id', 'category_id', 'note', 'date', 'amount')
+        )
+        keys = {}
+        group_numbers, days, amounts, notes = [], [], [], []
+        for user_id, category_id, note, day, amount in rows:
+            key = (user_id, category_id, normalize_note(note))
+            if user_id in full_users:
+                expense_counts[user_id] += 1
+            elif key[1:] not in touched[user_id]:
+                continue
+            group_numbers.append(keys.setdefault(key, len(keys)))
+            days.append(day.toordinal())
+            amounts.append(float(amount))
+            notes.append((note, amount))
+
+        if group_numbers:
+            period, last_row, next_day, occurrences = find_periodic_groups(
+                np.array(group_numbers), np.array(days), np.array(amounts)
+            )
+            for (user_id, category_id, note_key), number in keys.items():
+                if period[number] < 0:
+                    continue
+                note, amount = notes[last_row[number]]
+                category = category_registry.get(category_id)
+                payments.append(RecurringPayment(
+                    user_id=user_id, category_id=category_id, note_key=note_key,
+                    label=note or (category.name if category else ''),
+                    period=PERIOD_NAMES[period[number]], amount=amount,
+                    occurrences=int(occurrences[number]),
+                    last_date=date.fromordinal(days[last_row[number]]),
+                    next_date=date.fromordinal(int(next_day[number])),
+                ))
+
+    with transaction.atomic():
+        RecurringPayment.objects.bulk_create(
+            payments,
+            update_conflicts=True,
+            unique_fields=['user', 'category', 'note_key'],
+            update_fields=['label', 'period', 'amount', 'occurrences', 'last_date', 'next_date'],
+        )
+        # Groups detected again that are no longer recurring and, for full
+        # scans, groups that no longer exist
+        previous = (
+            RecurringPayment.objects
+            .filter(user_id__in=list(full_users) + list(touched))
+            .exclude(pk__in=[payment.pk for payment in payments])
+            .values_list('pk', 'user_id', 'category_id', 'note_key')
+        )
+        RecurringPayment.objects.filter(pk__in=[
+            pk for pk, user_id, category_id, note_key in previous
+            if user_id in full_users or (category_id, note_key) in touched[user_id]
+        ]).delete()
+        RecurringDetectionState.objects.bulk_create(
+            [
+                RecurringDetectionState(user_id=user_id, scanned_at=scanned_at, expense_count=count)
+                for user_id, count in expense_counts.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['scanned_at', 'expense_count'],
+        )
+
+    found = {user_id: [] for user_id in user_ids}
+    for payment in RecurringPayment.objects.filter(user_id__in=user_ids):
+        if is_active(payment, today):
+            found[payment.user_id].append(payment)
+    for user_payments in found.values():
+        user_payments.sort(key=lambda payment: float(payment.amount) / PERIODS[payment.period][0], reverse=True)
+    return found
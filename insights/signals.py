@@ -0,0 +1,46 @@
+"""
+Signal handlers that queue insight regeneration when a user's data changes,
+raise unusual expense alerts and invalidate cached insight pages when
+insights change.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from transactions.caching import INSIGHTS_NAMESPACE, bump_user_version
+from transactions.models import Budget, Transaction
+from transactions.signals import transaction_changed, transactions_bulk_changed
+from . import anomalies
+from .jobs import enqueue_on_commit
+from .models import SpendingInsight
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Budget)
+def user_data_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    enqueue_on_commit(instance.user_id)
+
+
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Budget)
+def user_data_deleted(sender, instance, **kwargs):
+    enqueue_on_commit(instance.user_id)
+
+
+@receiver(transactions_bulk_changed)
+def user_data_bulk_changed(sender, user_id, **kwargs):
+    enqueue_on_commit(user_id)
+
+
+@receiver(transaction_changed)
+def transaction_stats_changed(sender, instance, old_state, new_state, stats=None, **kwargs):
+    anomalies.record_change(instance.pk, old_state, new_state, stats)
+
+
+@receiver(post_save, sender=SpendingInsight)
+@receiver(post_delete, sender=SpendingInsight)
+def insight_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_user_version(instance.user_id, INSIGHTS_NAMESPACE)
@@ -1,16 +1,30 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.core.management import CommandError, call_command
 from django.urls import reverse
+from django.utils import timezone
 from decimal import Decimal
-from datetime import datetime, timedelta
-from .models import SpendingInsight
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from .forecasting import forecast_spending, next_month
+from .batch import generate_all
+from .jobs import enqueue_insight_job, process_jobs
+from .models import SpendingInsight, InsightGenerationState, InsightJob
 from .utils import (
     calculate_spending_prediction,
     check_overspending_alerts,
     generate_investment_recommendation,
-    generate_insights_for_user
+    generate_insights_for_user,
+    generate_insights_for_users,
 )
-from transactions.models import Transaction, Category, Budget
+from transactions.categories import category_registry
+from transactions.models import Transaction, Category, Budget, TransactionDailyRollup
+from transactions.tests import QueryPlanAssertions
 
 
 class SpendingInsightModelTest(TestCase):
@@ -152,10 +166,89 @@ class InsightsUtilsTest(TestCase):
         self.assertEqual(recommendation['balance'], 1500.00)
 
 
+class SpendingForecastTest(TestCase):
+    """Test the vectorized spending forecasts."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.rent = Category.objects.create(name='Rent', type='expense')
+        self.today = date(2026, 3, 10)
+    
+    def add_daily(self, user, category, days, amount):
+        """Rollup rows for the ``days`` days up to today, ``amount(day)`` each."""
+        TransactionDailyRollup.objects.bulk_create([
+            TransactionDailyRollup(
+                user=user, category=category, type='expense', day=day,
+                total=Decimal(str(amount(day))), count=1,
+            )
+            for day in (self.today - timedelta(days=i) for i in range(days))
+        ])
+    
+    def test_constant_spending(self):
+        """A constant daily amount is forecast exactly, with a zero-width interval."""
+        self.add_daily(self.user, self.food, 120, lambda day: 10)
+        forecast = forecast_spending([self.user.id], today=self.today)[self.user.id]
+        # April has 30 days
+        self.assertEqual(forecast['total'], {'amount': 300.0, 'lower': 300.0, 'upper': 300.0})
+        self.assertEqual(forecast['categories'][self.food.id]['amount'], 300.0)
+        self.assertEqual(forecast['monthly_average'], 300.0)
+    
+    def test_weekday_pattern(self):
+        """Weekend-heavy spending is projected onto the weekends of next month."""
+        self.add_daily(self.user, self.food, 180, lambda day: 50 if day.weekday() >= 5 else 10)
+        forecast = forecast_spending([self.user.id], today=self.today)[self.user.id]
+        first, last = next_month(self.today)
+        expected = sum(
+            50 if (first + timedelta(days=i)).weekday() >= 5 else 10
+            for i in range((last - first).days + 1)
+        )
+        self.assertAlmostEqual(forecast['total']['amount'], expected, delta=1)
+    
+    def test_categories_and_interval(self):
+        """Each category gets its own forecast; noisy totals get a wider interval."""
+        self.add_daily(self.user, self.food, 200, lambda day: 5 + (day.toordinal() * 7919) % 30)
+        self.add_daily(self.user, self.rent, 200, lambda day: 20)
+        forecast = forecast_spending([self.user.id], today=self.today)[self.user.id]
+        total = forecast['total']
+        self.assertEqual(set(forecast['categories']), {self.food.id, self.rent.id})
+        self.assertAlmostEqual(forecast['categories'][self.rent.id]['amount'], 600, delta=0.01)
+        self.assertLess(total['lower'], total['amount'])
+        self.assertGreater(total['upper'], total['amount'])
+        self.assertAlmostEqual(
+            total['amount'],
+            sum(category['amount'] for category in forecast['categories'].values()),
+            delta=total['amount'] * 0.05,
+        )
+    
+    def test_batch_matches_single_user(self):
+        """Forecasting users together gives the same results as one at a time."""
+        other = User.objects.create_user(username='other', password='testpass123')
+        empty = User.objects.create_user(username='empty', password='testpass123')
+        self.add_daily(self.user, self.food, 90, lambda day: 10 + day.day % 4)
+        self.add_daily(other, self.rent, 400, lambda day: 30 if day.day == 1 else 2)
+        
+        with self.assertNumQueries(1):
+            batch = forecast_spending([self.user.id, other.id, empty.id], today=self.today)
+        self.assertIsNone(batch[empty.id])
+        for user in (self.user, other):
+            self.assertEqual(batch[user.id], forecast_spending([user.id], today=self.today)[user.id])
+    
+    def test_prediction_uses_forecast(self):
+        self.add_daily(self.user, self.food, 60, lambda day: 10)
+        with patch('insights.forecasting.date') as mock_date:
+            mock_date.today.return_value = self.today
+            prediction = calculate_spending_prediction(self.user)
+        self.assertEqual(prediction['amount'], 300.0)
+        self.assertEqual(prediction['confidence'], 'high')
+        self.assertEqual(prediction['categories'][self.food.id]['amount'], 300.0)
+
+
 class InsightsViewsTest(TestCase):
     """Test the insights views."""
     
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpass123')
         self.client.login(username='testuser', password='testpass123')
@@ -190,7 +283,27 @@ class InsightsViewsTest(TestCase):
         
         insight.refresh_from_db()
         self.assertTrue(insight.is_read)
-    
+
+    def test_dashboard_cache_invalidated_by_insight_changes(self):
+        """Test that the cached dashboard follows insight writes."""
+        insight = SpendingInsight.objects.create(
+            user=self.user,
+            insight_type='tip',
+            title='Test Tip',
+            message='Test message'
+        )
+        response = self.client.get(reverse('insights_dashboard'))
+        self.assertEqual(response.context['unread_count'], 1)
+        self.assertEqual(response.context['tips'], [insight])
+
+        self.client.get(reverse('mark_insight_read', args=[insight.pk]))
+        response = self.client.get(reverse('insights_dashboard'))
+        self.assertEqual(response.context['unread_count'], 0)
+
+        self.client.get(reverse('delete_insight', args=[insight.pk]))
+        response = self.client.get(reverse('insights_dashboard'))
+        self.assertEqual(response.context['total_insights'], 0)
+
     def test_delete_insight(self):
         """Test deleting an insight."""
         insight = SpendingInsight.objects.create(
@@ -219,3 +332,641 @@ class InsightsViewsTest(TestCase):
         # Try to mark other user's insight as read
         response = self.client.get(reverse('mark_insight_read', args=[insight.pk]))
         self.assertEqual(response.status_code, 404)  # Not found
+
+
+class OverspendingAlertsQueryTest(TestCase):
+    """Test that alert generation cost does not grow with the number of budgets."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+    
+    def _add_budgets(self, count):
+        for i in range(count):
+            category = Category.objects.create(name=f'Category {i}', type='expense')
+            Budget.objects.create(user=self.user, category=category,
+                                  limit_amount=Decimal('100.00'), period='monthly')
+            Transaction.objects.create(user=self.user, category=category, amount=Decimal('95.00'),
+                                       type='expense', date=datetime.now())
+    
+    def test_alert_query_count_is_constant(self):
+        # Categories come from the in-process registry, loaded outside the
+        # measured block; only its version is read (no shared cache)
+        self._add_budgets(2)
+        category_registry.all()
+        with self.assertNumQueries(3):
+            self.assertEqual(len(check_overspending_alerts(self.user)), 2)
+        
+        self._add_budgets(8)
+        category_registry.all()
+        with self.assertNumQueries(3):
+            self.assertEqual(len(check_overspending_alerts(self.user)), 10)
+
+
+class InsightJobQueueTest(TestCase):
+    """Test the insight job queue and worker."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Food', type='expense')
+    
+    def _add_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Transaction.objects.create(
+                user=self.user,
+                category=self.category,
+                amount=Decimal('95.00'),
+                type='expense',
+                date=datetime.now()
+            )
+    
+    def test_transaction_writes_enqueue_one_job(self):
+        """Test that repeated writes collapse into a single pending job."""
+        transaction = self._add_transaction()
+        self._add_transaction()
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.delete()
+        self.assertEqual(InsightJob.objects.filter(user=self.user, status='pending').count(), 1)
+    
+    def test_worker_generates_insights_and_clears_job(self):
+        Budget.objects.create(user=self.user, category=self.category,
+                              limit_amount=Decimal('100.00'), period='monthly')
+        self._add_transaction()
+        
+        call_command('run_insight_worker', '--once', stdout=StringIO())
+        
+        self.assertFalse(InsightJob.objects.exists())
+        self.assertTrue(SpendingInsight.objects.filter(user=self.user, insight_type='alert').exists())
+    
+    @override_settings(INSIGHT_JOB_MAX_ATTEMPTS=2, INSIGHT_JOB_RETRY_BACKOFF=60)
+    def test_failed_jobs_are_retried_with_backoff(self):
+        enqueue_insight_job(self.user.id)
+        
+        with patch('insights.jobs.generate_insights_for_user', side_effect=RuntimeError('boom')):
+            self.assertEqual(process_jobs(), (0, 1))
+            job = InsightJob.objects.get(user=self.user)
+            self.assertEqual(job.status, 'pending')
+            self.assertEqual(job.attempts, 1)
+            self.assertIn('boom', job.last_error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+            
+            # Not due yet
+            self.assertEqual(process_jobs(), (0, 0))
+            
+            InsightJob.objects.update(run_after=timezone.now())
+            process_jobs()
+        
+        job = InsightJob.objects.get(user=self.user)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+    
+    def test_dashboard_does_not_generate_insights(self):
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        self._add_transaction()
+        
+        with patch('insights.jobs.generate_insights_for_user') as generate:
+            response = client.get(reverse('insights_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        generate.assert_not_called()
+
+    def test_dashboard_queues_users_without_insights_once(self):
+        """Test that a generation producing no insights is not queued again on each visit."""
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+
+        client.get(reverse('insights_dashboard'))
+        self.assertEqual(InsightJob.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(process_jobs(), (1, 0))
+        self.assertFalse(SpendingInsight.objects.filter(user=self.user).exists())
+
+        client.get(reverse('insights_dashboard'))
+        self.assertFalse(InsightJob.objects.exists())
+
+        # New data makes the user due again
+        Transaction.objects.create(user=self.user, category=self.category, amount=Decimal('5.00'),
+                                   type='expense', date=datetime.now())
+        InsightJob.objects.all().delete()
+        client.get(reverse('insights_dashboard'))
+        self.assertEqual(InsightJob.objects.filter(user=self.user).count(), 1)
+
+    def test_dashboard_queues_users_with_insights_of_an_earlier_day(self):
+        """Test that existing insights are regenerated once their period has passed."""
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        Budget.objects.create(user=self.user, category=self.category,
+                              limit_amount=Decimal('100.00'), period='monthly')
+        self._add_transaction()
+        InsightJob.objects.all().delete()
+        generate_insights_for_user(self.user)
+        self.assertTrue(SpendingInsight.objects.filter(user=self.user).exists())
+
+        client.get(reverse('insights_dashboard'))
+        self.assertFalse(InsightJob.objects.exists())
+
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        InsightGenerationState.objects.filter(user=self.user).update(period=yesterday)
+        client.get(reverse('insights_dashboard'))
+        self.assertEqual(InsightJob.objects.filter(user=self.user).count(), 1)
+
+
+class InsightGenerationMetricsTest(TestCase):
+    """Test that insight generation runs are counted."""
+    
+    def test_runs_counted_by_result(self):
+        from mydjango.metrics import registry
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        
+        def runs(result):
+            return registry.snapshot()['counters'].get(('insight_generation_runs_total', (('result', result),)), 0)
+        generated, skipped = runs('generated'), runs('skipped')
+        
+        enqueue_insight_job(user.id)
+        process_jobs()
+        enqueue_insight_job(user.id)
+        process_jobs()
+        self.assertEqual(runs('generated'), generated + 1)
+        self.assertEqual(runs('skipped'), skipped + 1)
+
+
+class InsightDirtyTrackingTest(TestCase):
+    """Test that insight generation is skipped for unchanged users."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Food', type='expense')
+    
+    def test_unchanged_user_is_skipped_with_one_query(self):
+        self.assertTrue(generate_insights_for_user(self.user))
+        with self.assertNumQueries(1):
+            self.assertFalse(generate_insights_for_user(self.user))
+    
+    def test_writes_mark_insights_stale(self):
+        generate_insights_for_user(self.user)
+        transaction = Transaction.objects.create(user=self.user, category=self.category,
+                                                 amount=Decimal('10.00'), type='expense', date=datetime.now())
+        self.assertTrue(generate_insights_for_user(self.user))
+        self.assertFalse(generate_insights_for_user(self.user))
+        
+        budget = Budget.objects.create(user=self.user, category=self.category,
+                                       limit_amount=Decimal('100.00'), period='weekly')
+        self.assertTrue(generate_insights_for_user(self.user))
+        
+        budget.delete()
+        self.assertTrue(generate_insights_for_user(self.user))
+        transaction.delete()
+        self.assertTrue(generate_insights_for_user(self.user))
+    
+    def test_new_period_regenerates(self):
+        generate_insights_for_user(self.user)
+        with patch('insights.utils.current_period', return_value='2999-01-01'):
+            self.assertTrue(generate_insights_for_user(self.user))
+    
+    def test_force_regenerates(self):
+        generate_insights_for_user(self.user)
+        self.assertTrue(generate_insights_for_user(self.user, force=True))
+    
+    def test_user_deletion_is_not_blocked(self):
+        Transaction.objects.create(user=self.user, category=self.category,
+                                   amount=Decimal('10.00'), type='expense', date=datetime.now())
+        generate_insights_for_user(self.user)
+        self.user.delete()
+        self.assertFalse(User.objects.filter(username='testuser').exists())
+
+
+class InsightUpsertTest(TestCase):
+    """Test that regenerated insights are updated in place."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Food', type='expense')
+        self.budget = Budget.objects.create(user=self.user, category=self.category,
+                                            limit_amount=Decimal('100.00'), period='monthly')
+    
+    def spend(self, amount):
+        Transaction.objects.create(user=self.user, category=self.category, amount=Decimal(amount),
+                                   type='expense', date=datetime.now())
+    
+    def test_alert_is_updated_in_place(self):
+        self.spend('95.00')
+        generate_insights_for_user(self.user)
+        alert = SpendingInsight.objects.get(user=self.user, insight_type='alert')
+        self.assertTrue(alert.title.startswith('WARNING'))
+        self.assertEqual(alert.subject_key, f'budget:{self.budget.pk}')
+        self.assertEqual(alert.period, date.today().strftime('%Y-%m'))
+        alert.is_read = True
+        alert.save()
+        
+        self.spend('10.00')
+        generate_insights_for_user(self.user)
+        updated = SpendingInsight.objects.get(user=self.user, insight_type='alert')
+        self.assertEqual(updated.pk, alert.pk)
+        self.assertTrue(updated.title.startswith('CRITICAL'))
+        self.assertEqual(updated.amount, Decimal('105.00'))
+        self.assertTrue(updated.is_read)
+    
+    def test_stale_insights_are_deleted(self):
+        self.spend('95.00')
+        generate_insights_for_user(self.user)
+        tip = SpendingInsight.objects.create(user=self.user, insight_type='tip', title='Tip', message='Save')
+        legacy = SpendingInsight.objects.create(user=self.user, insight_type='alert', title='Old', message='Old')
+        
+        self.budget.delete()
+        generate_insights_for_user(self.user)
+        self.assertFalse(SpendingInsight.objects.filter(insight_type='alert').exists())
+        self.assertFalse(SpendingInsight.objects.filter(pk=legacy.pk).exists())
+        self.assertTrue(SpendingInsight.objects.filter(pk=tip.pk).exists())
+    
+    def test_natural_key_is_unique(self):
+        from django.db import IntegrityError
+        fields = dict(user=self.user, insight_type='alert', subject_key='budget:1', period='2026-01')
+        SpendingInsight.objects.create(title='A', message='A', **fields)
+        with self.assertRaises(IntegrityError):
+            SpendingInsight.objects.create(title='B', message='B', **fields)
+
+
+class BatchInsightGenerationTest(TestCase):
+    """Test generating insights for many users at once."""
+    
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Food', type='expense')
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='testpass123') for i in range(6)
+        ]
+        for user in self.users:
+            Budget.objects.create(user=user, category=self.category, limit_amount=Decimal('50.00'), period='monthly')
+            for i in range(6):
+                Transaction.objects.create(user=user, category=self.category, amount=Decimal('20.00'),
+                                           type='expense', date=datetime.now() - timedelta(days=i))
+        category_registry.all()
+    
+    def test_query_count_independent_of_batch_size(self):
+        ids = [user.id for user in self.users]
+        # Including one read of the categories version (no shared cache)
+        with self.assertNumQueries(17):
+            self.assertEqual(generate_insights_for_users(ids[:2]), ids[:2])
+        with self.assertNumQueries(17):
+            self.assertEqual(generate_insights_for_users(ids[2:]), ids[2:])
+        for user in self.users:
+            self.assertEqual(
+                set(SpendingInsight.objects.filter(user=user).values_list('insight_type', flat=True)),
+                {'prediction', 'alert'},
+            )
+        # Current users are skipped with one query
+        with self.assertNumQueries(1):
+            self.assertEqual(generate_insights_for_users(ids), [])
+    
+    def test_batch_matches_single_user_generation(self):
+        generate_insights_for_users([self.users[0].id])
+        generate_insights_for_user(self.users[1])
+        
+        def stored(user):
+            return sorted(SpendingInsight.objects.filter(user=user).values_list('insight_type', 'message', 'amount'))
+        self.assertEqual(stored(self.users[0]), stored(self.users[1]))
+    
+    def test_generate_all_resumes_from_checkpoint(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/checkpoint.json'
+            totals = generate_all(range_size=2, checkpoint_path=path)
+            self.assertEqual(totals['users'], 6)
+            self.assertEqual(totals['generated'], 6)
+            
+            # Nothing is left to do for a resumed run, even when forced
+            totals = generate_all(range_size=2, checkpoint_path=path, resume=True, force=True)
+            self.assertEqual(totals['ranges_done'], totals['ranges'])
+            self.assertEqual(totals['users'], 0)
+            
+            # A fresh run skips the users whose insights are current
+            totals = generate_all(range_size=2, checkpoint_path=path)
+            self.assertEqual((totals['users'], totals['generated']), (6, 0))
+    
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_insights', '--all', '--workers', '1', stdout=out)
+        self.assertIn('Processed 6 users (6 regenerated)', out.getvalue())
+        self.assertEqual(InsightGenerationState.objects.count(), 6)
+        
+        with self.assertRaises(CommandError):
+            call_command('generate_insights', stdout=StringIO())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class InsightsQueryPlanTest(QueryPlanAssertions, TestCase):
+    """Test that insight reads and generation never scan whole tables."""
+    
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Food', type='expense')
+        Budget.objects.create(user=self.user, category=self.category,
+                              limit_amount=Decimal('100.00'), period='monthly')
+        for i in range(12):
+            Transaction.objects.create(user=self.user, category=self.category, amount=Decimal('20.00'),
+                                       type='expense', date=datetime.now() - timedelta(days=i * 7))
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_utils(self):
+        for func in (calculate_spending_prediction, check_overspending_alerts, generate_investment_recommendation):
+            with self.subTest(func=func.__name__):
+                self.assertNoFullScans(func, self.user)
+        result, plans = self.query_plans(calculate_spending_prediction, self.user)
+        self.assertUsesIndex(plans, 'rollup_user_type_day')
+    
+    def test_generate_insights(self):
+        result, plans = self.assertNoFullScans(generate_insights_for_user, self.user, force=True)
+        # Stale insights are found through the natural key's unique index
+        self.assertUsesIndex(plans, 'sqlite_autoindex_insights_spendinginsight_1')
+    
+    def test_insights_dashboard(self):
+        generate_insights_for_user(self.user)
+        cache.clear()
+        response, plans = self.assertNoFullScans(self.client.get, reverse('insights_dashboard'))
+        self.assertUsesIndex(plans, 'insight_user_created')
+
+
+class BenchCommandTest(TestCase):
+    """Test the benchmark runner."""
+    
+    def test_percentile(self):
+        from .benchmarks import percentile
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(percentile([10, 20], 95), 19.5)
+        self.assertIsNone(percentile([], 50))
+    
+    def test_bench_reports_json(self):
+        import json
+        out = StringIO()
+        call_command('bench', sizes='40', iterations=2, warmup=0,
+                     scenarios='home,insights_dashboard,calculate_spending_prediction',
+                     stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['meta']['iterations'], 2)
+        self.assertEqual([r['scenario'] for r in report['results']],
+                         ['home', 'insights_dashboard', 'calculate_spending_prediction'])
+        for result in report['results']:
+            self.assertEqual(result['size'], 40)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertGreater(result['peak_memory_kb'], 0)
+        self.assertEqual(Transaction.objects.filter(user__username='bench_40').count(), 40)
+    
+    def test_bench_session_modes(self):
+        import json
+        queries = {}
+        for options in ({'session_backend': 'db', 'auth_user_cache': 0},
+                        {'session_backend': 'cached_db', 'auth_user_cache': 60}):
+            out = StringIO()
+            call_command('bench', sizes='10', iterations=1, warmup=1, scenarios='transactions_list',
+                         stdout=out, stderr=StringIO(), **options)
+            report = json.loads(out.getvalue())
+            queries[report['meta']['session_backend']] = report['results'][0]['queries']
+        # No session or user lookups per request
+        self.assertEqual(queries['db'] - queries['cached_db'], 2)
+    
+    def test_bench_compares_query_modes(self):
+        import json
+        out = StringIO()
+        call_command('bench', sizes='10', iterations=1, warmup=0, scenarios='home',
+                     compare_query_modes=True, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual([r['concurrent_queries'] for r in report['results']], [True, False])
+        [comparison] = report['comparison']
+        self.assertEqual(comparison['scenario'], 'home')
+        self.assertEqual(comparison['sequential_p50_ms'], report['results'][1]['p50_ms'])
+        self.assertIn('p50_change_pct', comparison)
+    
+    def test_unknown_scenario(self):
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            call_command('bench', sizes='10', scenarios='nope', stdout=StringIO())
+
+
+class RecurringPaymentDetectionTest(TestCase):
+    """Test recurring payment detection and its incremental updates."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.entertainment = Category.objects.create(name='Entertainment', type='expense')
+        self.health = Category.objects.create(name='Health', type='expense')
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.today = date.today()
+        # Monthly streaming with a day or two of jitter and varying note suffixes
+        for months_ago, jitter in ((5, 0), (4, 1), (3, -1), (2, 0), (1, 2)):
+            self.spend(self.entertainment, '45.00', self.today - timedelta(days=round(30.44 * months_ago) + jitter),
+                       f'NETFLIX #{months_ago}')
+        # Weekly gym
+        for weeks_ago in range(1, 7):
+            self.spend(self.health, '20.00', self.today - timedelta(weeks=weeks_ago), 'Gym membership')
+        # Irregular lunches
+        for days_ago in (1, 2, 9, 10, 11, 30, 44):
+            self.spend(self.food, '12.00', self.today - timedelta(days=days_ago), 'Lunch')
+    
+    def spend(self, category, amount, day, note):
+        return Transaction.objects.create(user=self.user, category=category, amount=Decimal(amount),
+                                          type='expense', date=day, note=note)
+    
+    def detect(self, today=None):
+        from .recurring import detect_recurring_payments
+        return detect_recurring_payments([self.user.id], today=today)[self.user.id]
+    
+    def test_find_periodic_groups(self):
+        import numpy as np
+        from .recurring import PERIOD_NAMES, find_periodic_groups
+        start = date(2024, 1, 1).toordinal()
+        rows = (
+            [(0, start + round(30.44 * i) + (i % 3) - 1, 9.99) for i in range(8)]       # monthly, jittered
+            + [(1, start + 7 * i, 15.0) for i in range(10)]                             # weekly
+            + [(2, start + 365 * i, 120.0) for i in range(3)]                           # yearly
+            + [(3, start + d, 25.0) for d in (0, 3, 4, 20, 21, 50, 51, 52)]            # irregular
+            + [(4, start + 7 * i, amount) for i, amount in enumerate((5, 80, 12, 60, 3))]  # weekly, varying amounts
+        )
+        rows.reverse()
+        groups, days, amounts = (np.array(column) for column in zip(*rows))
+        period, last_row, next_day, occurrences = find_periodic_groups(groups, days, amounts)
+        names = [PERIOD_NAMES[p] if p >= 0 else None for p in period]
+        self.assertEqual(names, ['monthly', 'weekly', 'yearly', None, None])
+        self.assertEqual(list(occurrences), [8, 10, 3, 8, 5])
+        self.assertEqual(days[last_row[1]], start + 63)
+        self.assertEqual(next_day[1], start + 70)
+        self.assertEqual(next_day[2], start + 730 + 365)
+    
+    def test_detects_recurring_payments(self):
+        payments = self.detect()
+        self.assertEqual([(p.label, p.period, p.occurrences) for p in payments], [
+            ('Gym membership', 'weekly', 6),
+            ('NETFLIX #1', 'monthly', 5),
+        ])
+        netflix = payments[1]
+        self.assertEqual(netflix.note_key, 'netflix')
+        self.assertEqual(netflix.amount, Decimal('45.00'))
+        self.assertEqual(netflix.last_date, self.today - timedelta(days=32))
+        
+        # Lapsed once the next payment is long overdue
+        self.assertEqual(self.detect(today=self.today + timedelta(days=40)), [])
+    
+    def test_new_expenses_only_rescan_their_group(self):
+        from . import recurring
+        from .models import RecurringDetectionState, RecurringPayment
+        self.detect()
+        gym = RecurringPayment.objects.get(user=self.user, note_key='gym membership')
+        
+        self.spend(self.entertainment, '45.00', self.today, 'Netflix')
+        with patch.object(recurring, 'find_periodic_groups', wraps=recurring.find_periodic_groups) as find:
+            payments = self.detect()
+        self.assertEqual(len(find.call_args.args[0]), 6)
+        self.assertEqual([p.occurrences for p in payments if p.note_key == 'netflix'], [6])
+        self.assertEqual(RecurringPayment.objects.get(pk=gym.pk).occurrences, 6)
+        self.assertEqual(RecurringDetectionState.objects.get(user=self.user).expense_count, 19)
+        
+        # Nothing changed: nothing is read
+        with patch.object(recurring, 'find_periodic_groups') as find:
+            self.detect()
+        find.assert_not_called()
+    
+    def test_edits_and_deletes_rescan_everything(self):
+        from . import recurring
+        from .models import RecurringPayment
+        self.detect()
+        Transaction.objects.filter(user=self.user, note='Gym membership').order_by('date').first().delete()
+        with patch.object(recurring, 'find_periodic_groups', wraps=recurring.find_periodic_groups) as find:
+            self.detect()
+        self.assertEqual(len(find.call_args.args[0]), 17)
+        self.assertEqual(RecurringPayment.objects.get(note_key='gym membership').occurrences, 5)
+        
+        # Renaming the gym payments breaks up the group
+        for transaction in Transaction.objects.filter(user=self.user, note='Gym membership')[:3]:
+            transaction.note = f'Gym {transaction.pk}'
+            transaction.save()
+        self.assertEqual([p.note_key for p in self.detect()], ['netflix'])
+        self.assertFalse(RecurringPayment.objects.filter(note_key='gym membership').exists())
+    
+    def test_recurring_insights(self):
+        generate_insights_for_user(self.user)
+        insights = SpendingInsight.objects.filter(user=self.user, insight_type='recurring').order_by('title')
+        self.assertEqual([insight.title for insight in insights], [
+            'Recurring Payment: Gym membership',
+            'Recurring Payment: NETFLIX #1',
+        ])
+        self.assertTrue(insights[0].subject_key.startswith('recurring:'))
+        self.assertIn('weekly payment of about GH₵20.00', insights[0].message)
+        
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        response = client.get(reverse('insights_dashboard'))
+        self.assertEqual(len(response.context['recurring_payments']), 2)
+        self.assertContains(response, 'Recurring Payments')
+
+
+class UnusualExpenseTest(TestCase):
+    """Test running spending statistics and unusual expense alerts."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.today = date.today()
+        for i in range(20):
+            self.spend(f'{45 + i % 10}.00')
+    
+    def spend(self, amount, category=None):
+        return Transaction.objects.create(user=self.user, category=category or self.food, amount=Decimal(amount),
+                                          type='expense', date=self.today)
+    
+    def stats(self):
+        from transactions.models import UserCategoryStats
+        return UserCategoryStats.objects.get(user=self.user, category=self.food, type='expense')
+    
+    def alerts(self):
+        return SpendingInsight.objects.filter(user=self.user, insight_type='anomaly')
+    
+    def test_running_statistics(self):
+        import numpy as np
+        from transactions.models import UserCategoryStats
+        from transactions.spread import add_amount, remove_amount, sketch_quantile, standard_deviation
+        rng = np.random.default_rng(7)
+        amounts = rng.lognormal(3, 0.6, 5000).round(2)
+        stats = UserCategoryStats(count=0, total=Decimal('0'), m2=0.0, sketch={})
+        for amount in amounts:
+            add_amount(stats, Decimal(f'{amount:.2f}'))
+        self.assertAlmostEqual(stats.mean, amounts.mean(), places=6)
+        self.assertAlmostEqual(standard_deviation(stats), amounts.std(ddof=1), places=6)
+        self.assertAlmostEqual(sketch_quantile(stats.sketch) / np.quantile(amounts, 0.95), 1, delta=0.05)
+        
+        for amount in amounts[:1000]:
+            remove_amount(stats, Decimal(f'{amount:.2f}'))
+        self.assertEqual(stats.count, 4000)
+        self.assertAlmostEqual(stats.mean, amounts[1000:].mean(), places=6)
+        self.assertAlmostEqual(standard_deviation(stats), amounts[1000:].std(ddof=1), places=6)
+    
+    def test_unusual_expense_alert_at_write_time(self):
+        self.assertEqual(self.stats().count, 20)
+        self.assertFalse(self.alerts().exists())
+        
+        with CaptureQueriesContext(connection) as queries:
+            transaction = self.spend('400.00')
+        # No transaction history is read
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'transactions_transaction"' in q['sql']])
+        alert = self.alerts().get()
+        self.assertEqual(alert.subject_key, f'anomaly:{transaction.pk}')
+        self.assertEqual(alert.title, 'Unusual Expense: Food')
+        self.assertIn('GH₵400.00', alert.message)
+        self.assertEqual(self.stats().count, 21)
+        
+        self.spend('60.00')
+        self.assertEqual(self.alerts().count(), 1)
+        
+        # A new category has no history to judge by
+        travel = Category.objects.create(name='Travel', type='expense')
+        self.spend('5.00', travel)
+        self.spend('900.00', travel)
+        self.assertEqual(self.alerts().count(), 1)
+    
+    def test_edits_and_deletes_withdraw_the_alert(self):
+        transaction = self.spend('400.00')
+        transaction.amount = Decimal('50.00')
+        transaction.save()
+        self.assertFalse(self.alerts().exists())
+        self.assertEqual(self.stats().count, 21)
+        
+        transaction.amount = Decimal('500.00')
+        transaction.save()
+        self.assertEqual(self.alerts().get().amount, Decimal('500.00'))
+        transaction.delete()
+        self.assertFalse(self.alerts().exists())
+        self.assertEqual(self.stats().count, 20)
+        self.assertAlmostEqual(self.stats().mean, 49.5)
+    
+    def test_alerts_survive_regeneration(self):
+        self.spend('400.00')
+        generate_insights_for_user(self.user, force=True)
+        self.assertEqual(self.alerts().count(), 1)
+        
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        response = client.get(reverse('insights_dashboard'))
+        self.assertIn('Unusual Expense: Food', [alert.title for alert in response.context['alerts']])
+    
+    def test_rebuild_matches_running_statistics(self):
+        running = self.stats()
+        out = StringIO()
+        call_command('rebuild_transaction_rollups', stdout=out)
+        rebuilt = self.stats()
+        self.assertEqual(rebuilt.count, running.count)
+        self.assertAlmostEqual(rebuilt.mean, running.mean)
+        self.assertAlmostEqual(rebuilt.m2, running.m2)
+        self.assertEqual(len(rebuilt.sketch['positions']), 5)
+        self.assertEqual(rebuilt.sketch['heights'][0], 45.0)
+        self.assertEqual(rebuilt.sketch['heights'][-1], 54.0)
+        
+        # Imports bypass signals and add their amounts batch by batch
+        from transactions.importers import insert_transactions
+        insert_transactions(self.user.id, [(self.food.id, 'expense', Decimal('50.00'), self.today, '')] * 5)
+        stats = self.stats()
+        self.assertEqual(stats.count, 25)
+        self.assertAlmostEqual(stats.mean, (running.count * running.mean + 250) / 25)
+        amounts = [45 + i % 10 for i in range(20)] + [50] * 5
+        self.assertAlmostEqual(stats.m2, sum((amount - sum(amounts) / 25) ** 2 for amount in amounts))
+        self.assertEqual(stats.sketch['positions'][-1], 25)
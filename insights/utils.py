@@ -1,37 +1,52 @@
 """
 Utility functions for generating financial insights, predictions, and recommendations.
 """
-from datetime import datetime, timedelta
+from datetime import date
 from decimal import Decimal
-from django.db.models import Sum, Avg
-from transactions.models import Transaction, Budget
-from .models import SpendingInsight
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from transactions.budgets import evaluate_budgets, evaluate_budgets_for_users
+from transactions.caching import INSIGHTS_NAMESPACE, bump_user_version
+from transactions.category_stats import month_totals
+from transactions.models import UserDataVersion
+from .forecasting import forecast_spending, forecast_user_spending, next_month
+from .models import SpendingInsight, InsightGenerationState
+from .recurring import detect_recurring_payments
 
 
 def calculate_spending_prediction(user):
     """
-    Predict next month's spending based on historical average.
-    Returns a dictionary with prediction details.
+    Predict next month's spending from the user's daily expense history
+    (see ``forecasting.py``). Returns a dictionary with prediction details,
+    or None with too little data.
     """
-    transactions = Transaction.objects.filter(user=user, type='expense')
-    
-    if transactions.count() < 5:
+    return prediction_from_forecast(forecast_user_spending(user))
+
+
+def prediction_from_forecast(forecast):
+    """
+    Prediction details from a forecast computed by ``forecasting.py``.
+    """
+    if forecast is None or forecast['transaction_count'] < 5:
         return None
     
-    # Calculate average monthly spending (last 3 months)
-    three_months_ago = datetime.now() - timedelta(days=90)
-    recent_spending = transactions.filter(date__gte=three_months_ago).aggregate(
-        total=Sum('amount')
-    )['total'] or 0
-    
-    # Average per month
-    avg_monthly = float(recent_spending) / 3
-    predicted_next_month = avg_monthly * 1.05  # Add 5% buffer
+    total = forecast['total']
+    # Interval width relative to the forecast
+    spread = (total['upper'] - total['lower']) / total['amount'] if total['amount'] else float('inf')
+    if forecast['transaction_count'] <= 20 or spread > 1:
+        confidence = 'low'
+    elif spread > 0.5:
+        confidence = 'medium'
+    else:
+        confidence = 'high'
     
     return {
-        'amount': round(predicted_next_month, 2),
-        'average': round(avg_monthly, 2),
-        'confidence': 'medium' if transactions.count() > 20 else 'low'
+        'amount': total['amount'],
+        'lower': total['lower'],
+        'upper': total['upper'],
+        'average': forecast['monthly_average'],
+        'confidence': confidence,
+        'categories': forecast['categories'],
     }
 
 
@@ -40,27 +55,25 @@ def check_overspending_alerts(user):
     Check if user is over budget in any category and return alerts.
     Returns a list of alert dictionaries.
     """
+    return budget_alerts(evaluate_budgets(user))
+
+
+def budget_alerts(statuses):
+    """
+    Alerts for the budgets at 90% or more of their limit, from the output of
+    ``evaluate_budgets``.
+    """
     alerts = []
-    budgets = Budget.objects.filter(user=user)
-    
-    for budget in budgets:
-        # Calculate spending in this category for the current period
-        if budget.period == 'weekly':
-            start_date = datetime.now() - timedelta(days=7)
-        else:  # monthly
-            start_date = datetime.now().replace(day=1)
-        
-        spent = Transaction.objects.filter(
-            user=user,
-            category=budget.category,
-            type='expense',
-            date__gte=start_date
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        percentage = (float(spent) / float(budget.limit_amount)) * 100 if budget.limit_amount > 0 else 0
+    
+    for status in statuses:
+        budget = status['budget']
+        spent = status['spent']
+        percentage = float(status['percentage'])
         
         if percentage >= 90:
             alerts.append({
+                'budget_id': budget.pk,
+                'period': budget.period,
                 'category': budget.category.name,
                 'spent': float(spent),
                 'limit': float(budget.limit_amount),
@@ -76,12 +89,18 @@ def generate_investment_recommendation(user):
     Calculate potential savings/investment amount based on income and expenses.
     Returns a dictionary with recommendation details.
     """
-    # Get income and expenses for current month
-    month_start = datetime.now().replace(day=1)
-    
-    transactions = Transaction.objects.filter(user=user, date__gte=month_start)
-    income = float(transactions.filter(type='income').aggregate(Sum('amount'))['amount__sum'] or 0)
-    expenses = float(transactions.filter(type='expense').aggregate(Sum('amount'))['amount__sum'] or 0)
+    # Income and expenses of the current month
+    totals = month_totals([user.id])[user.id]
+    return savings_recommendation(totals['income'], totals['expenses'])
+
+
+def savings_recommendation(income, expenses):
+    """
+    Savings amounts for this month's income and expenses, or None when
+    nothing is left over.
+    """
+    income = float(income or 0)
+    expenses = float(expenses or 0)
     
     balance = income - expenses
     
@@ -102,53 +121,188 @@ def generate_investment_recommendation(user):
     }
 
 
-def generate_insights_for_user(user):
+def current_period():
     """
-    Generate all types of insights for a user and save them to the database.
+    Key of the calendar period insights are computed for.
+    Predictions, alerts and recommendations all depend on today's date (rolling
+    7/90-day windows, current week and month), so a new day invalidates them.
+    """
+    return date.today().isoformat()
+
+
+def insights_are_current(user, period=None):
+    """
+    Check in one query whether the stored insights match the user's data
+    version and the current period.
     """
-    # Clear old unread insights (older than 7 days)
-    week_ago = datetime.now() - timedelta(days=7)
-    SpendingInsight.objects.filter(user=user, is_read=False, created_at__lt=week_ago).delete()
+    return bool(users_with_current_insights([user.id], period))
+
+
+def users_with_current_insights(user_ids, period=None):
+    """
+    The subset of ``user_ids`` whose stored insights match their data version
+    and the current period, in one query.
+    """
+    version = Coalesce(
+        Subquery(UserDataVersion.objects.filter(user=OuterRef('user')).values('version')[:1]),
+        Value(0),
+    )
+    return set(
+        InsightGenerationState.objects
+        .filter(user_id__in=list(user_ids), period=period or current_period(), data_version=version)
+        .values_list('user_id', flat=True)
+    )
+
+
+def insight_period(kind, today=None):
+    """
+    Key of the period an insight is about: ``'next_month'`` and ``'monthly'``
+    give a month (YYYY-MM), ``'weekly'`` an ISO week (YYYY-Www).
+    """
+    today = today or date.today()
+    if kind == 'next_month':
+        return next_month(today)[0].strftime('%Y-%m')
+    if kind == 'weekly':
+        year, week, _ = today.isocalendar()
+        return f'{year}-W{week:02d}'
+    return today.strftime('%Y-%m')
+
+
+def insight_rows(prediction, alerts, recommendation, recurring=(), today=None):
+    """
+    The insights to store for a user, as ``(insight_type, subject_key, period,
+    title, message, amount)`` tuples. Type, subject key and period identify an
+    insight across runs.
+    """
+    rows = []
     
     # Spending Prediction
-    prediction = calculate_spending_prediction(user)
     if prediction:
-        SpendingInsight.objects.get_or_create(
-            user=user,
-            insight_type='prediction',
-            title='Next Month Spending Forecast',
-            defaults={
-                'message': f'Based on your recent spending patterns, you are likely to spend around GH₵{prediction["amount"]} next month. Your average monthly spending is GH₵{prediction["average"]}.',
-                'amount': Decimal(str(prediction['amount']))
-            }
-        )
+        rows.append((
+            'prediction',
+            'spending',
+            insight_period('next_month', today),
+            'Next Month Spending Forecast',
+            f'Based on your recent spending patterns, you are likely to spend around GH₵{prediction["amount"]} next month (likely between GH₵{prediction["lower"]} and GH₵{prediction["upper"]}). Your average monthly spending is GH₵{prediction["average"]}.',
+            Decimal(str(prediction['amount'])),
+        ))
     
     # Overspending Alerts
-    alerts = check_overspending_alerts(user)
     for alert in alerts:
         severity_text = "CRITICAL" if alert['severity'] == 'critical' else "WARNING"
-        SpendingInsight.objects.get_or_create(
-            user=user,
-            insight_type='alert',
-            title=f'{severity_text}: {alert["category"]} Budget Alert',
-            defaults={
-                'message': f'You have spent GH₵{alert["spent"]:.2f} ({alert["percentage"]:.1f}%) of your GH₵{alert["limit"]:.2f} budget for {alert["category"]}.',
-                'amount': Decimal(str(alert['spent']))
-            }
-        )
+        rows.append((
+            'alert',
+            f'budget:{alert["budget_id"]}',
+            insight_period(alert['period'], today),
+            f'{severity_text}: {alert["category"]} Budget Alert',
+            f'You have spent GH₵{alert["spent"]:.2f} ({alert["percentage"]:.1f}%) of your GH₵{alert["limit"]:.2f} budget for {alert["category"]}.',
+            Decimal(str(alert['spent'])),
+        ))
     
     # Investment Recommendation
-    recommendation = generate_investment_recommendation(user)
     if recommendation:
-        SpendingInsight.objects.get_or_create(
-            user=user,
-            insight_type='recommendation',
-            title='Investment Opportunity',
-            defaults={
-                'message': f'You have GH₵{recommendation["balance"]:.2f} in available balance this month. Consider saving GH₵{recommendation["recommended"]:.2f} (25%) towards your financial goals or investments.',
-                'amount': Decimal(str(recommendation['recommended']))
-            }
-        )
+        rows.append((
+            'recommendation',
+            'savings',
+            insight_period('monthly', today),
+            'Investment Opportunity',
+            f'You have GH₵{recommendation["balance"]:.2f} in available balance this month. Consider saving GH₵{recommendation["recommended"]:.2f} (25%) towards your financial goals or investments.',
+            Decimal(str(recommendation['recommended'])),
+        ))
+    
+    # Recurring Payments
+    for payment in recurring:
+        rows.append((
+            'recurring',
+            f'recurring:{payment.pk}',
+            insight_period('monthly', today),
+            f'Recurring Payment: {payment.label}',
+            f'{payment.label} looks like a {payment.period} payment of about GH₵{payment.amount:.2f} ({payment.occurrences} so far). The next one is expected around {payment.next_date:%b %d, %Y}.',
+            payment.amount,
+        ))
     
-    return True
+    return rows
 
+
+def generate_insights_for_user(user, force=False):
+    """
+    Generate all types of insights for a user and save them to the database.
+    Skipped when nothing changed since the last run in the current period,
+    unless ``force`` is set. Returns True if insights were regenerated.
+    """
+    return bool(generate_insights_for_users([user.id], force=force))
+
+
+def generate_insights_for_users(user_ids, force=False):
+    """
+    Generate insights for a batch of users with a fixed number of set-based
+    queries, whatever the batch size. Users whose insights are current are
+    skipped unless ``force`` is set. Returns the ids of the users whose
+    insights were regenerated.
+    """
+    period = current_period()
+    user_ids = list(user_ids)
+    if not force:
+        current = users_with_current_insights(user_ids, period)
+        user_ids = [user_id for user_id in user_ids if user_id not in current]
+    if not user_ids:
+        return []
+    
+    # Read the versions before computing so writes made meanwhile trigger another run;
+    # missing markers are created so that later deletes have a row to bump
+    data_versions = dict(
+        UserDataVersion.objects.filter(user_id__in=user_ids).values_list('user_id', 'version')
+    )
+    missing = [user_id for user_id in user_ids if user_id not in data_versions]
+    if missing:
+        UserDataVersion.objects.bulk_create(
+            [UserDataVersion(user_id=user_id) for user_id in missing], ignore_conflicts=True
+        )
+    
+    forecasts = forecast_spending(user_ids)
+    budget_statuses = evaluate_budgets_for_users(user_ids)
+    recurring = detect_recurring_payments(user_ids)
+    totals = month_totals(user_ids)
+    
+    insights = []
+    for user_id in user_ids:
+        rows = insight_rows(
+            prediction_from_forecast(forecasts[user_id]),
+            budget_alerts(budget_statuses[user_id]),
+            savings_recommendation(totals[user_id]['income'], totals[user_id]['expenses']),
+            recurring[user_id],
+        )
+        insights.extend(
+            SpendingInsight(
+                user_id=user_id, insight_type=insight_type, subject_key=subject_key, period=period_key,
+                title=title, message=message, amount=amount,
+            )
+            for insight_type, subject_key, period_key, title, message, amount in rows
+        )
+    
+    # Insert new insights and refresh existing ones in place (read state and
+    # creation time are kept), then delete the generated insights that no
+    # longer apply
+    SpendingInsight.objects.bulk_create(
+        insights,
+        update_conflicts=True,
+        unique_fields=['user', 'insight_type', 'subject_key', 'period'],
+        update_fields=['title', 'message', 'amount'],
+    )
+    SpendingInsight.objects.filter(
+        user_id__in=user_ids, insight_type__in=SpendingInsight.GENERATED_TYPES,
+    ).exclude(pk__in=[insight.pk for insight in insights]).delete()
+    # bulk_create sends no signals, so invalidate the cached insight pages here
+    for user_id in user_ids:
+        bump_user_version(user_id, INSIGHTS_NAMESPACE)
+    
+    InsightGenerationState.objects.bulk_create(
+        [
+            InsightGenerationState(user_id=user_id, data_version=data_versions.get(user_id, 0), period=period)
+            for user_id in user_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['data_version', 'period', 'generated_at'],
+    )
+    return user_ids
@@ -1,37 +1,61 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from transactions.caching import INSIGHTS_NAMESPACE, acached_payload
 from .models import SpendingInsight
-from .utils import generate_insights_for_user
+from .jobs import enqueue_insight_job
+from .utils import insights_are_current
+
+
+def build_insights_payload(user):
+    """
+    Load a user's insights grouped by type, with total and unread counts.
+    """
+    insights = list(SpendingInsight.objects.filter(user=user))
+    payload = {
+        'predictions': [],
+        'alerts': [],
+        'recommendations': [],
+        'recurring_payments': [],
+        'tips': [],
+        'total_insights': len(insights),
+        'unread_count': sum(1 for insight in insights if not insight.is_read),
+    }
+    groups = {
+        'prediction': payload['predictions'],
+        'alert': payload['alerts'],
+        'anomaly': payload['alerts'],
+        'recommendation': payload['recommendations'],
+        'recurring': payload['recurring_payments'],
+        'tip': payload['tips'],
+    }
+    for insight in insights:
+        if insight.insight_type in groups:
+            groups[insight.insight_type].append(insight)
+    return payload
 
 
 @login_required
-def insights_dashboard(request):
+async def insights_dashboard(request):
     """
     Display all insights for the logged-in user.
+    Insights are generated by the background worker; this view only reads them.
+    The payload is cached until one of the user's insights changes.
     """
-    # Generate fresh insights
-    generate_insights_for_user(request.user)
-    
-    # Get all insights
-    insights = SpendingInsight.objects.filter(user=request.user)
+    user = await request.auser()
+    context = await acached_payload(
+        'insights', user.id, lambda: sync_to_async(build_insights_payload)(user),
+        namespaces=(INSIGHTS_NAMESPACE,),
+    )
     
-    # Separate by type
-    predictions = insights.filter(insight_type='prediction')
-    alerts = insights.filter(insight_type='alert')
-    recommendations = insights.filter(insight_type='recommendation')
-    tips = insights.filter(insight_type='tip')
-    
-    context = {
-        'predictions': predictions,
-        'alerts': alerts,
-        'recommendations': recommendations,
-        'tips': tips,
-        'total_insights': insights.count(),
-        'unread_count': insights.filter(is_read=False).count(),
-    }
+    # Queue users whose insights were never generated, lag behind their data
+    # or were generated for an earlier period (day); a generation that
+    # produced nothing still leaves them current
+    if not await sync_to_async(insights_are_current)(user):
+        await sync_to_async(enqueue_insight_job)(user.id)
     
-    return render(request, 'insights/insights_dashboard.html', context)
+    return await sync_to_async(render)(request, 'insights/insights_dashboard.html', context)
 
 
 @login_required
@@ -0,0 +1,57 @@
+"""
+Running independent database queries of an async view concurrently.
+
+Django's async ORM methods (``aget``, ``aaggregate``, ...) all run on the
+same thread, one after another, so gathering them does not overlap the
+queries. ``run_queries`` instead runs each function in its own worker thread
+with its own database connection, so the round trips overlap.
+
+It falls back to running the functions one after another on the request's
+thread when concurrency cannot help or would be unsafe:
+
+* on SQLite, where there is no server round trip to overlap and writers
+  would contend for the file lock;
+* inside an atomic block (e.g. tests), whose uncommitted rows other
+  connections cannot see;
+* when ``ASYNC_CONCURRENT_QUERIES`` is False.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+
+def concurrent_queries_enabled(using=DEFAULT_DB_ALIAS):
+    return (
+        getattr(settings, 'ASYNC_CONCURRENT_QUERIES', True)
+        and connections[using].vendor != 'sqlite'
+    )
+
+
+def _in_own_connection(func):
+    def run():
+        # Worker threads keep their connection between calls, like a request
+        # thread, and drop it once it is older than CONN_MAX_AGE
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return run
+
+
+def _in_atomic_block(using):
+    return connections[using].in_atomic_block
+
+
+async def run_queries(*funcs, using=DEFAULT_DB_ALIAS):
+    """
+    Call the synchronous ``funcs`` and return their results in order,
+    concurrently when possible (see above).
+    """
+    if concurrent_queries_enabled(using) and not await sync_to_async(_in_atomic_block)(using):
+        return list(await asyncio.gather(*(
+            sync_to_async(_in_own_connection(func), thread_sensitive=False)() for func in funcs
+        )))
+    return [await sync_to_async(func)() for func in funcs]
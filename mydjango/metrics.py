@@ -0,0 +1,359 @@
+"""
+Process-shared application metrics in the Prometheus text format.
+
+Every process (gunicorn workers, the insight worker) records counters and
+histograms in memory and periodically writes a snapshot of its totals to
+``METRICS_DIR/metrics-<pid>-<start>.json``; the start time keeps a reused
+pid from overwriting an exited process's totals. The ``/metrics`` endpoint
+merges the snapshots of all processes. Snapshots of exited processes are
+folded into ``metrics-retired.json`` and removed, so counters do not go
+backwards when a worker is recycled and the directory does not grow.
+
+Recording is lock-light: each thread writes to its own shard, whose lock is
+only ever contended by the periodic flush. Shards of exited threads (thread
+pools, ASGI sync threads) are folded into one retired shard on each
+snapshot, so their number stays bounded.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: folding is not locked against concurrent scrapes
+    fcntl = None
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'HTTP requests by URL name, method and status code.', None),
+    'http_request_duration_seconds': (
+        'histogram', 'Time to produce a response, by URL name.', DURATION_BUCKETS),
+    'http_request_db_duration_seconds': (
+        'histogram', 'Time spent in SQL queries per request, by URL name.', DURATION_BUCKETS),
+    'insight_generation_runs_total': (
+        'counter', 'Insight generation runs by result (generated, skipped, failed).', None),
+    'insight_generation_duration_seconds': (
+        'histogram', 'Duration of insight generation runs.', DURATION_BUCKETS),
+}
+
+
+RETIRED_SNAPSHOT = 'metrics-retired.json'
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'smart-finance-tracker-metrics'
+    )
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._local = threading.local()
+        # (thread, shard) pairs of live threads, and the totals of exited ones
+        self._shards = []
+        self._retired = _Shard()
+        self._shards_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flush_lock = threading.Lock()
+        self._identity = None
+
+    def identity(self):
+        """``<pid>-<start>`` of this process, renewed in forked children."""
+        pid = os.getpid()
+        if self._identity is None or self._identity[0] != pid:
+            self._identity = (pid, f'{pid}-{time.time_ns()}')
+        return self._identity[1]
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _prune_shards(self):
+        """Fold the shards of exited threads into the retired shard; returns all shards."""
+        with self._shards_lock, self._retired.lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                    continue
+                # The thread is gone, so nothing writes to its shard any more
+                retired = self._retired
+                for key, value in shard.counters.items():
+                    retired.counters[key] = retired.counters.get(key, 0) + value
+                for key, entry in shard.histograms.items():
+                    _merge_histogram(retired.histograms, key, entry)
+            self._shards = live
+            return [self._retired] + [shard for thread, shard in live]
+
+    def inc(self, name, labels=None, value=1):
+        shard = self._shard()
+        key = (name, _label_key(labels))
+        with shard.lock:
+            shard.counters[key] = shard.counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name, value, labels=None):
+        buckets = METRICS[name][2]
+        shard = self._shard()
+        key = (name, _label_key(labels))
+        with shard.lock:
+            entry = shard.histograms.get(key)
+            if entry is None:
+                # Per-bucket counts (last one is +Inf), then sum and count
+                entry = shard.histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            entry[bisect_left(buckets, value)] += 1
+            entry[-2] += value
+            entry[-1] += 1
+        self._maybe_flush()
+
+    def snapshot(self):
+        """Merge all shards of this process into one snapshot dict."""
+        counters, histograms = {}, {}
+        for shard in self._prune_shards():
+            with shard.lock:
+                shard_counters = list(shard.counters.items())
+                shard_histograms = [(key, list(entry)) for key, entry in shard.histograms.items()]
+            for key, value in shard_counters:
+                counters[key] = counters.get(key, 0) + value
+            for key, entry in shard_histograms:
+                _merge_histogram(histograms, key, entry)
+        return {'counters': counters, 'histograms': histograms}
+
+    def _maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        """Write this process's totals to its snapshot file."""
+        if not self._flush_lock.acquire(blocking=False):
+            return  # another thread is flushing
+        try:
+            self._last_flush = time.monotonic()
+            write_snapshot(self.snapshot(), self.identity())
+        except OSError:
+            pass  # metrics must never break a request
+        finally:
+            self._flush_lock.release()
+
+
+def _merge_histogram(histograms, key, entry):
+    existing = histograms.get(key)
+    if existing is None:
+        histograms[key] = list(entry)
+    else:
+        for i, value in enumerate(entry):
+            existing[i] += value
+
+
+def _serialize(snapshot):
+    return {
+        'counters': [[name, list(map(list, labels)), value]
+                     for (name, labels), value in snapshot['counters'].items()],
+        'histograms': [[name, list(map(list, labels)), entry]
+                       for (name, labels), entry in snapshot['histograms'].items()],
+    }
+
+
+def _add(totals, data):
+    """Add a snapshot read from a file to ``totals``."""
+    counters, histograms = totals['counters'], totals['histograms']
+    for metric, labels, value in data.get('counters', []):
+        key = (metric, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for metric, labels, entry in data.get('histograms', []):
+        _merge_histogram(histograms, (metric, tuple(map(tuple, labels))), entry)
+
+
+def _write_json(directory, name, data):
+    # Write then rename, so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+def _read_json(directory, name):
+    try:
+        with open(os.path.join(directory, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(snapshot, identity=None):
+    """Write the totals of the process ``identity`` (this one by default)."""
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    _write_json(directory, f'metrics-{identity or registry.identity()}.json', _serialize(snapshot))
+
+
+def _snapshot_names(directory):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [
+        name for name in names
+        if name.startswith('metrics-') and name.endswith('.json') and name != RETIRED_SNAPSHOT
+    ]
+
+
+def _exited(name):
+    """Whether the process that wrote snapshot ``name`` has exited."""
+    if fcntl is None:
+        return False  # os.kill(pid, 0) would terminate the process on Windows
+    identity = name[len('metrics-'):-len('.json')]
+    try:
+        pid = int(identity.split('-')[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return identity != registry.identity()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+@contextmanager
+def _locked(directory, exclusive):
+    """Hold the lock serializing folds (exclusive) with merges (shared)."""
+    with open(os.path.join(directory, '.metrics.lock'), 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def _fold_exited(directory, names):
+    """
+    Add the snapshots ``names`` of exited processes to the retired totals and
+    remove them. The retired file lists the snapshots folded into it, so one
+    left behind by an interrupted fold is never counted twice.
+    """
+    with _locked(directory, exclusive=True):
+        retired = _read_json(directory, RETIRED_SNAPSHOT) or {}
+        present = set(_snapshot_names(directory))
+        folded = [name for name in retired.get('folded', []) if name in present]
+        totals = {'counters': {}, 'histograms': {}}
+        _add(totals, retired)
+        for name in names:
+            if name in folded or name not in present:
+                continue
+            data = _read_json(directory, name)
+            if data is not None:
+                _add(totals, data)
+                folded.append(name)
+        _write_json(directory, RETIRED_SNAPSHOT, {**_serialize(totals), 'folded': folded})
+        for name in folded:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def collect():
+    """
+    Merge the snapshots of all processes, with this process's totals fresh.
+    Snapshots of exited processes are folded into the retired totals first.
+    """
+    registry.flush()
+    directory = metrics_dir()
+    totals = {'counters': {}, 'histograms': {}}
+    if not os.path.isdir(directory):
+        return totals
+    exited = [name for name in _snapshot_names(directory) if _exited(name)]
+    if exited:
+        try:
+            _fold_exited(directory, exited)
+        except OSError:
+            pass  # folded on a later scrape
+
+    with _locked(directory, exclusive=False):
+        retired = _read_json(directory, RETIRED_SNAPSHOT) or {}
+        folded = set(retired.get('folded', []))
+        _add(totals, retired)
+        for name in _snapshot_names(directory):
+            data = None if name in folded else _read_json(directory, name)
+            if data is not None:
+                _add(totals, data)
+    return totals
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for key, value in items
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render_exposition(data):
+    """Render collected metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (type_, help_text, buckets) in METRICS.items():
+        if type_ == 'counter':
+            series = sorted((labels, value) for (metric, labels), value in data['counters'].items() if metric == name)
+        else:
+            series = sorted((labels, entry) for (metric, labels), entry in data['histograms'].items() if metric == name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {type_}')
+        for labels, value in series:
+            if type_ == 'counter':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-2]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-2]:.6f}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+registry = MetricsRegistry()
+
+
+@atexit.register
+def _flush_at_exit():
+    # Only processes that recorded something leave a snapshot behind
+    if registry._shards:
+        registry.flush()
@@ -0,0 +1,272 @@
+"""
+Per-request performance instrumentation and metrics.
+
+``RequestInstrumentationMiddleware`` records, for every request, the number
+of SQL queries, the time spent in the database, in template rendering and in
+the view, and reports them in a ``Server-Timing`` response header (shown by
+browser developer tools). Requests slower than ``REQUEST_SLOW_THRESHOLD_MS``
+are logged with their slowest statements, and statements executed many
+times with different parameters (N+1 patterns) are logged as well.
+
+It is enabled with ``REQUEST_INSTRUMENTATION=True``. When disabled, Django
+drops it from the middleware chain at startup (``MiddlewareNotUsed``) and
+nothing is patched, so it costs nothing.
+
+``MetricsMiddleware`` feeds the per-view request counters and latency
+histograms exposed at ``/metrics`` (see ``metrics.py``).
+
+Both are sync and async capable, so under ASGI async views are not adapted
+to run in a thread on their account.
+"""
+import contextvars
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import metrics_enabled, registry
+
+
+logger = logging.getLogger('mydjango.performance')
+
+_current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """
+    Timings collected for one request. Also used as a database
+    ``execute_wrapper``.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.queries = []  # (duration_ms, sql)
+        self.query_counts = defaultdict(int)
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            self.db_ms += duration
+            self.queries.append((duration, sql))
+            self.query_counts[sql] += 1
+
+    def repeated_queries(self, threshold):
+        """Statements executed at least ``threshold`` times, most frequent first."""
+        repeated = [(count, sql) for sql, count in self.query_counts.items() if count >= threshold]
+        return sorted(repeated, key=lambda item: -item[0])
+
+
+# execute_wrappers of the current request. Connections are per thread, and
+# an async request's queries run on other threads than its middleware, so
+# every connection gets one dispatcher that looks them up in the (copied)
+# request context instead of the middleware installing them per connection.
+_query_wrappers = contextvars.ContextVar('query_wrappers', default=())
+
+
+def _dispatch_query(execute, sql, params, many, context):
+    for wrapper in reversed(_query_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def _add_dispatcher(connection):
+    if _dispatch_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch_query)
+
+
+def _connection_created(sender, connection, **kwargs):
+    _add_dispatcher(connection)
+
+
+def _install_query_dispatch():
+    connection_created.connect(_connection_created, dispatch_uid='mydjango.middleware.query_dispatch')
+    # Connections this thread opened before the middleware was loaded
+    for connection in connections.all():
+        _add_dispatcher(connection)
+
+
+@contextmanager
+def _wrapping_queries(wrapper):
+    """Pass the queries of the current request, on any thread, through ``wrapper``."""
+    token = _query_wrappers.set(_query_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        _query_wrappers.reset(token)
+
+
+class _HybridMiddleware:
+    """Base of middleware calling ``get_response`` synchronously or asynchronously."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        _install_query_dispatch()
+
+
+def _instrument_templates():
+    """
+    Time Django template rendering for the current request. Only top-level
+    renders are timed, so included templates are not counted twice.
+    """
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'instrumented', False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        stats = _current_stats.get()
+        if stats is None or stats.template_depth:
+            return original(self, context, request)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_ms += (time.perf_counter() - started) * 1000
+            stats.template_depth -= 1
+
+    render.instrumented = True
+    Template.render = render
+
+
+class RequestInstrumentationMiddleware(_HybridMiddleware):
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.slow_threshold = getattr(settings, 'REQUEST_SLOW_THRESHOLD_MS', 500)
+        self.slow_query_count = getattr(settings, 'REQUEST_SLOW_QUERY_COUNT', 5)
+        self.repeated_threshold = getattr(settings, 'REQUEST_REPEATED_QUERY_THRESHOLD', 5)
+        _instrument_templates()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            with _wrapping_queries(stats):
+                response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self._finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            with _wrapping_queries(stats):
+                response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self._finish(request, response, stats)
+
+    def _finish(self, request, response, stats):
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        view_ms = (
+            (time.perf_counter() - stats.view_started) * 1000 - stats.db_ms - stats.template_ms
+            if stats.view_started is not None else 0.0
+        )
+        request.performance_stats = stats
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_ms:.1f};desc="{len(stats.queries)} queries"',
+            f'tpl;dur={stats.template_ms:.1f}',
+            f'view;dur={max(view_ms, 0.0):.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+        self._log(request, response, stats, total_ms)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.view_started = time.perf_counter()
+        return None
+
+    def _log(self, request, response, stats, total_ms):
+        for count, sql in stats.repeated_queries(self.repeated_threshold):
+            logger.warning(
+                'Repeated query (%d times, possible N+1) in %s %s: %s',
+                count, request.method, request.path, sql,
+            )
+        if total_ms < self.slow_threshold:
+            return
+        slowest = sorted(stats.queries, key=lambda query: -query[0])[:self.slow_query_count]
+        logger.warning(
+            'Slow request %s %s (%d): %.1f ms total, %.1f ms in %d queries, %.1f ms templates%s',
+            request.method, request.path, response.status_code, total_ms, stats.db_ms,
+            len(stats.queries), stats.template_ms,
+            ''.join(f'\n  {duration:.1f} ms: {sql}' for duration, sql in slowest),
+        )
+
+
+class _QueryTimer:
+    """Minimal execute_wrapper summing the time spent in SQL."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class MetricsMiddleware(_HybridMiddleware):
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with _wrapping_queries(timer):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with _wrapping_queries(timer):
+            response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def _record(self, request, response, duration, timer):
+        # Label by URL name, not path, to keep the number of series bounded
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        registry.inc('http_requests_total', {'view': view, 'method': method, 'status': str(response.status_code)})
+        registry.observe('http_request_duration_seconds', duration, {'view': view})
+        registry.observe('http_request_db_duration_seconds', timer.seconds, {'view': view})
@@ -63,6 +63,10 @@ except ImportError:
     pass
 
 MIDDLEWARE.extend([
+    # Request counters and latency histograms for /metrics (METRICS_ENABLED)
+    'mydjango.middleware.MetricsMiddleware',
+    # Inactive unless REQUEST_INSTRUMENTATION=True (see mydjango/middleware.py)
+    'mydjango.middleware.RequestInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,11 +98,18 @@ WSGI_APPLICATION = 'mydjango.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Seconds a database connection is kept open for reuse. Under ASGI every
+# request (and every concurrent query) may run on a different thread, each
+# with its own connection, so persistent connections pile up instead of
+# being reused; 0 closes them at the end of each request. Pool connections
+# with pgbouncer rather than raising this under uvicorn.
+CONN_MAX_AGE = int(os.environ.get('CONN_MAX_AGE', '0'))
+
 # Database configuration
 if HAS_DJ_DATABASE_URL and os.environ.get('DATABASE_URL'):
     # Use dj_database_url if available and DATABASE_URL is set (production)
     DATABASES = {
-        'default': dj_database_url.config(conn_max_age=600)
+        'default': dj_database_url.config(conn_max_age=CONN_MAX_AGE)
     }
 else:
     # Use SQLite for local development
@@ -161,6 +172,110 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 
+# Transaction list page size (keyset pagination)
+TRANSACTIONS_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_PAGE_SIZE', '50'))
+# Transaction table rows are formatted in Python (transactions/templatetags/transaction_tags.py)
+# from transactions/transaction_row.html unless this is False, when the
+# transactions/transaction_rows.html loop renders them
+TRANSACTION_ROWS_COMPILED = os.environ.get('TRANSACTION_ROWS_COMPILED', 'True') == 'True'
+
+# Rows inserted per database transaction by the CSV importer
+TRANSACTION_IMPORT_BATCH_SIZE = int(os.environ.get('TRANSACTION_IMPORT_BATCH_SIZE', '20000'))
+
+# Async views (home, budgets, insights) run their independent queries in
+# parallel threads on PostgreSQL; always sequential on SQLite (see mydjango/concurrency.py)
+ASYNC_CONCURRENT_QUERIES = os.environ.get('ASYNC_CONCURRENT_QUERIES', 'True') == 'True'
+
+# Insight job queue (consumed by `manage.py run_insight_worker`)
+INSIGHT_WORKER_CONCURRENCY = int(os.environ.get('INSIGHT_WORKER_CONCURRENCY', '1'))
+INSIGHT_JOB_MAX_ATTEMPTS = int(os.environ.get('INSIGHT_JOB_MAX_ATTEMPTS', '5'))
+INSIGHT_JOB_RETRY_BACKOFF = int(os.environ.get('INSIGHT_JOB_RETRY_BACKOFF', '30'))  # seconds, doubled per attempt
+INSIGHT_JOB_LOCK_TIMEOUT = int(os.environ.get('INSIGHT_JOB_LOCK_TIMEOUT', '600'))  # seconds
+# Run jobs inline instead of queueing them (handy for local development without a worker)
+INSIGHT_JOBS_EAGER = os.environ.get('INSIGHT_JOBS_EAGER', 'False') == 'True'
+
+# Cache for computed page payloads (see transactions/caching.py).
+# CACHE_BACKEND is 'locmem' (per process), 'file' (shared by all processes
+# on the host, e.g. gunicorn workers), 'redis' or 'memcached' (shared by
+# every host; CACHE_LOCATION is the server URL or address, REDIS_URL by
+# default for redis). Entries of the locmem and file caches beyond
+# CACHE_MAX_ENTRIES are culled, 1/CACHE_CULL_FREQUENCY of them at a time.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': 'smart-finance-tracker',
+    'file': str(BASE_DIR / '.cache'),
+    'redis': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    'memcached': '127.0.0.1:11211',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', '300')),
+    }
+}
+if CACHE_BACKEND in ('locmem', 'file'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '5000')),
+        'CULL_FREQUENCY': int(os.environ.get('CACHE_CULL_FREQUENCY', '3')),
+    }
+# Whether the web workers and the insight worker all see the same cache.
+# Cached payloads are only served from a shared cache: with a per-process
+# one, version bumps made by other processes would never reach them. The
+# file cache is shared when every process runs on one host; set
+# CACHE_SHARED=True to rely on that.
+#
+# NOTE: with the default locmem backend (and with file unless CACHE_SHARED
+# is set) page payloads are NOT cached at all; the dashboard, budgets and
+# insights pages are computed on every request. Use CACHE_BACKEND=redis or
+# memcached in production, or CACHE_SHARED=True for a single process.
+CACHE_SHARED = os.environ.get('CACHE_SHARED', str(CACHE_BACKEND in ('redis', 'memcached'))) == 'True'
+# Seconds a cached dashboard/budget/insight payload may be served
+CACHE_PAYLOAD_TIMEOUT = int(os.environ.get('CACHE_PAYLOAD_TIMEOUT', '300'))
+
+# With a shared cache, the logged-in user is cached between requests for
+# AUTH_USER_CACHE_TIMEOUT seconds (0 disables it) and dropped on save, delete
+# and logout (users/backends.py). A per-process cache would keep serving a
+# user other processes have changed, so the database is read instead.
+if CACHE_SHARED:
+    AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+else:
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', '60'))
+
+# Session storage. SESSION_BACKEND is 'db' (a query per request), 'cached_db'
+# (read from the cache, written through to the database) or 'signed_cookies'
+# (no server-side storage; sessions cannot be revoked before they expire).
+# cached_db, the default with a shared cache, needs one: with a per-process
+# cache, a session deleted by another process stays valid in this one.
+SESSION_BACKENDS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cached_db' if CACHE_SHARED else 'db')
+SESSION_ENGINE = SESSION_BACKENDS[SESSION_BACKEND]
+
+# Per-request SQL/template timing with Server-Timing headers (mydjango/middleware.py)
+REQUEST_INSTRUMENTATION = os.environ.get('REQUEST_INSTRUMENTATION', 'False') == 'True'
+# Requests slower than this are logged with their slowest SQL statements
+REQUEST_SLOW_THRESHOLD_MS = int(os.environ.get('REQUEST_SLOW_THRESHOLD_MS', '500'))
+REQUEST_SLOW_QUERY_COUNT = int(os.environ.get('REQUEST_SLOW_QUERY_COUNT', '5'))
+# Statements run this many times in one request are logged as possible N+1 queries
+REQUEST_REPEATED_QUERY_THRESHOLD = int(os.environ.get('REQUEST_REPEATED_QUERY_THRESHOLD', '5'))
+
+# Metrics exposed to staff at /metrics. Each process writes its totals to
+# METRICS_DIR (shared by all workers on the host) every METRICS_FLUSH_INTERVAL seconds.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
 # WhiteNoise configuration for serving static files (production only)
 if not DEBUG:
     try:
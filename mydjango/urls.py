@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics, name='metrics'),
     path('users/', include('users.urls')),
     path('insights/', include('insights.urls')),
     path('', include('transactions.urls')),
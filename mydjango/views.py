@@ -0,0 +1,12 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
+
+from .metrics import collect, render_exposition
+
+
+@staff_member_required
+def metrics(request):
+    """
+    Metrics of all processes in the Prometheus text exposition format.
+    """
+    return HttpResponse(render_exposition(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,179 @@
+"""
+Balance over time, built from the daily rollup table.
+
+A series is one grouped query: the net (income minus expenses) of each day,
+week or month, with the running balance added up by a window function
+(``SUM(...) OVER (ORDER BY bucket)``) in the database.
+
+The balance brought forward into a range comes from the BalanceCheckpoint
+of its month plus the days of that month before the range starts, so a
+range late in a long history does not re-read the years before it.
+Checkpoints are created the first time they are needed, from the nearest
+earlier checkpoint, and ``apply_deltas`` deletes those after a changed day.
+
+A reader may compute checkpoints from rollups that miss a concurrent write
+and only save them after that write deleted the old ones. The user's
+UserDataVersion row orders the two: writers bump it before deleting
+checkpoints, and readers save theirs only if it still holds the version
+they saw before reading the rollups. Both lock the row, so a reader waits
+for an uncommitted writer and then finds a newer version.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Func, Sum, When, Window
+from django.db.models.functions import Trunc
+
+from .models import BalanceCheckpoint, TransactionDailyRollup, UserDataVersion
+from .versioning import bump_data_version, ensure_data_version
+
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Span of a series when no start date is given
+DEFAULT_SPANS = {
+    'day': timedelta(days=90),
+    'week': timedelta(weeks=52),
+    'month': timedelta(days=2 * 365),
+}
+
+
+class _WindowSum(Func):
+    function = 'SUM'
+    window_compatible = True
+
+
+class RunningTotal(Window):
+    """
+    ``SUM(<aggregate>) OVER (ORDER BY ...)``: a running total over the rows
+    of a grouped query.
+    """
+
+    def __init__(self, aggregate, order_by):
+        super().__init__(_WindowSum(aggregate), order_by=order_by)
+
+    def get_group_by_cols(self):
+        # Computed after grouping; Django would otherwise add it to GROUP BY
+        return []
+
+
+def signed_total():
+    """Rollup total counted positive for income and negative for expenses."""
+    return Case(When(type='expense', then=-F('total')), default=F('total'))
+
+
+def bucket_start(day, granularity):
+    """The first day of the day, week (Monday) or month containing ``day``."""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_month(month):
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _running_totals(user_id, granularity, start=None, end=None):
+    """
+    ``{'bucket', 'net', 'running'}`` rows of a user's rollups from ``start``
+    to ``end`` (inclusive, either open), one per bucket with transactions.
+    """
+    rollups = TransactionDailyRollup.objects.filter(user_id=user_id)
+    if start is not None:
+        rollups = rollups.filter(day__gte=start)
+    if end is not None:
+        rollups = rollups.filter(day__lte=end)
+    return (
+        rollups
+        .annotate(bucket=Trunc('day', granularity))
+        .values('bucket')
+        .annotate(
+            net=Sum(signed_total()),
+            running=RunningTotal(Sum(signed_total()), order_by=F('bucket').asc()),
+        )
+        .order_by('bucket')
+    )
+
+
+def checkpoint_balance(user_id, month):
+    """
+    Balance of everything dated before ``month`` (a first of month).
+
+    Starts from the nearest checkpoint at or before ``month`` and saves the
+    missing ones between it and ``month`` on the way.
+    """
+    latest = (
+        BalanceCheckpoint.objects.filter(user_id=user_id, month__lte=month)
+        .order_by('-month').first()
+    )
+    if latest is not None and latest.month == month:
+        return latest.balance
+
+    version = ensure_data_version(user_id)
+    base = latest.balance if latest is not None else Decimal('0')
+    balance = base
+    checkpoints = []
+    for row in _running_totals(user_id, 'month', latest.month if latest else None, month - timedelta(days=1)):
+        balance = base + row['running']
+        checkpoints.append(BalanceCheckpoint(user_id=user_id, month=next_month(row['bucket']), balance=balance))
+    if not checkpoints or checkpoints[-1].month != month:
+        checkpoints.append(BalanceCheckpoint(user_id=user_id, month=month, balance=balance))
+    with transaction.atomic():
+        # A no-op UPDATE that locks the version row, or matches nothing if a
+        # write committed since the rollups were read
+        if UserDataVersion.objects.filter(user_id=user_id, version=version).update(version=F('version')):
+            BalanceCheckpoint.objects.bulk_create(checkpoints, ignore_conflicts=True)
+    return balance
+
+
+def opening_balance(user_id, day):
+    """Balance of everything dated before ``day``."""
+    month = day.replace(day=1)
+    balance = checkpoint_balance(user_id, month)
+    if day > month:
+        balance += (
+            TransactionDailyRollup.objects
+            .filter(user_id=user_id, day__gte=month, day__lt=day)
+            .aggregate(net=Sum(signed_total()))['net']
+        ) or 0
+    return balance
+
+
+def invalidate_checkpoints(user_id, day):
+    """
+    Delete a user's checkpoints that include ``day``, after bumping the
+    user's data version so readers do not save checkpoints computed before
+    this write (see the module docstring).
+    """
+    bump_data_version(user_id, create=False)
+    BalanceCheckpoint.objects.filter(user_id=user_id, month__gt=day).delete()
+
+
+def balance_series(user_id, granularity='day', start=None, end=None, today=None):
+    """
+    A user's balance at the end of each ``granularity`` bucket from
+    ``start`` to ``end`` (default: ``DEFAULT_SPANS`` ending today), as
+    parallel lists ready for JSON. Buckets without transactions are left out;
+    the balance is unchanged across them.
+    """
+    end = end or today or date.today()
+    start = bucket_start(start or end - DEFAULT_SPANS[granularity], granularity)
+    opening = opening_balance(user_id, start)
+
+    dates, net, balance = [], [], []
+    for row in _running_totals(user_id, granularity, start, end):
+        dates.append(row['bucket'].isoformat())
+        net.append(round(float(row['net']), 2))
+        balance.append(round(float(opening + row['running']), 2))
+    return {
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'opening_balance': round(float(opening), 2),
+        'dates': dates,
+        'net': net,
+        'balance': balance,
+    }
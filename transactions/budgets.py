@@ -0,0 +1,108 @@
+"""
+Budget evaluation service.
+
+Computes spending against every weekly and monthly budget of a user (or of a
+batch of users) from a single grouped query over the daily rollups, so the
+cost does not grow with the number of budgets.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Q, Sum
+
+from mydjango.concurrency import run_queries
+
+from .categories import category_registry
+from .models import Budget, TransactionDailyRollup
+
+
+def period_starts(today=None):
+    """
+    Return the first day counted towards each budget period.
+    Weekly budgets cover the last 7 days, monthly budgets the current month.
+    """
+    today = today or date.today()
+    return {
+        'weekly': today - timedelta(days=7),
+        'monthly': today.replace(day=1),
+    }
+
+
+def evaluate_budgets(user, today=None):
+    """
+    Evaluate all of ``user``'s budgets.
+
+    Returns a list of dictionaries with the budget, the amount spent in its
+    current period, the remaining amount, the (uncapped) percentage used and
+    whether it is over budget.
+    """
+    return evaluate_budgets_for_users([user.id], today)[user.id]
+
+
+def evaluate_budgets_for_users(user_ids, today=None):
+    """
+    Evaluate the budgets of many users with the same two queries.
+    Returns ``{user_id: statuses}`` (see ``evaluate_budgets``).
+    """
+    budgets = _load_budgets(user_ids)
+    if not budgets:
+        return {user_id: [] for user_id in user_ids}
+    spending = _load_spending(
+        {budget.user_id for budget in budgets},
+        period_starts(today),
+        category_ids={budget.category_id for budget in budgets},
+    )
+    return _statuses(user_ids, budgets, spending)
+
+
+async def aevaluate_budgets(user, today=None):
+    """
+    Async ``evaluate_budgets``: the budgets and the spending of all the
+    user's expense categories are loaded concurrently.
+    """
+    budgets, spending = await run_queries(
+        lambda: _load_budgets([user.id]),
+        lambda: _load_spending([user.id], period_starts(today)),
+    )
+    return _statuses([user.id], budgets, spending)[user.id]
+
+
+def _load_budgets(user_ids):
+    return category_registry.attach(list(Budget.objects.filter(user_id__in=list(user_ids))))
+
+
+def _load_spending(user_ids, starts, category_ids=None):
+    """
+    Weekly and monthly expense totals keyed by ``(user_id, category_id)``.
+    """
+    rows = TransactionDailyRollup.objects.filter(
+        user_id__in=list(user_ids),
+        type='expense',
+        day__gte=min(starts.values()),
+    )
+    if category_ids is not None:
+        rows = rows.filter(category_id__in=category_ids)
+    rows = (
+        rows
+        .values('user_id', 'category_id')
+        .annotate(
+            weekly=Sum('total', filter=Q(day__gte=starts['weekly'])),
+            monthly=Sum('total', filter=Q(day__gte=starts['monthly'])),
+        )
+        .order_by()
+    )
+    return {(row['user_id'], row['category_id']): row for row in rows}
+
+
+def _statuses(user_ids, budgets, spending):
+    results = {user_id: [] for user_id in user_ids}
+    for budget in budgets:
+        spent = (spending.get((budget.user_id, budget.category_id)) or {}).get(budget.period) or 0
+        percentage = (spent / budget.limit_amount * 100) if budget.limit_amount > 0 else 0
+        results[budget.user_id].append({
+            'budget': budget,
+            'spent': spent,
+            'remaining': budget.limit_amount - spent,
+            'percentage': percentage,
+            'over_budget': spent > budget.limit_amount,
+        })
+    return results
@@ -0,0 +1,215 @@
+"""
+Versioned caching of computed page payloads.
+
+Payload keys embed version counters kept in the cache itself:
+
+* a per-user data version, bumped by Transaction and Budget writes,
+* a per-user insights version, bumped by SpendingInsight writes,
+* a global categories version, bumped by Category writes.
+
+Bumping a version makes every key built from the old value unreachable;
+stale entries are then evicted by the backend's size-bounded culling
+(``MAX_ENTRIES``/``CULL_FREQUENCY``). Versions start from a timestamp, so a
+version key evicted and recreated never collides with older payload keys.
+
+Payloads are only cached when the cache is shared by every process
+(``CACHE_SHARED``); otherwise they are built on every request.
+"""
+import threading
+import time
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+USER_NAMESPACE = 'data'
+INSIGHTS_NAMESPACE = 'insights'
+CATEGORIES_VERSION_KEY = 'version:categories'
+STATS_PREFIX = 'cache-stats'
+
+
+def _user_version_key(user_id, namespace=USER_NAMESPACE):
+    return f'version:{namespace}:{user_id}'
+
+
+def _get_versions(keys):
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            initial = time.time_ns()
+            cache.add(key, initial, timeout=None)
+            values[key] = cache.get(key, initial)
+    return [values[key] for key in keys]
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Missing (never set or evicted): start from a fresh timestamp
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def _bump(key):
+    """
+    Bump a version now, so reads later in the same transaction miss, and
+    again on commit, so a payload built by a concurrent request from the
+    pre-commit data is not served afterwards.
+    """
+    _incr(key)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incr(key))
+
+
+def bump_user_version(user_id, namespace=USER_NAMESPACE):
+    """Invalidate all cached payloads of a user in ``namespace``."""
+    _bump(_user_version_key(user_id, namespace))
+
+
+def bump_categories_version():
+    """Invalidate every cached payload that embeds category data."""
+    _bump(CATEGORIES_VERSION_KEY)
+
+
+def categories_version():
+    return _get_versions([CATEGORIES_VERSION_KEY])[0]
+
+
+class _Counters:
+    """
+    Hit/miss counters kept in-process and flushed to the shared cache in
+    batches, so recording a hit does not cost a cache write per request.
+    """
+
+    FLUSH_EVERY = 50
+    FLUSH_INTERVAL = 10  # seconds
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.events = 0
+        self.last_flush = time.monotonic()
+
+    def record(self, name, outcome):
+        with self.lock:
+            key = f'{STATS_PREFIX}:{name}:{outcome}'
+            self.pending[key] = self.pending.get(key, 0) + 1
+            self.events += 1
+            due = (self.events >= self.FLUSH_EVERY
+                   or time.monotonic() - self.last_flush >= self.FLUSH_INTERVAL)
+            if not due:
+                return
+            pending, self.pending = self.pending, {}
+            self.events = 0
+            self.last_flush = time.monotonic()
+        self._write(pending)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.events = 0
+            self.last_flush = time.monotonic()
+        self._write(pending)
+
+    @staticmethod
+    def _write(pending):
+        for key, delta in pending.items():
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                if not cache.add(key, delta, timeout=None):
+                    cache.incr(key, delta)
+        if pending:
+            names = set(cache.get(f'{STATS_PREFIX}:names') or ())
+            names.update(key.split(':')[1] for key in pending)
+            cache.set(f'{STATS_PREFIX}:names', sorted(names), timeout=None)
+
+
+_counters = _Counters()
+
+
+def cache_stats():
+    """
+    Return hit/miss counts and hit ratio per payload name, aggregated across
+    every process that shares the cache backend.
+    """
+    _counters.flush()
+    names = cache.get(f'{STATS_PREFIX}:names') or []
+    stats = {}
+    for name in names:
+        counts = cache.get_many([f'{STATS_PREFIX}:{name}:hit', f'{STATS_PREFIX}:{name}:miss'])
+        hits = counts.get(f'{STATS_PREFIX}:{name}:hit', 0)
+        misses = counts.get(f'{STATS_PREFIX}:{name}:miss', 0)
+        total = hits + misses
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+    return stats
+
+
+def reset_cache_stats():
+    """Zero the hit/miss counters."""
+    with _counters.lock:
+        _counters.pending = {}
+        _counters.events = 0
+    names = cache.get(f'{STATS_PREFIX}:names') or []
+    cache.delete_many(
+        [f'{STATS_PREFIX}:{name}:{outcome}' for name in names for outcome in ('hit', 'miss')]
+        + [f'{STATS_PREFIX}:names']
+    )
+
+
+def _payload_key(name, user_id, namespaces):
+    version_keys = [_user_version_key(user_id, namespace) for namespace in namespaces]
+    versions = _get_versions(version_keys + [CATEGORIES_VERSION_KEY])
+    return ':'.join(['payload', name, str(user_id), date.today().isoformat()] + [str(v) for v in versions])
+
+
+def _lookup(name, user_id, namespaces):
+    key = _payload_key(name, user_id, namespaces)
+    payload = cache.get(key)
+    _counters.record(name, 'miss' if payload is None else 'hit')
+    return key, payload
+
+
+def _timeout(timeout):
+    return getattr(settings, 'CACHE_PAYLOAD_TIMEOUT', 300) if timeout is None else timeout
+
+
+def payloads_cached():
+    """Whether payloads are cached (see ``CACHE_SHARED``)."""
+    return getattr(settings, 'CACHE_SHARED', False)
+
+
+def cached_payload(name, user_id, builder, namespaces=(USER_NAMESPACE,), timeout=None):
+    """
+    Return the payload ``name`` for a user, calling ``builder()`` on a miss.
+
+    The key combines the user's versions for ``namespaces``, the categories
+    version and today's date (payloads depend on rolling date windows).
+    """
+    if not payloads_cached():
+        return builder()
+    key, payload = _lookup(name, user_id, namespaces)
+    if payload is None:
+        payload = builder()
+        cache.set(key, payload, _timeout(timeout))
+    return payload
+
+
+async def acached_payload(name, user_id, builder, namespaces=(USER_NAMESPACE,), timeout=None):
+    """
+    Async ``cached_payload``; ``builder`` is a coroutine function.
+    """
+    if not payloads_cached():
+        return await builder()
+    key, payload = await sync_to_async(_lookup)(name, user_id, namespaces)
+    if payload is None:
+        payload = await builder()
+        await sync_to_async(cache.set)(key, payload, _timeout(timeout))
+    return payload
@@ -0,0 +1,95 @@
+"""
+In-process registry of the global Category table.
+
+Categories are few and rarely change, so each worker process keeps them in
+memory instead of querying them on every request. The registry is tagged
+with a categories version which every Category write bumps; a worker that
+sees a different version reloads the table on its next lookup. The version
+is read from the cache when it is shared by every process (``CACHE_SHARED``,
+see ``caching.py``), so in steady state a lookup costs one cache read and no
+database queries. Otherwise it is read from the CategoryVersion row, once
+per request (and on every lookup outside requests).
+
+Registry instances are shared between requests and must be treated as
+read-only.
+"""
+import threading
+
+from asgiref.local import Local
+from django.conf import settings
+
+from .caching import categories_version
+from .models import Category
+from .versioning import get_categories_data_version
+
+
+class CategoryRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (version, categories, by_id, by_type), swapped as one object so
+        # readers never see a half-built snapshot
+        self._snapshot = (None, [], {}, {})
+        # Database version read during the current request (context-local)
+        self._request = Local()
+
+    def begin_request(self):
+        self._request.active = True
+        self._request.version = None
+
+    def end_request(self):
+        self._request.active = False
+        self._request.version = None
+
+    def forget_version(self):
+        """Re-read the database version on the next lookup (after a Category write)."""
+        self._request.version = None
+
+    def _version(self):
+        if getattr(settings, 'CACHE_SHARED', False):
+            return categories_version()
+        if not getattr(self._request, 'active', False):
+            return get_categories_data_version()
+        if self._request.version is None:
+            self._request.version = get_categories_data_version()
+        return self._request.version
+
+    def _current(self):
+        version = self._version()
+        snapshot = self._snapshot
+        if snapshot[0] == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot[0] != version:
+                categories = list(Category.objects.order_by('id'))
+                by_type = {}
+                for category in categories:
+                    by_type.setdefault(category.type, []).append(category)
+                self._snapshot = (version, categories, {c.pk: c for c in categories}, by_type)
+            return self._snapshot
+
+    def all(self, type=None):
+        """Return all categories (or those of one type) ordered by id."""
+        _, categories, _, by_type = self._current()
+        if type is None:
+            return list(categories)
+        return list(by_type.get(type, ()))
+
+    def get(self, pk):
+        """Return the category with primary key ``pk``, or None."""
+        return self._current()[2].get(pk)
+
+    def attach(self, objects, field='category'):
+        """
+        Fill the ``field`` foreign key cache of each object from the registry,
+        so templates reading ``obj.category`` run no query.
+        """
+        by_id = self._current()[2]
+        for obj in objects:
+            model_field = obj._meta.get_field(field)
+            category = by_id.get(getattr(obj, model_field.attname))
+            if category is not None:
+                model_field.set_cached_value(obj, category)
+        return objects
+
+
+category_registry = CategoryRegistry()
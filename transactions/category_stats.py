@@ -0,0 +1,382 @@
+"""
+Maintenance of the UserCategoryStats table.
+
+Every Transaction write is folded into the row of its (user, category, type)
+in the same database transaction as its rollup deltas (see rollups.py):
+
+* count, total and the spread of the amounts (spread.py) take each added
+  or removed amount;
+* the extremes (smallest and largest amount, first and last date) only need
+  the change when it adds rows; removing a row holding one of them re-reads
+  that category's transactions;
+* the month and week totals are adjusted when the stored period is the
+  current one and otherwise re-read from the daily rollups (rollover).
+
+Readers roll stale periods over as well (``current_stats``), and
+``check_stats`` compares the table with the raw transactions and repairs
+any drift.
+"""
+import copy
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+
+from .balances import next_month
+from .models import Transaction, TransactionDailyRollup, UserCategoryStats
+from .spread import add_amounts, exact_spreads, remove_amount
+
+
+PERIOD_FIELDS = ('month', 'month_total', 'week', 'week_total')
+STAT_FIELDS = ('count', 'total', 'min_amount', 'max_amount', 'first_date', 'last_date') + PERIOD_FIELDS
+# Not compared by check_stats: running estimates differ from exact ones
+SPREAD_FIELDS = ('m2', 'sketch')
+
+
+def current_periods(today=None):
+    """First days of the current month and (Monday to Sunday) week."""
+    today = today or date.today()
+    return today.replace(day=1), today - timedelta(days=today.weekday())
+
+
+class StatsChange:
+    """
+    Effect of transaction writes on one statistics row: the amounts added
+    and removed, signed amounts per day, and the extremes of the rows added
+    and removed.
+    """
+
+    def __init__(self):
+        self.added_amounts = []
+        self.removed_amounts = []
+        self.added_days = []
+        self.removed_days = []
+        self.days = defaultdict(Decimal)
+
+    def record(self, day, amount, sign):
+        if sign > 0:
+            self.added_amounts.append(amount)
+            self.added_days.append(day)
+        else:
+            self.removed_amounts.append(amount)
+            self.removed_days.append(day)
+        self.days[day] += sign * amount
+
+    @staticmethod
+    def _extremes(amounts, days):
+        return [min(amounts), max(amounts), min(days), max(days)] if amounts else None
+
+    @property
+    def added(self):
+        """``[smallest, largest amount, first, last day]`` of the added rows, or None."""
+        return self._extremes(self.added_amounts, self.added_days)
+
+    @property
+    def removed(self):
+        """Like ``added``, for the removed rows."""
+        return self._extremes(self.removed_amounts, self.removed_days)
+
+    def period_total(self, start, end):
+        return sum((amount for day, amount in self.days.items() if start <= day < end), Decimal('0'))
+
+
+def collect_changes(states, sign=1, changes=None):
+    """
+    Accumulate statistics changes from ``(user_id, category_id, type, date,
+    amount)`` tuples, like ``rollups.collect_deltas``.
+    """
+    if changes is None:
+        changes = defaultdict(StatsChange)
+    for user_id, category_id, type_, day, amount in states:
+        if not isinstance(amount, Decimal):
+            amount = Decimal(amount)
+        changes[(user_id, category_id, type_)].record(day, amount, sign)
+    return changes
+
+
+def _merge_extremes(row, added):
+    low, high, first, last = added
+    row.min_amount = low if row.min_amount is None else min(row.min_amount, low)
+    row.max_amount = high if row.max_amount is None else max(row.max_amount, high)
+    row.first_date = first if row.first_date is None else min(row.first_date, first)
+    row.last_date = last if row.last_date is None else max(row.last_date, last)
+
+
+def _lost_extremes(row, removed):
+    """Whether removed rows may have held one of ``row``'s extremes."""
+    low, high, first, last = removed
+    return (
+        row.min_amount is None or low <= row.min_amount or high >= row.max_amount
+        or first <= row.first_date or last >= row.last_date
+    )
+
+
+def _key_filter(keys):
+    """Narrow a query down to the users and categories of ``keys`` (matched exactly by the caller)."""
+    return Q(user_id__in={key[0] for key in keys}, category_id__in={key[1] for key in keys})
+
+
+def _read_extremes(keys):
+    rows = (
+        Transaction.objects.filter(_key_filter(keys))
+        .values('user_id', 'category_id', 'type')
+        .annotate(low=Min('amount'), high=Max('amount'), first=Min('date'), last=Max('date'))
+        .order_by()
+    )
+    found = {(row['user_id'], row['category_id'], row['type']): row for row in rows}
+    return {key: found.get(key) for key in keys}
+
+
+def _read_period_totals(keys, month, week):
+    rows = (
+        TransactionDailyRollup.objects
+        .filter(_key_filter(keys), day__gte=min(month, week), day__lt=max(next_month(month), week + timedelta(days=7)))
+        .values('user_id', 'category_id', 'type')
+        .annotate(
+            month_total=Sum('total', filter=Q(day__gte=month, day__lt=next_month(month))),
+            week_total=Sum('total', filter=Q(day__gte=week, day__lt=week + timedelta(days=7))),
+        )
+        .order_by()
+    )
+    found = {(row['user_id'], row['category_id'], row['type']): row for row in rows}
+    return {key: found.get(key) or {} for key in keys}
+
+
+def _roll_over(rows, month, week):
+    """Re-read the month and week totals of ``rows`` whose periods are stale (in memory)."""
+    stale = {(row.user_id, row.category_id, row.type): row for row in rows if row.month != month or row.week != week}
+    if not stale:
+        return []
+    for key, totals in _read_period_totals(stale, month, week).items():
+        row = stale[key]
+        row.month, row.month_total = month, totals.get('month_total') or Decimal('0')
+        row.week, row.week_total = week, totals.get('week_total') or Decimal('0')
+    return list(stale.values())
+
+
+def _locked_rows(keys):
+    rows = UserCategoryStats.objects.select_for_update().filter(_key_filter(keys))
+    rows = {(row.user_id, row.category_id, row.type): row for row in rows}
+    return {key: row for key, row in rows.items() if key in keys}
+
+
+def apply_changes(changes, today=None):
+    """
+    Apply accumulated changes to the statistics table, after the matching
+    rollup deltas. Rows whose count drops to zero are removed.
+
+    Returns ``{key: row}`` with a copy of each row that gains amounts as it
+    was before they were added, e.g. to judge a new amount against the
+    others of its category.
+    """
+    if not changes:
+        return {}
+    month, week = current_periods(today)
+    before = {}
+    with transaction.atomic(savepoint=False):
+        rows = _locked_rows(changes)
+        # Rows are only created for additions, so cascading deletes never recreate them
+        missing = [key for key, change in changes.items() if change.added and key not in rows]
+        if missing:
+            UserCategoryStats.objects.bulk_create(
+                [UserCategoryStats(user_id=user_id, category_id=category_id, type=type_)
+                 for user_id, category_id, type_ in missing],
+                ignore_conflicts=True,
+            )
+            rows.update(_locked_rows(missing))
+        rows = list(rows.values())
+
+        changed, emptied, lost = [], [], {}
+        for row in rows:
+            key = (row.user_id, row.category_id, row.type)
+            change = changes[key]
+            added, removed = change.added, change.removed
+            for amount in change.removed_amounts:
+                remove_amount(row, amount)
+            if change.added_amounts:
+                before[key] = copy.copy(row)
+                before[key].sketch = copy.deepcopy(row.sketch)
+            if change.added_amounts:
+                add_amounts(row, change.added_amounts)
+            if row.count <= 0:
+                emptied.append(row.pk)
+                continue
+            if removed and _lost_extremes(row, removed):
+                lost[key] = row
+            elif added:
+                _merge_extremes(row, added)
+            if row.month == month:
+                row.month_total += change.period_total(month, next_month(month))
+            if row.week == week:
+                row.week_total += change.period_total(week, week + timedelta(days=7))
+            changed.append(row)
+
+        for key, extremes in _read_extremes(lost).items():
+            row = lost[key]
+            if extremes is not None:
+                row.min_amount, row.max_amount = extremes['low'], extremes['high']
+                row.first_date, row.last_date = extremes['first'], extremes['last']
+        # Rollups are already updated, so rolled over totals include the change
+        _roll_over(changed, month, week)
+
+        UserCategoryStats.objects.bulk_update(changed, STAT_FIELDS + SPREAD_FIELDS)
+        if emptied:
+            UserCategoryStats.objects.filter(pk__in=emptied).delete()
+    return before
+
+
+def record_change(old_state=None, new_state=None):
+    """
+    Update statistics for a single transaction write (see
+    ``rollups.record_change``). Returns the statistics row of ``new_state``
+    as it was before its amount was added, or None.
+    """
+    changes = None
+    if old_state is not None:
+        changes = collect_changes([old_state], sign=-1, changes=changes)
+    if new_state is not None:
+        changes = collect_changes([new_state], sign=1, changes=changes)
+    before = apply_changes(changes)
+    return before.get(new_state[:3]) if new_state is not None else None
+
+
+def current_stats(user_ids, today=None, **filters):
+    """
+    Statistics rows of ``user_ids`` (narrowed down by ``filters``) with
+    their month and week totals current. Stale periods are rolled over and
+    saved unless a writer got to them first.
+    """
+    month, week = current_periods(today)
+    rows = list(UserCategoryStats.objects.filter(user_id__in=list(user_ids), **filters))
+    stale = {row.pk: (row.month, row.week) for row in rows if row.month != month or row.week != week}
+    for row in _roll_over(rows, month, week):
+        old_month, old_week = stale[row.pk]
+        UserCategoryStats.objects.filter(pk=row.pk, month=old_month, week=old_week).update(
+            month=row.month, month_total=row.month_total, week=row.week, week_total=row.week_total,
+        )
+    return rows
+
+
+def month_totals(user_ids, today=None):
+    """``{user_id: {'income': ..., 'expenses': ...}}`` dated in the current month."""
+    totals = {user_id: {'income': Decimal('0'), 'expenses': Decimal('0')} for user_id in user_ids}
+    for row in current_stats(user_ids, today):
+        totals[row.user_id]['income' if row.type == 'income' else 'expenses'] += row.month_total
+    return totals
+
+
+def expected_stats(user_ids=None, today=None):
+    """
+    Statistics computed from the raw transactions, as
+    ``{(user_id, category_id, type): {field: value}}``.
+    """
+    month, week = current_periods(today)
+    transactions = Transaction.objects.all()
+    if user_ids is not None:
+        transactions = transactions.filter(user_id__in=list(user_ids))
+    rows = (
+        transactions
+        .values('user_id', 'category_id', 'type')
+        .annotate(
+            count=Count('id'),
+            total=Sum('amount'),
+            min_amount=Min('amount'),
+            max_amount=Max('amount'),
+            first_date=Min('date'),
+            last_date=Max('date'),
+            month_total=Sum('amount', filter=Q(date__gte=month, date__lt=next_month(month)), default=Decimal('0')),
+            week_total=Sum('amount', filter=Q(date__gte=week, date__lt=week + timedelta(days=7)), default=Decimal('0')),
+        )
+        .order_by()
+    )
+    cent = Decimal('0.01')
+    expected = {}
+    for row in rows:
+        # SQLite sums decimals as floats
+        for field in ('total', 'month_total', 'week_total'):
+            row[field] = row[field].quantize(cent)
+        key = (row.pop('user_id'), row.pop('category_id'), row.pop('type'))
+        expected[key] = {**row, 'month': month, 'week': week}
+    return expected
+
+
+def _exact_spreads(transactions):
+    rows = transactions.values_list('user_id', 'category_id', 'type', 'amount').iterator()
+    return exact_spreads(((user_id, category_id, type_), amount) for user_id, category_id, type_, amount in rows)
+
+
+def _spread_fields(spreads, key):
+    m2, sketch = spreads.get(key, (0.0, {}))
+    return {'m2': m2, 'sketch': sketch}
+
+
+def check_stats(user_ids=None, repair=False, today=None):
+    """
+    Compare the statistics of every user (or of ``user_ids``) with the raw
+    transactions. Period totals are only compared for current periods.
+    Returns ``(key, field, stored, expected)`` tuples, with None for a missing
+    or extra row; ``repair`` rewrites the drifted rows.
+    """
+    month, week = current_periods(today)
+    expected = expected_stats(user_ids, today)
+    stored = UserCategoryStats.objects.all()
+    if user_ids is not None:
+        stored = stored.filter(user_id__in=list(user_ids))
+    stored = {(row.user_id, row.category_id, row.type): row for row in stored}
+
+    drift = []
+    for key, values in expected.items():
+        row = stored.get(key)
+        if row is None:
+            drift.append((key, None, None, values['count']))
+            continue
+        current = row.month == month and row.week == week
+        for field in STAT_FIELDS:
+            if field in PERIOD_FIELDS and not current:
+                continue
+            if getattr(row, field) != values[field]:
+                drift.append((key, field, getattr(row, field), values[field]))
+    drift.extend((key, None, row.count, None) for key, row in stored.items() if key not in expected)
+
+    if repair and drift:
+        keys = {key for key, *_ in drift}
+        spreads = _exact_spreads(Transaction.objects.filter(_key_filter(keys)))
+        with transaction.atomic():
+            UserCategoryStats.objects.bulk_create(
+                [
+                    UserCategoryStats(user_id=key[0], category_id=key[1], type=key[2], **expected[key],
+                                      **_spread_fields(spreads, key))
+                    for key in keys if key in expected
+                ],
+                update_conflicts=True,
+                unique_fields=['user', 'category', 'type'],
+                update_fields=STAT_FIELDS + SPREAD_FIELDS,
+            )
+            UserCategoryStats.objects.filter(pk__in=[stored[key].pk for key in keys if key not in expected]).delete()
+    return drift
+
+
+def rebuild_stats(user_ids=None, today=None):
+    """
+    Recompute statistics from the raw transactions, of every user or only
+    ``user_ids``. Returns the number of rows written.
+    """
+    rows = UserCategoryStats.objects.all()
+    transactions = Transaction.objects.all()
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=list(user_ids))
+        transactions = transactions.filter(user_id__in=list(user_ids))
+    spreads = _exact_spreads(transactions)
+    with transaction.atomic():
+        rows.delete()
+        created = UserCategoryStats.objects.bulk_create(
+            [
+                UserCategoryStats(user_id=key[0], category_id=key[1], type=key[2], **values,
+                                  **_spread_fields(spreads, key))
+                for key, values in expected_stats(user_ids, today).items()
+            ],
+            batch_size=1000,
+        )
+    return len(created)
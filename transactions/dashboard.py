@@ -0,0 +1,120 @@
+"""
+Aggregation layer for the home dashboard.
+
+All-time totals and the category breakdown are read from the per-category
+statistics table and weekly buckets from the daily rollups of those weeks,
+with a fixed number of queries independent of how many categories or
+transactions a user has.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Q, Sum
+
+from mydjango.concurrency import run_queries
+
+from .categories import category_registry
+from .models import Transaction, TransactionDailyRollup, UserCategoryStats
+
+
+WEEK_COUNT = 4
+
+
+def week_ranges(today=None):
+    """
+    Return ``(start, end)`` date pairs for the four weekly chart buckets.
+    The last bucket starts on the first day of the current month.
+    """
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    ranges = []
+    for i in range(WEEK_COUNT):
+        week_start = month_start - timedelta(weeks=WEEK_COUNT - 1 - i)
+        ranges.append((week_start, week_start + timedelta(days=7)))
+    return ranges
+
+
+def summarize_totals(user, today=None):
+    """
+    Compute all-time totals and weekly income/expense buckets in two queries.
+    Returns ``(total_income, total_expense, weekly_data)``.
+    """
+    totals = UserCategoryStats.objects.filter(user=user).aggregate(
+        total_income=Sum('total', filter=Q(type='income')),
+        total_expense=Sum('total', filter=Q(type='expense')),
+    )
+
+    aggregates = {}
+    ranges = week_ranges(today)
+    for i, (week_start, week_end) in enumerate(ranges):
+        in_week = Q(day__gte=week_start, day__lt=week_end)
+        aggregates[f'week_{i}_income'] = Sum('total', filter=in_week & Q(type='income'))
+        aggregates[f'week_{i}_expense'] = Sum('total', filter=in_week & Q(type='expense'))
+    result = TransactionDailyRollup.objects.filter(
+        user=user, type__in=('income', 'expense'), day__gte=ranges[0][0], day__lt=ranges[-1][1],
+    ).aggregate(**aggregates)
+
+    weekly_data = [
+        {
+            'week': f'Week {i+1}',
+            'income': float(result[f'week_{i}_income'] or 0),
+            'expense': float(result[f'week_{i}_expense'] or 0),
+        }
+        for i in range(len(ranges))
+    ]
+    return totals['total_income'] or 0, totals['total_expense'] or 0, weekly_data
+
+
+def category_breakdown(user):
+    """
+    Expense totals per expense category, in one query over the statistics
+    table. Categories without spending are omitted; names come from the registry.
+    """
+    rows = (
+        UserCategoryStats.objects
+        .filter(user=user, type='expense', total__gt=0)
+        .values_list('category_id', 'total')
+        .order_by('category_id')
+    )
+    breakdown = []
+    for category_id, total in rows:
+        category = category_registry.get(category_id)
+        if category is not None and category.type == 'expense':
+            breakdown.append({'name': category.name, 'amount': float(total)})
+    return breakdown
+
+
+def recent_transactions(user, limit=5):
+    return category_registry.attach(list(
+        Transaction.objects.filter(user=user)
+        .order_by('-date', '-created_at')[:limit]
+    ))
+
+
+def _dashboard(totals, recent, breakdown):
+    total_income, total_expense, weekly_data = totals
+    return {
+        'total_income': total_income,
+        'total_expense': total_expense,
+        'balance': total_income - total_expense,
+        'weekly_data': weekly_data,
+        'category_data': breakdown,
+        'recent_transactions': recent,
+    }
+
+
+def build_dashboard(user, today=None):
+    """
+    Build the data shown on the home dashboard for ``user``.
+    """
+    return _dashboard(summarize_totals(user, today), recent_transactions(user), category_breakdown(user))
+
+
+async def abuild_dashboard(user, today=None):
+    """
+    Async ``build_dashboard``: its three independent queries run concurrently.
+    """
+    return _dashboard(*await run_queries(
+        lambda: summarize_totals(user, today),
+        lambda: recent_transactions(user),
+        lambda: category_breakdown(user),
+    ))
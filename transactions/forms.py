@@ -1,7 +1,58 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from .categories import category_registry
 from .models import Transaction, Category, Budget
 
 
+class CategoryChoiceIterator(ModelChoiceIterator):
+    """Yield category choices from the in-process registry."""
+    
+    def _categories(self):
+        return category_registry.all(self.field.category_type)
+    
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for category in self._categories():
+            yield self.choice(category)
+    
+    def __len__(self):
+        return len(self._categories()) + (1 if self.field.empty_label is not None else 0)
+    
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self._categories())
+
+
+class CategoryChoiceField(forms.ModelChoiceField):
+    """
+    Category select that renders and validates against the category
+    registry instead of querying the Category table.
+    """
+    iterator = CategoryChoiceIterator
+    
+    def __init__(self, category_type=None, **kwargs):
+        self.category_type = category_type
+        super().__init__(queryset=Category.objects.all(), **kwargs)
+    
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, Category):
+            value = value.pk
+        try:
+            category = category_registry.get(int(str(value)))
+        except (TypeError, ValueError):
+            category = None
+        if category is None or (self.category_type and category.type != self.category_type):
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return category
+
+
 class CategoryForm(forms.ModelForm):
     class Meta:
         model = Category
@@ -13,11 +64,12 @@ class CategoryForm(forms.ModelForm):
 
 
 class TransactionForm(forms.ModelForm):
+    category = CategoryChoiceField(widget=forms.Select(attrs={'class': 'form-select'}))
+    
     class Meta:
         model = Transaction
         fields = ['category', 'amount', 'type', 'date', 'note']
         widgets = {
-            'category': forms.Select(attrs={'class': 'form-select'}),
             'amount': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '0.00', 'step': '0.01'}),
             'type': forms.Select(attrs={'class': 'form-select'}),
             'date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
@@ -25,27 +77,31 @@ class TransactionForm(forms.ModelForm):
         }
     
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop('user', None)
+        # Categories are global; ``user`` is accepted for symmetry with BudgetForm
+        kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user:
-            # Filter categories to show only relevant ones based on transaction type
-            self.fields['category'].queryset = Category.objects.all()
 
 
 class BudgetForm(forms.ModelForm):
+    # Only expense categories can have budgets
+    category = CategoryChoiceField(category_type='expense', widget=forms.Select(attrs={'class': 'form-select'}))
+    
     class Meta:
         model = Budget
         fields = ['category', 'limit_amount', 'period']
         widgets = {
-            'category': forms.Select(attrs={'class': 'form-select'}),
             'limit_amount': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '0.00', 'step': '0.01'}),
             'period': forms.Select(attrs={'class': 'form-select'}),
         }
     
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop('user', None)
+        kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user:
-            # Only show expense categories for budgets
-            self.fields['category'].queryset = Category.objects.filter(type='expense')
 
+
+class TransactionImportForm(forms.Form):
+    file = forms.FileField(
+        label='CSV file',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'}),
+        help_text='Columns: date (YYYY-MM-DD), amount, category, and optionally type and note.',
+    )
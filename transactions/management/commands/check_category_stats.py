@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from transactions.category_stats import check_stats
+
+
+class Command(BaseCommand):
+    help = 'Compares the per-category statistics with the raw transactions and optionally repairs drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only check statistics of this username')
+        parser.add_argument('--repair', action='store_true', help='Rewrite the rows that drifted')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        drift = check_stats([user.id] if user else None, repair=options['repair'])
+        for (user_id, category_id, type_), field, stored, expected in drift:
+            if field:
+                problem = f'{field} is {stored}, expected {expected}'
+            elif stored is None:
+                problem = f'missing row for {expected} transactions'
+            else:
+                problem = f'row for {stored} transactions that no longer exist'
+            self.stdout.write(f'user {user_id} {type_} category {category_id}: {problem}')
+
+        scope = f'user {user.username}' if user else 'all users'
+        rows = len({key for key, *_ in drift})
+        if not drift:
+            self.stdout.write(self.style.SUCCESS(f'✅ Category statistics of {scope} are consistent'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'✅ Repaired {rows} category statistics rows for {scope}'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  {rows} category statistics rows drifted for {scope}; run with --repair to fix them'
+            ))
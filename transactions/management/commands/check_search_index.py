@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from transactions.search import check_search_index
+
+
+class Command(BaseCommand):
+    help = 'Finds transactions missing from the note search index and optionally indexes them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only check transactions of this username')
+        parser.add_argument('--repair', action='store_true', help='Index the missing transactions')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        missing = check_search_index([user.id] if user else None, repair=options['repair'])
+        for pk in missing[:100]:
+            self.stdout.write(f'transaction {pk} is not indexed')
+        if len(missing) > 100:
+            self.stdout.write(f'... and {len(missing) - 100} more')
+
+        scope = f'user {user.username}' if user else 'all users'
+        if not missing:
+            self.stdout.write(self.style.SUCCESS(f'✅ The search index of {scope} is complete'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'✅ Indexed {len(missing)} transactions for {scope}'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  {len(missing)} transactions of {scope} are not indexed; run with --repair to index them'
+            ))
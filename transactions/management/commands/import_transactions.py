@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from transactions.importers import TransactionImportError, import_transactions
+
+
+class Command(BaseCommand):
+    help = 'Imports transactions for a user from a CSV file (date, amount, category, type, note)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Owner of the imported transactions')
+        parser.add_argument('path', help='Path to the CSV file')
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=getattr(settings, 'TRANSACTION_IMPORT_BATCH_SIZE', 20000),
+            help='Number of rows inserted per database transaction',
+        )
+        parser.add_argument('--encoding', default='utf-8-sig', help='File encoding')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist")
+
+        try:
+            # Read as bytes, decoded line by line, so an undecodable line is
+            # reported and skipped instead of ending the import
+            with open(options['path'], 'rb') as f:
+                result = import_transactions(
+                    user, f, batch_size=max(options['batch_size'], 1), encoding=options['encoding'],
+                )
+        except LookupError as e:
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+        except TransactionImportError as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stdout.write(self.style.WARNING(f'Line {line}: {message}'))
+        if result.error_count > len(result.errors):
+            self.stdout.write(self.style.WARNING(
+                f'... and {result.error_count - len(result.errors)} more errors'
+            ))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Imported {result.created} transactions for {user.username} '
+                f'({result.error_count} rows skipped)'
+            )
+        )
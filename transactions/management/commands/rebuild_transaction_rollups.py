@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from transactions.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily transaction rollup table from the raw transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this username')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        count = rebuild_rollups(user)
+        scope = f'user {user.username}' if user else 'all users'
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Rebuilt {count} daily rollup rows for {scope}')
+        )
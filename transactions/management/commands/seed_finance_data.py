@@ -0,0 +1,50 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.seeding import ensure_categories, ensure_users, seed_user
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic users, categories, budgets and transactions for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Number of users to seed')
+        parser.add_argument('--transactions', type=int, default=10000,
+                            help='Transactions generated per user')
+        parser.add_argument('--months', type=int, default=24, help='History length in months')
+        parser.add_argument('--prefix', default='seed_user_', help='Username prefix of seeded users')
+        parser.add_argument('--password', default='password', help='Password of seeded users')
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible data')
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=getattr(settings, 'TRANSACTION_IMPORT_BATCH_SIZE', 20000),
+            help='Number of rows inserted per database transaction',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['transactions'] < 0 or options['months'] < 1:
+            raise CommandError('--users and --months must be positive and --transactions not negative')
+
+        rng = random.Random(options['seed'])
+        categories = ensure_categories()
+        users = ensure_users(options['users'], prefix=options['prefix'], password=options['password'])
+
+        started = time.perf_counter()
+        total = 0
+        for user in users:
+            total += seed_user(
+                user, categories, options['transactions'],
+                months=options['months'], rng=rng, batch_size=max(options['batch_size'], 1),
+            )
+            self.stdout.write(f'  {user.username}: {total} transactions so far')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Seeded {total} transactions for {len(users)} users in {elapsed:.1f}s '
+                f'({total / elapsed if elapsed else 0:.0f} rows/s)'
+            )
+        )
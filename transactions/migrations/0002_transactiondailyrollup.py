@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rollups(apps, schema_editor):
+    Transaction = apps.get_model('transactions', 'Transaction')
+    TransactionDailyRollup = apps.get_model('transactions', 'TransactionDailyRollup')
+    grouped = (
+        Transaction.objects
+        .values('user_id', 'category_id', 'type', 'date')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    TransactionDailyRollup.objects.bulk_create(
+        (
+            TransactionDailyRollup(
+                user_id=row['user_id'],
+                category_id=row['category_id'],
+                type=row['type'],
+                day=row['date'],
+                total=row['total'],
+                count=row['count'],
+            )
+            for row in grouped.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=7)),
+                ('day', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='transactions.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'category', 'type', 'day'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_userdataversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-date', '-created_at', 'id'], name='txn_user_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'type', '-date', '-created_at', 'id'], name='txn_user_type_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'category', '-date', '-created_at', 'id'], name='txn_user_cat_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='transactiondailyrollup',
+            index=models.Index(fields=['user', 'type', 'day'], name='rollup_user_type_day'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+from django.db import migrations
+
+
+# SQLite: an FTS5 table holding each note and an owner token ('u<user id>'),
+# kept in sync by triggers so bulk inserts and raw SQL writes are covered too
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE transactions_transaction_fts USING fts5(
+        note, owner, prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO transactions_transaction_fts (rowid, note, owner)
+    SELECT id, note, 'u' || user_id FROM transactions_transaction
+    """,
+    # Without statistics the planner guesses a user's rows are few and walks
+    # them probing the FTS index, instead of letting the index drive
+    'PRAGMA analysis_limit = 1000',
+    'ANALYZE',
+    """
+    CREATE TRIGGER transactions_transaction_fts_insert AFTER INSERT ON transactions_transaction
+    BEGIN
+        INSERT INTO transactions_transaction_fts (rowid, note, owner)
+        VALUES (new.id, new.note, 'u' || new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER transactions_transaction_fts_update AFTER UPDATE OF note, user_id ON transactions_transaction
+    BEGIN
+        UPDATE transactions_transaction_fts SET note = new.note, owner = 'u' || new.user_id
+        WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER transactions_transaction_fts_delete AFTER DELETE ON transactions_transaction
+    BEGIN
+        DELETE FROM transactions_transaction_fts WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS transactions_transaction_fts_insert',
+    'DROP TRIGGER IF EXISTS transactions_transaction_fts_update',
+    'DROP TRIGGER IF EXISTS transactions_transaction_fts_delete',
+    'DROP TABLE IF EXISTS transactions_transaction_fts',
+]
+
+# PostgreSQL: a GIN index on the same expression search.py filters on
+POSTGRESQL_FORWARD = [
+    """
+    CREATE INDEX txn_note_search ON transactions_transaction
+    USING gin (to_tsvector('simple'::regconfig, COALESCE(("note")::text, '')))
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS txn_note_search',
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor, [])
+        for sql in vendor_statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def populate_stats(apps, schema_editor):
+    # Periods are left empty: readers and writers roll them over from the rollups
+    Transaction = apps.get_model('transactions', 'Transaction')
+    UserCategoryStats = apps.get_model('transactions', 'UserCategoryStats')
+    grouped = (
+        Transaction.objects
+        .values('user_id', 'category_id', 'type')
+        .annotate(
+            count=Count('id'), total=Sum('amount'), min_amount=Min('amount'), max_amount=Max('amount'),
+            first_date=Min('date'), last_date=Max('date'),
+        )
+        .order_by()
+    )
+    UserCategoryStats.objects.bulk_create(
+        (UserCategoryStats(**row) for row in grouped.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_transaction_user_updated_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=7)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('min_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('first_date', models.DateField(blank=True, null=True)),
+                ('last_date', models.DateField(blank=True, null=True)),
+                ('month', models.DateField(blank=True, null=True)),
+                ('month_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('week', models.DateField(blank=True, null=True)),
+                ('week_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_stats', to='transactions.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User category stats',
+                'constraints': [models.UniqueConstraint(fields=('user', 'category', 'type'), name='unique_user_category_stats')],
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
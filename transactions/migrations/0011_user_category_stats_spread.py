@@ -0,0 +1,74 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+# Frozen copy of the spread computation at the time of this migration
+# (transactions.spread.exact_spreads), so later changes to that module
+# cannot break it: m2 and a P² sketch with markers at exact ranks
+QUANTILE = 0.95
+MARKER_FRACTIONS = (0.0, QUANTILE / 2, QUANTILE, (1 + QUANTILE) / 2, 1.0)
+MARKERS = len(MARKER_FRACTIONS)
+
+
+def marker_positions(count):
+    """1-based ranks of the sketch markers, strictly increasing."""
+    positions, floor = [], 1
+    for step, fraction in enumerate(MARKER_FRACTIONS):
+        rank = max(round(1 + (count - 1) * fraction) - step, 1, floor)
+        floor = rank
+        positions.append(min(rank, max(count - 4, 1)) + step)
+    return positions
+
+
+def spread(amounts, count):
+    """``(m2, sketch)`` of ``count`` amounts streamed in ascending order."""
+    positions = marker_positions(count) if count >= MARKERS else []
+    wanted = set(positions)
+    mean = m2 = 0.0
+    heights = []
+    for rank, amount in enumerate(amounts, 1):
+        value = float(amount)
+        delta = value - mean
+        mean += delta / rank
+        m2 += delta * (value - mean)
+        if count < MARKERS or rank in wanted:
+            heights.append(value)
+    return m2, {'heights': heights, 'positions': positions}
+
+
+def populate_spreads(apps, schema_editor):
+    Transaction = apps.get_model('transactions', 'Transaction')
+    UserCategoryStats = apps.get_model('transactions', 'UserCategoryStats')
+    rows = []
+    for row in UserCategoryStats.objects.iterator():
+        transactions = Transaction.objects.filter(user_id=row.user_id, category_id=row.category_id, type=row.type)
+        count = transactions.count()
+        amounts = transactions.order_by('amount').values_list('amount', flat=True).iterator()
+        row.m2, row.sketch = spread(amounts, count) if count else (0.0, {})
+        rows.append(row)
+        if len(rows) >= 1000:
+            UserCategoryStats.objects.bulk_update(rows, ['m2', 'sketch'])
+            rows = []
+    UserCategoryStats.objects.bulk_update(rows, ['m2', 'sketch'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_note_search_batch_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercategorystats',
+            name='m2',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='usercategorystats',
+            name='sketch',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(populate_spreads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Only the index is dropped: altering the field would make SQLite rebuild the
+# table, which drops the search index triggers (migration 0005)
+
+def _user_indexes(schema_editor, model):
+    constraints = schema_editor.connection.introspection.get_constraints(
+        schema_editor.connection.cursor(), model._meta.db_table
+    )
+    return [
+        name for name, constraint in constraints.items()
+        if constraint['index'] and not constraint['primary_key'] and not constraint['unique']
+        and constraint['columns'] == ['user_id']
+    ]
+
+
+def drop_user_index(apps, schema_editor):
+    model = apps.get_model('transactions', 'Transaction')
+    for name in _user_indexes(schema_editor, model):
+        schema_editor.execute(schema_editor._delete_index_sql(model, name))
+
+
+def create_user_index(apps, schema_editor):
+    model = apps.get_model('transactions', 'Transaction')
+    if not _user_indexes(schema_editor, model):
+        field = model._meta.get_field('user')
+        schema_editor.execute(schema_editor._create_index_sql(model, fields=[field]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0011_user_category_stats_spread'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='transaction',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_user_index, create_user_index),
+            ],
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth import get_user_model
 
 
@@ -18,7 +18,10 @@ class Category(models.Model):
 
 
 class Transaction(models.Model):
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='transactions')
+    # No index of its own: the keyset indexes below start with the user, and
+    # one more index to maintain slows bulk inserts down by about a third
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='transactions',
+                             db_index=False)
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='transactions')
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     TYPE_CHOICES = (
@@ -32,9 +35,46 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Fields that determine which daily rollup row a transaction counts towards
+    ROLLUP_FIELDS = ('user_id', 'category_id', 'type', 'date', 'amount')
+
+    class Meta:
+        # A user's rows in keyset order (see pagination.py), unfiltered and
+        # filtered by type or category, so list and export pages read an
+        # index range without sorting
+        indexes = [
+            models.Index(fields=['user', '-date', '-created_at', 'id'], name='txn_user_keyset'),
+            models.Index(fields=['user', 'type', '-date', '-created_at', 'id'], name='txn_user_type_keyset'),
+            models.Index(fields=['user', 'category', '-date', '-created_at', 'id'], name='txn_user_cat_keyset'),
+            # A user's rows written since a point in time (incremental recurring payment detection)
+            models.Index(fields=['user', 'updated_at'], name='txn_user_updated'),
+        ]
+
     def __str__(self) -> str:
         return f"{self.user} {self.type} {self.amount} on {self.date}"
 
+    def save(self, *args, **kwargs):
+        # The row and everything post_save derives from it (rollups,
+        # statistics, search index, alerts) are committed together
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so rollups can be adjusted on update/delete
+        loaded = dict(zip(field_names, values))
+        if all(name in loaded for name in cls.ROLLUP_FIELDS):
+            instance._rollup_state = tuple(loaded[name] for name in cls.ROLLUP_FIELDS)
+        return instance
+
+    def rollup_state(self):
+        return tuple(
+            self._meta.get_field(name.removesuffix('_id')).to_python(getattr(self, name))
+            for name in self.ROLLUP_FIELDS
+        )
+
 
 class Budget(models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='budgets')
@@ -51,3 +91,119 @@ class Budget(models.Model):
 
     def __str__(self) -> str:
         return f"{self.user} - {self.category} - {self.period}: {self.limit_amount}"
+
+
+class TransactionDailyRollup(models.Model):
+    """
+    Per-day totals of a user's transactions for one category and type.
+    Maintained incrementally on every Transaction write (see rollups.py).
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='daily_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_rollups')
+    type = models.CharField(max_length=7, choices=Transaction.TYPE_CHOICES)
+    day = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'category', 'type', 'day'],
+                name='unique_daily_rollup',
+            ),
+        ]
+        indexes = [
+            # Per-type totals over a date range (dashboard, insights); per-category
+            # lookups use the unique constraint's index
+            models.Index(fields=['user', 'type', 'day'], name='rollup_user_type_day'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user} {self.type} {self.category_id} on {self.day}: {self.total} ({self.count})"
+
+
+class UserCategoryStats(models.Model):
+    """
+    Running figures of a user's transactions in one category and type:
+    count, total, extremes, the totals of the current month and week and the
+    spread of the amounts (see spread.py). Maintained with the daily rollups
+    on every Transaction write (see category_stats.py), so they are read
+    without aggregating transactions.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='category_totals')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='user_stats')
+    type = models.CharField(max_length=7, choices=Transaction.TYPE_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    min_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    first_date = models.DateField(null=True, blank=True)
+    last_date = models.DateField(null=True, blank=True)
+    # Totals of the transactions dated in the month and (Monday to Sunday)
+    # week starting on these days; rolled over when they are no longer current
+    month = models.DateField(null=True, blank=True)
+    month_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    week = models.DateField(null=True, blank=True)
+    week_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Sum of squared deviations from the mean (Welford's method)
+    m2 = models.FloatField(default=0.0)
+    # P² quantile sketch: {"heights": [...], "positions": [...]}; the sorted
+    # amounts while there are fewer than five
+    sketch = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name_plural = 'User category stats'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'type'], name='unique_user_category_stats'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user} {self.type} {self.category_id}: {self.total} ({self.count})"
+
+    @property
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0.0
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    A user's balance (income minus expenses) of everything dated before
+    ``month``, the first day of a month. Created on demand and removed when
+    an earlier day changes (see balances.py).
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='balance_checkpoints')
+    month = models.DateField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='unique_balance_checkpoint'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user} balance before {self.month}: {self.balance}"
+
+
+class UserDataVersion(models.Model):
+    """
+    Counter bumped on every write to a user's transactions or budgets.
+    Lets derived data (insights, caches) detect that it is stale.
+    """
+    user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, primary_key=True,
+                                related_name='data_version')
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.user} data version {self.version}"
+
+
+class CategoryVersion(models.Model):
+    """
+    Counter bumped on every Category write, kept in a single row. Category
+    registries compare it with their snapshot when the cache is not shared
+    between processes (see categories.py).
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"Categories version {self.version}"
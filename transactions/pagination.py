@@ -0,0 +1,123 @@
+"""
+Keyset (cursor) pagination for transaction listings.
+
+Pages are addressed by the sort key of the row at the page boundary instead of
+an OFFSET, so fetching page 500 costs the same as fetching page 1.
+The sort order is ``(-date, -created_at, id)``.
+"""
+import base64
+from datetime import date, datetime
+
+from django.db.models import Q
+
+
+ORDERING = ('-date', '-created_at', 'id')
+REVERSE_ORDERING = ('date', 'created_at', '-id')
+
+
+def encode_cursor(transaction):
+    """
+    Encode the sort key of a transaction into an opaque URL-safe token.
+    """
+    raw = f"{transaction.date.isoformat()}|{transaction.created_at.isoformat()}|{transaction.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a token produced by ``encode_cursor``.
+    Returns a ``(date, created_at, id)`` tuple, or None if the token is invalid.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        day, created_at, pk = raw.split('|')
+        return date.fromisoformat(day), datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _after(key):
+    """Rows that sort after ``key`` in (-date, -created_at, id) order."""
+    day, created_at, pk = key
+    return (
+        Q(date__lt=day)
+        | Q(date=day, created_at__lt=created_at)
+        | Q(date=day, created_at=created_at, id__gt=pk)
+    )
+
+
+def _before(key):
+    """Rows that sort before ``key`` in (-date, -created_at, id) order."""
+    day, created_at, pk = key
+    return (
+        Q(date__gt=day)
+        | Q(date=day, created_at__gt=created_at)
+        | Q(date=day, created_at=created_at, id__lt=pk)
+    )
+
+
+def paginate_transactions(queryset, after=None, before=None, page_size=50):
+    """
+    Fetch one page of ``queryset`` using keyset pagination.
+
+    ``after`` and ``before`` are cursor tokens taken from a previous page.
+    One extra row is fetched to find out whether a further page exists, so
+    a page costs a single indexed query regardless of its position.
+    Returns a dictionary with the page rows and the cursors for its neighbours.
+    """
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before) if after_key is None else None
+
+    if before_key is not None:
+        rows = list(queryset.filter(_before(before_key)).order_by(*REVERSE_ORDERING)[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        has_next = True
+    else:
+        if after_key is not None:
+            queryset = queryset.filter(_after(after_key))
+        rows = list(queryset.order_by(*ORDERING)[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = after_key is not None
+
+    return {
+        'object_list': rows,
+        'has_next': has_next and bool(rows),
+        'has_previous': has_previous and bool(rows),
+        'next_cursor': encode_cursor(rows[-1]) if rows else None,
+        'previous_cursor': encode_cursor(rows[0]) if rows else None,
+    }
+
+
+def paginate_ranked(queryset, page_number=None, page_size=50, count=None):
+    """
+    Fetch one page of an already ordered ``queryset`` (e.g. search results
+    ranked by relevance, which have no stable keyset) by page number.
+
+    Page numbers past the end are clamped to the last page; ``count`` is the
+    number of rows in ``queryset``, counted if not given.
+    """
+    try:
+        page_number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        page_number = 1
+    if page_number > 1:
+        if count is None:
+            count = queryset.count()
+        page_number = min(page_number, max(-(-count // page_size), 1))
+    offset = (page_number - 1) * page_size
+    rows = list(queryset[offset:offset + page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    return {
+        'object_list': rows,
+        'has_next': has_next,
+        'has_previous': page_number > 1,
+        'next_page': page_number + 1,
+        'previous_page': page_number - 1,
+    }
@@ -0,0 +1,177 @@
+"""
+Maintenance of the TransactionDailyRollup table.
+
+Every Transaction write is turned into signed deltas keyed by
+(user, category, type, day) which are applied with in-place ``F()`` updates.
+Bulk writes that bypass model signals must call ``apply_deltas`` themselves.
+It also deletes the balance checkpoints the changed days fall before.
+Per-category statistics (category_stats.py) are updated alongside.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from . import category_stats
+from .balances import invalidate_checkpoints
+from .models import BalanceCheckpoint, Transaction, TransactionDailyRollup
+
+
+def collect_deltas(states, sign=1, deltas=None):
+    """
+    Accumulate rollup deltas from ``(user_id, category_id, type, date, amount)``
+    tuples. ``sign`` is 1 for rows being added and -1 for rows being removed.
+    """
+    if deltas is None:
+        deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for user_id, category_id, type_, day, amount in states:
+        entry = deltas[(user_id, category_id, type_, day)]
+        entry[0] += sign * Decimal(amount)
+        entry[1] += sign
+    return deltas
+
+
+# Above this many keys, deltas are merged with one batched upsert instead of
+# one UPDATE per key
+BULK_THRESHOLD = 50
+
+
+def apply_deltas(deltas):
+    """
+    Apply accumulated deltas to the rollup table.
+    Rows whose count drops to zero are removed.
+    """
+    deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    if not deltas:
+        return
+    with transaction.atomic(savepoint=False):
+        if len(deltas) > BULK_THRESHOLD:
+            _apply_bulk(deltas)
+        else:
+            for key, (amount, count) in deltas.items():
+                _apply_one(key, amount, count)
+
+        shrunk_users = {key[0] for key, (amount, count) in deltas.items() if count < 0}
+        if shrunk_users:
+            TransactionDailyRollup.objects.filter(user_id__in=shrunk_users, count__lte=0).delete()
+
+        earliest_days = {}
+        for user_id, category_id, type_, day in deltas:
+            if user_id not in earliest_days or day < earliest_days[user_id]:
+                earliest_days[user_id] = day
+        for user_id, day in earliest_days.items():
+            invalidate_checkpoints(user_id, day)
+
+
+def _apply_one(key, amount, count):
+    user_id, category_id, type_, day = key
+    fields = {'user_id': user_id, 'category_id': category_id, 'type': type_, 'day': day}
+    rollups = TransactionDailyRollup.objects.filter(**fields)
+    if rollups.update(total=F('total') + amount, count=F('count') + count) or count <= 0:
+        return
+    try:
+        with transaction.atomic():
+            TransactionDailyRollup.objects.create(total=amount, count=count, **fields)
+    except IntegrityError:
+        # Created concurrently by another writer
+        rollups.update(total=F('total') + amount, count=F('count') + count)
+
+
+def _upsert_sql(connection):
+    meta = TransactionDailyRollup._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    key_columns = [qn(meta.get_field(name).column) for name in ('user', 'category', 'type', 'day')]
+    total, count = qn('total'), qn('count')
+    return (
+        f"INSERT INTO {table} ({', '.join(key_columns)}, {total}, {count}) "
+        f"VALUES (%s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+        f"{total} = {table}.{total} + EXCLUDED.{total}, "
+        f"{count} = {table}.{count} + EXCLUDED.{count}"
+    )
+
+
+def _apply_bulk(deltas):
+    """
+    Merge many deltas at once with a single batched increment-upsert
+    (INSERT ... ON CONFLICT DO UPDATE, supported by SQLite and PostgreSQL).
+    Other backends fall back to one UPDATE per key.
+    """
+    connection = connections[router.db_for_write(TransactionDailyRollup)]
+    if not connection.features.supports_update_conflicts_with_target:
+        for key, (amount, count) in deltas.items():
+            _apply_one(key, amount, count)
+        return
+
+    ops = connection.ops
+    params = [
+        (user_id, category_id, type_, ops.adapt_datefield_value(day), ops.adapt_decimalfield_value(amount), count)
+        for (user_id, category_id, type_, day), (amount, count) in deltas.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(_upsert_sql(connection), params)
+
+
+def record_change(old_state=None, new_state=None):
+    """
+    Update rollups and category statistics for a single transaction write.
+    ``old_state`` is the stored state before the write (None on create) and
+    ``new_state`` the state after it (None on delete). Returns the category
+    statistics of ``new_state`` before the write (see
+    ``category_stats.record_change``).
+    """
+    if old_state == new_state:
+        return None
+    deltas = None
+    if old_state is not None:
+        deltas = collect_deltas([old_state], sign=-1, deltas=deltas)
+    if new_state is not None:
+        deltas = collect_deltas([new_state], sign=1, deltas=deltas)
+    with transaction.atomic(savepoint=False):
+        apply_deltas(deltas)
+        return category_stats.record_change(old_state, new_state)
+
+
+def rebuild_rollups(user=None):
+    """
+    Recompute rollups and per-category statistics from the raw Transaction
+    table, dropping balance checkpoints. Rebuilds every user's rows, or only
+    those of ``user`` if given. Returns the number of rollup rows written.
+    """
+    transactions = Transaction.objects.all()
+    rollups = TransactionDailyRollup.objects.all()
+    checkpoints = BalanceCheckpoint.objects.all()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+        rollups = rollups.filter(user=user)
+        checkpoints = checkpoints.filter(user=user)
+
+    grouped = (
+        transactions
+        .values('user_id', 'category_id', 'type', 'date')
+        .annotate(total=Coalesce(Sum('amount'), Decimal('0')), count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        # Checkpoints are rebuilt from the new rollups when next needed
+        checkpoints.delete()
+        rollups.delete()
+        created = TransactionDailyRollup.objects.bulk_create(
+            (
+                TransactionDailyRollup(
+                    user_id=row['user_id'],
+                    category_id=row['category_id'],
+                    type=row['type'],
+                    day=row['date'],
+                    total=row['total'],
+                    count=row['count'],
+                )
+                for row in grouped.iterator()
+            ),
+            batch_size=1000,
+        )
+        category_stats.rebuild_stats(None if user is None else [user.id])
+    return len(created)
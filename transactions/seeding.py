@@ -0,0 +1,178 @@
+"""
+Synthetic finance data for load testing and benchmarks.
+
+Each seeded user gets a monthly salary, fixed monthly bills and a stream of
+discretionary spending whose volume and amounts follow weekly and seasonal
+patterns (weekend dining, winter utilities, summer travel, holiday
+shopping). Transactions are written with the importer's batched insert, so
+millions of rows can be generated without per-row model overhead.
+"""
+import math
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from .importers import insert_transactions
+from .models import Budget, Category, Transaction
+from .signals import transactions_bulk_changed
+
+
+# name, type, typical amount, relative frequency of discretionary spending
+CATEGORY_PROFILES = (
+    ('Salary', 'income', 4000, 0),
+    ('Freelance', 'income', 600, 1),
+    ('Rent', 'expense', 1200, 0),
+    ('Utilities', 'expense', 150, 0),
+    ('Groceries', 'expense', 60, 30),
+    ('Dining Out', 'expense', 25, 25),
+    ('Transport', 'expense', 12, 30),
+    ('Entertainment', 'expense', 40, 8),
+    ('Shopping', 'expense', 80, 10),
+    ('Health', 'expense', 70, 3),
+    ('Travel', 'expense', 300, 1),
+)
+
+# Spending multipliers by month (1-12), per category; others use 1.0
+SEASONALITY = {
+    'Utilities': (1.5, 1.4, 1.2, 1.0, 0.8, 0.8, 0.9, 0.9, 0.8, 1.0, 1.2, 1.5),
+    'Shopping': (0.8, 0.7, 0.9, 0.9, 1.0, 1.0, 1.0, 1.1, 1.0, 1.0, 1.4, 2.0),
+    'Travel': (0.5, 0.5, 0.7, 0.8, 1.0, 1.8, 2.5, 2.2, 1.0, 0.7, 0.5, 1.2),
+    'Entertainment': (0.8, 0.8, 0.9, 1.0, 1.0, 1.1, 1.2, 1.2, 1.0, 1.0, 1.0, 1.4),
+}
+
+# Discretionary spending volume by weekday (Monday=0)
+WEEKDAY_WEIGHTS = (0.9, 0.9, 1.0, 1.0, 1.3, 1.6, 1.2)
+
+# Notes for discretionary transactions (exercises note search); blank notes are common too
+NOTES = {
+    'Freelance': ('Logo design invoice', 'Website fixes', 'Consulting call'),
+    'Groceries': ('Weekly groceries', 'Supermarket run', 'Fresh market vegetables', 'Bakery'),
+    'Dining Out': ('Lunch with colleagues', 'Pizza night', 'Coffee and pastry', 'Birthday dinner'),
+    'Transport': ('Trotro fare', 'Taxi home', 'Fuel top-up', 'Bus ticket'),
+    'Entertainment': ('Cinema tickets', 'Concert', 'Streaming subscription'),
+    'Shopping': ('New shoes', 'Phone accessories', 'Gift for a friend', 'Kitchen supplies'),
+    'Health': ('Pharmacy', 'Clinic visit', 'Gym membership'),
+    'Travel': ('Flight to Kumasi', 'Hotel booking', 'Beach weekend'),
+}
+
+DEFAULT_BUDGETS = (
+    ('Groceries', 'monthly', 500),
+    ('Dining Out', 'weekly', 80),
+    ('Shopping', 'monthly', 400),
+    ('Transport', 'monthly', 250),
+)
+
+
+def ensure_categories():
+    """Create the seed categories that do not exist yet; return them by name."""
+    existing = {(c.name, c.type): c for c in Category.objects.all()}
+    categories = {}
+    for name, type_, _, _ in CATEGORY_PROFILES:
+        category = existing.get((name, type_))
+        if category is None:
+            category = Category.objects.create(name=name, type=type_)
+        categories[name] = category
+    return categories
+
+
+def ensure_users(count, prefix='seed_user_', password='password'):
+    """Create ``prefix0`` .. ``prefix{count-1}`` as needed; return them in order."""
+    usernames = [f'{prefix}{i}' for i in range(count)]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    hashed = make_password(password)
+    User.objects.bulk_create(
+        [User(username=name, password=hashed) for name in usernames if name not in existing],
+        batch_size=1000,
+    )
+    users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+    return [users[name] for name in usernames]
+
+
+def ensure_budgets(user, categories):
+    """Give ``user`` the default budgets it does not have yet; return how many were added."""
+    budgeted = set(Budget.objects.filter(user=user).values_list('category_id', flat=True))
+    return len(Budget.objects.bulk_create([
+        Budget(user=user, category=categories[name], period=period, limit_amount=Decimal(limit))
+        for name, period, limit in DEFAULT_BUDGETS
+        if categories[name].pk not in budgeted
+    ]))
+
+
+def _amount(rng, typical, multiplier=1.0):
+    # Log-normal around the typical amount, rounded to cents
+    value = typical * multiplier * math.exp(rng.gauss(0, 0.45) - 0.1)
+    return Decimal(str(round(max(value, 1.0), 2)))
+
+
+def _month_starts(start, end):
+    month = start.replace(day=1)
+    while month <= end:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def generate_transactions(rng, categories, count, end, months):
+    """
+    Yield ``(category_id, type, amount, date, note)`` tuples for one user:
+    recurring income and bills for every month in the span, then
+    discretionary spending up to ``count`` rows in total.
+    """
+    start = end - timedelta(days=months * 30)
+    profiles = {name: (type_, typical) for name, type_, typical, _ in CATEGORY_PROFILES}
+    salary = profiles['Salary'][1] * rng.uniform(0.6, 1.6)
+
+    recurring = []
+    for month in _month_starts(start, end):
+        seasonal = SEASONALITY['Utilities'][month.month - 1]
+        recurring.append(('Salary', Decimal(str(round(salary, 2))), month.replace(day=25), 'Monthly salary'))
+        recurring.append(('Rent', Decimal(str(profiles['Rent'][1])), month, 'Rent'))
+        recurring.append(('Utilities', _amount(rng, profiles['Utilities'][1], seasonal), month.replace(day=10), ''))
+        # Yearly raise
+        if month.month == 1:
+            salary *= 1.03
+    recurring = [row for row in recurring if start <= row[2] <= end][:count]
+    for name, amount, day, note in recurring:
+        yield categories[name].pk, profiles[name][0], amount, day, note
+
+    names = [name for name, _, _, weight in CATEGORY_PROFILES if weight]
+    weights = [weight for _, _, _, weight in CATEGORY_PROFILES if weight]
+    span = (end - start).days
+    for _ in range(count - len(recurring)):
+        # Rejection-sample the day so volume follows the weekday pattern
+        while True:
+            day = start + timedelta(days=rng.randrange(span + 1))
+            if rng.random() * max(WEEKDAY_WEIGHTS) <= WEEKDAY_WEIGHTS[day.weekday()]:
+                break
+        name = rng.choices(names, weights)[0]
+        type_, typical = profiles[name]
+        multiplier = SEASONALITY.get(name, (1.0,) * 12)[day.month - 1]
+        note = rng.choice(NOTES[name]) if rng.random() < 0.6 else ''
+        yield categories[name].pk, type_, _amount(rng, typical, multiplier), day, note
+
+
+def seed_user(user, categories, count, months=24, end=None, rng=None, batch_size=20000):
+    """
+    Add ``count`` synthetic transactions (and default budgets) for ``user``.
+    Returns the number of transactions created.
+    """
+    rng = rng or random.Random()
+    end = end or date.today()
+    budgets_added = ensure_budgets(user, categories)
+
+    created = 0
+    batch = []
+    for row in generate_transactions(rng, categories, count, end, months):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            created += insert_transactions(user.id, batch)
+            batch = []
+    if batch:
+        created += insert_transactions(user.id, batch)
+
+    # Bulk writes bypass model signals
+    if created or budgets_added:
+        transactions_bulk_changed.send(sender=Transaction, user_id=user.id)
+    return created
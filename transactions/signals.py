@@ -0,0 +1,119 @@
+"""
+Signal handlers that keep derived transaction data in sync with writes.
+"""
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from .models import Budget, Category, Transaction
+from . import rollups
+from .caching import bump_categories_version, bump_user_version
+from .categories import category_registry
+from .search import index_notes
+from .versioning import bump_categories_data_version, bump_data_version
+
+
+# Sent after writes that bypass model signals (bulk imports), with ``user_id``.
+# Rollups are already up to date when it fires.
+transactions_bulk_changed = Signal()
+
+# Sent after a single transaction write has been applied to the rollups, with
+# ``instance`` and its ``old_state`` and ``new_state`` (see rollups.record_change),
+# and ``stats``, the UserCategoryStats row of ``new_state`` as it was before the
+# write (None on delete, or when the write left the state unchanged)
+transaction_changed = Signal()
+
+
+def _stored_state(instance):
+    """The stored rollup state of ``instance`` (None if it has no row)."""
+    return (
+        Transaction.objects.filter(pk=instance.pk)
+        .values_list(*Transaction.ROLLUP_FIELDS)
+        .first()
+    )
+
+
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_delete, sender=Transaction)
+def load_transaction_state(sender, instance, raw=False, **kwargs):
+    # Instances loaded with only() or defer() have no remembered state;
+    # without it an update would count as a create
+    if raw or instance._state.adding or hasattr(instance, '_rollup_state'):
+        return
+    state = _stored_state(instance)
+    instance._rollup_state = state
+    if state is not None:
+        # Fill in the deferred ones so handlers read them without a query each
+        deferred = instance.get_deferred_fields()
+        for name, value in zip(Transaction.ROLLUP_FIELDS, state):
+            if name in deferred:
+                setattr(instance, name, value)
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_state = getattr(instance, '_rollup_state', None)
+    new_state = instance.rollup_state()
+    stats = rollups.record_change(old_state, new_state)
+    instance._rollup_state = new_state
+    transaction_changed.send(sender=Transaction, instance=instance, old_state=old_state, new_state=new_state,
+                             stats=stats)
+
+
+@receiver(post_save, sender=Transaction)
+def index_transaction_note(sender, instance, created, using, **kwargs):
+    # Updates and deletes are indexed by triggers (see search.py)
+    if created:
+        index_notes(instance.pk, instance.pk, using=using)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    old_state = getattr(instance, '_rollup_state', None) or instance.rollup_state()
+    rollups.record_change(old_state, None)
+    instance._rollup_state = None
+    transaction_changed.send(sender=Transaction, instance=instance, old_state=old_state, new_state=None, stats=None)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Budget)
+def user_data_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_data_version(instance.user_id)
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Budget)
+def user_data_deleted(sender, instance, **kwargs):
+    bump_data_version(instance.user_id, create=False)
+    bump_user_version(instance.user_id)
+
+
+@receiver(transactions_bulk_changed)
+def user_data_bulk_changed(sender, user_id, **kwargs):
+    bump_data_version(user_id)
+    bump_user_version(user_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, raw=False, **kwargs):
+    if raw:
+        return
+    bump_categories_data_version()
+    bump_categories_version()
+    category_registry.forget_version()
+
+
+@receiver(request_started)
+def request_began(sender, **kwargs):
+    category_registry.begin_request()
+
+
+@receiver(request_finished)
+def request_ended(sender, **kwargs):
+    category_registry.end_request()
@@ -0,0 +1,170 @@
+"""
+Running spread of the amounts in a UserCategoryStats row, updated in
+constant time per transaction:
+
+* the sum of squared deviations from the mean (``m2``), by Welford's
+  method, which can also take an amount back out; the mean itself is
+  ``total / count``;
+* a P² sketch (Jain & Chlamtac): five markers whose heights track the
+  minimum, the ``QUANTILE`` quantile, the maximum and two points between.
+  Amounts cannot be taken out of it, so edits and deletes leave it as is
+  until the statistics are rebuilt, which places the markers exactly
+  (``exact_spreads``).
+"""
+import math
+from bisect import bisect_right
+
+import numpy as np
+
+
+QUANTILE = 0.95
+
+# How far along the sorted amounts each P² marker should sit
+_MARKER_FRACTIONS = np.array([0.0, QUANTILE / 2, QUANTILE, (1 + QUANTILE) / 2, 1.0])
+_MARKERS = len(_MARKER_FRACTIONS)
+
+
+def sketch_add(sketch, amount):
+    """Add ``amount`` to a P² sketch (a dict, updated in place)."""
+    heights = sketch.setdefault('heights', [])
+    positions = sketch.setdefault('positions', [])
+    if len(heights) < _MARKERS:
+        # Exact until the markers can be placed on the first five amounts
+        heights.append(amount)
+        heights.sort()
+        if len(heights) == _MARKERS:
+            positions.extend(range(1, _MARKERS + 1))
+        return sketch
+
+    if amount < heights[0]:
+        heights[0] = amount
+        cell = 0
+    elif amount >= heights[-1]:
+        heights[-1] = amount
+        cell = _MARKERS - 2
+    else:
+        cell = bisect_right(heights, amount) - 1
+    for i in range(cell + 1, _MARKERS):
+        positions[i] += 1
+
+    count = positions[-1]
+    for i in range(1, _MARKERS - 1):
+        offset = 1 + (count - 1) * _MARKER_FRACTIONS[i] - positions[i]
+        if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (offset <= -1 and positions[i - 1] - positions[i] < -1):
+            step = 1 if offset > 0 else -1
+            height = _parabolic(heights, positions, i, step)
+            if not heights[i - 1] < height < heights[i + 1]:
+                height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+            heights[i] = height
+            positions[i] += step
+    return sketch
+
+
+def _parabolic(heights, positions, i, step):
+    below = positions[i] - positions[i - 1]
+    above = positions[i + 1] - positions[i]
+    return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+        (below + step) * (heights[i + 1] - heights[i]) / above
+        + (above - step) * (heights[i] - heights[i - 1]) / below
+    )
+
+
+def sketch_quantile(sketch):
+    """The ``QUANTILE`` quantile estimated by a sketch (None when empty)."""
+    heights = sketch.get('heights') or []
+    if not heights:
+        return None
+    if len(heights) < _MARKERS:
+        return heights[min(int(QUANTILE * len(heights)), len(heights) - 1)]
+    return heights[2]
+
+
+def add_amount(stats, amount):
+    """Add the Decimal ``amount`` to the count, total and spread of ``stats``."""
+    value = float(amount)
+    mean = stats.mean
+    stats.count += 1
+    stats.total += amount
+    stats.m2 += (value - mean) * (value - stats.mean)
+    sketch_add(stats.sketch, value)
+
+
+def add_amounts(stats, amounts):
+    """
+    Add a list of Decimal ``amounts`` to ``stats`` at once: the count, total
+    and ``m2`` are merged with those of the batch (Chan et al.), and only the
+    sketch takes the amounts one at a time.
+    """
+    if len(amounts) == 1:
+        return add_amount(stats, amounts[0])
+    values = [float(amount) for amount in amounts]
+    count, mean = stats.count, stats.mean
+    batch_count = len(values)
+    batch_mean = math.fsum(values) / batch_count
+    batch_m2 = math.fsum((value - batch_mean) ** 2 for value in values)
+    stats.count = count + batch_count
+    stats.total += sum(amounts)
+    stats.m2 += batch_m2 + (batch_mean - mean) ** 2 * count * batch_count / stats.count
+    sketch = stats.sketch
+    for value in values:
+        sketch_add(sketch, value)
+
+
+def remove_amount(stats, amount):
+    """Take the Decimal ``amount`` back out of ``stats``."""
+    value = float(amount)
+    mean = stats.mean
+    stats.count -= 1
+    stats.total -= amount
+    if stats.count <= 0:
+        stats.m2, stats.sketch = 0.0, {}
+        return
+    stats.m2 = max(stats.m2 - (value - mean) * (value - stats.mean), 0.0)
+    heights = stats.sketch.get('heights') or []
+    if len(heights) < _MARKERS and value in heights:
+        heights.remove(value)
+
+
+def standard_deviation(stats):
+    return math.sqrt(stats.m2 / (stats.count - 1)) if stats.count > 1 else 0.0
+
+
+def exact_spreads(rows):
+    """
+    ``{key: (m2, sketch)}`` of the amounts in ``(key, amount)`` pairs, with
+    the sketches' markers at exact quantiles.
+    """
+    keys = {}
+    groups, amounts = [], []
+    for key, amount in rows:
+        groups.append(keys.setdefault(key, len(keys)))
+        amounts.append(float(amount))
+    if not keys:
+        return {}
+
+    groups, amounts = np.array(groups), np.array(amounts)
+    order = np.lexsort((amounts, groups))
+    groups, amounts = groups[order], amounts[order]
+    size = len(keys)
+    counts = np.bincount(groups, minlength=size)
+    means = np.bincount(groups, amounts, size) / counts
+    m2 = np.bincount(groups, (amounts - means[groups]) ** 2, size)
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+
+    # Markers at the nearest ranks to their target, kept strictly increasing
+    steps = np.arange(_MARKERS)
+    ranks = np.rint(1 + (counts[:, None] - 1) * _MARKER_FRACTIONS) - steps
+    ranks = np.minimum(np.maximum.accumulate(np.maximum(ranks, 1), axis=1), np.maximum(counts[:, None] - 4, 1))
+    positions = (ranks + steps).astype(int)
+    spreads = {}
+    for key, number in keys.items():
+        start, count = starts[number], counts[number]
+        if count < _MARKERS:
+            sketch = {'heights': amounts[start:start + count].tolist(), 'positions': []}
+        else:
+            sketch = {
+                'heights': amounts[start + positions[number] - 1].tolist(),
+                'positions': positions[number].tolist(),
+            }
+        spreads[key] = (float(m2[number]), sketch)
+    return spreads
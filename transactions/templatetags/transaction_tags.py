@@ -0,0 +1,96 @@
+"""
+Rendering of the transactions table rows.
+
+``{% transaction_rows transactions %}`` renders one ``<tr>`` per transaction.
+The markup of a row lives only in ``transactions/transaction_row.html``. By
+default that template is rendered once per transaction type with
+placeholders in place of the values, and the resulting row strings are
+formatted in Python: both URLs are reversed once per call, each distinct
+date is formatted once and only the per-row values go through the filters,
+which is several times faster than the template loop for large pages. With
+``TRANSACTION_ROWS_COMPILED = False`` the ``transactions/transaction_rows.html``
+loop includes the row template for each transaction instead.
+"""
+from django import template
+from django.conf import settings
+from django.template.defaultfilters import date as date_filter, floatformat
+from django.template.loader import get_template, render_to_string
+from django.urls import reverse
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+from ..models import Transaction
+
+
+register = template.Library()
+
+ROW_TEMPLATE = 'transactions/transaction_row.html'
+ROWS_TEMPLATE = 'transactions/transaction_rows.html'
+
+# Stands in for the primary key when URLs are reversed once per call
+_PK_PLACEHOLDER = 987654321
+
+# Values of the row template that are filled in per row
+_ROW_FIELDS = ('day', 'weekday', 'category', 'type_label', 'amount', 'note', 'update_url', 'delete_url')
+
+_TYPE_LABELS = {value: conditional_escape(label) for value, label in Transaction.TYPE_CHOICES}
+
+
+def _row_format(row_template, type, category_type):
+    """
+    The row template rendered for a transaction and category type, as a
+    ``str.format`` string with a field per value in ``_ROW_FIELDS``.
+    """
+    context = {name: mark_safe(f'\x00{name}\x00') for name in _ROW_FIELDS}
+    context.update(type=type, category_type=category_type)
+    markup = row_template.render(context).replace('{', '{{').replace('}', '}}')
+    for name in _ROW_FIELDS:
+        markup = markup.replace(f'\x00{name}\x00', f'{{{name}}}')
+    return markup + '\n'
+
+
+def _url_parts(name):
+    """The escaped URL of ``name`` before and after its primary key."""
+    return conditional_escape(reverse(name, args=[_PK_PLACEHOLDER])).split(str(_PK_PLACEHOLDER), 1)
+
+
+def render_rows(transactions):
+    """The table rows of ``transactions``, formatted in Python."""
+    row_template = get_template(ROW_TEMPLATE)
+    formats = {}
+    update_before, update_after = _url_parts('transaction_update')
+    delete_before, delete_after = _url_parts('transaction_delete')
+    days = {}
+    rows = []
+    for transaction in transactions:
+        day = transaction.date
+        if day not in days:
+            days[day] = (date_filter(day, 'M d, Y'), date_filter(day, 'l'))
+        category = transaction.category
+        key = (transaction.type == 'income', category.type == 'income')
+        if key not in formats:
+            formats[key] = _row_format(row_template, transaction.type, category.type)
+        rows.append(formats[key].format(
+            day=days[day][0],
+            weekday=days[day][1],
+            category=conditional_escape(category.name),
+            type_label=_TYPE_LABELS.get(transaction.type) or conditional_escape(transaction.type),
+            amount=floatformat(transaction.amount, 2),
+            note=conditional_escape(transaction.note or '—'),
+            update_url=f'{update_before}{transaction.pk}{update_after}',
+            delete_url=f'{delete_before}{transaction.pk}{delete_after}',
+        ))
+    return mark_safe(''.join(rows))
+
+
+@register.simple_tag
+def transaction_rows(transactions, compiled=None):
+    """
+    Render the rows of the transactions table. ``compiled`` overrides the
+    TRANSACTION_ROWS_COMPILED setting.
+    """
+    if compiled is None:
+        compiled = getattr(settings, 'TRANSACTION_ROWS_COMPILED', True)
+    if compiled:
+        return render_rows(transactions)
+    return render_to_string(ROWS_TEMPLATE, {'transactions': transactions})
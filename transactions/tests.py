@@ -1,9 +1,16 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, models
 from django.urls import reverse
 from decimal import Decimal
-from datetime import date
-from .models import Category, Transaction, Budget
+from datetime import date, timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+import re
+from .models import Category, Transaction, TransactionDailyRollup, Budget
 
 
 class CategoryModelTest(TestCase):
@@ -87,6 +94,7 @@ class BudgetModelTest(TestCase):
 
 class ViewsTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -181,3 +189,1526 @@ class ViewsTest(TestCase):
         })
         self.assertEqual(Category.objects.count(), 2)  # Including setup category
         self.assertEqual(response.status_code, 302)
+
+
+@override_settings(TRANSACTIONS_PAGE_SIZE=3)
+class TransactionPaginationTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(
+            name='Food',
+            type='expense'
+        )
+        self.transactions = [
+            Transaction.objects.create(
+                user=self.user,
+                category=self.category,
+                amount=Decimal('10.00') + i,
+                type='expense',
+                date=date.today() - timedelta(days=i // 2),
+            )
+            for i in range(7)
+        ]
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _expected_order(self):
+        return list(
+            Transaction.objects.filter(user=self.user).order_by('-date', '-created_at', 'id')
+        )
+    
+    def test_walk_forward_and_back(self):
+        """Test that following cursors visits every row exactly once, in order."""
+        seen = []
+        pages = []
+        response = self.client.get(reverse('transactions_list'))
+        while True:
+            page = response.context['page']
+            pages.append(page)
+            seen.extend(page['object_list'])
+            if not page['has_next']:
+                break
+            response = self.client.get(reverse('transactions_list'), {'after': page['next_cursor']})
+        
+        self.assertEqual(seen, self._expected_order())
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(response.context['transaction_count'], 7)
+        
+        # Step back from the last page to the middle one
+        response = self.client.get(reverse('transactions_list'), {'before': pages[-1]['previous_cursor']})
+        self.assertEqual(response.context['transactions'], pages[1]['object_list'])
+        self.assertTrue(response.context['page']['has_previous'])
+    
+    def test_cursor_keeps_filters(self):
+        """Test that filters are applied alongside the cursor."""
+        income_category = Category.objects.create(name='Salary', type='income')
+        Transaction.objects.create(
+            user=self.user,
+            category=income_category,
+            amount=Decimal('1000.00'),
+            type='income',
+            date=date.today()
+        )
+        response = self.client.get(reverse('transactions_list'), {'type': 'expense'})
+        cursor = response.context['page']['next_cursor']
+        response = self.client.get(reverse('transactions_list'), {'type': 'expense', 'after': cursor})
+        self.assertTrue(all(t.type == 'expense' for t in response.context['transactions']))
+        self.assertEqual(response.context['transaction_count'], 7)
+    
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('transactions_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['transactions'], self._expected_order()[:3])
+    
+    def test_query_count_is_independent_of_page_position(self):
+        """Test that later pages cost the same number of queries as the first."""
+        first = self.client.get(reverse('transactions_list'))
+        with CaptureQueriesContext(connection) as first_queries:
+            self.client.get(reverse('transactions_list'))
+        with CaptureQueriesContext(connection) as last_queries:
+            self.client.get(reverse('transactions_list'), {'after': first.context['page']['next_cursor']})
+        self.assertEqual(len(first_queries), len(last_queries))
+        self.assertFalse(any('OFFSET' in q['sql'] for q in last_queries.captured_queries))
+
+
+class DashboardAggregationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.salary = Category.objects.create(name='Salary', type='income')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_dashboard_values(self):
+        """Test totals, weekly buckets and category breakdown."""
+        from .dashboard import build_dashboard, week_ranges
+        
+        last_week_start = week_ranges()[-1][0]
+        Transaction.objects.create(user=self.user, category=self.salary, amount=Decimal('1000.00'),
+                                   type='income', date=last_week_start)
+        Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('40.00'),
+                                   type='expense', date=last_week_start + timedelta(days=1))
+        Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('60.00'),
+                                   type='expense', date=last_week_start - timedelta(days=60))
+        
+        dashboard = build_dashboard(self.user)
+        self.assertEqual(dashboard['total_income'], Decimal('1000.00'))
+        self.assertEqual(dashboard['total_expense'], Decimal('100.00'))
+        self.assertEqual(dashboard['balance'], Decimal('900.00'))
+        self.assertEqual(dashboard['weekly_data'][-1], {'week': 'Week 4', 'income': 1000.0, 'expense': 40.0})
+        self.assertEqual(dashboard['category_data'], [{'name': 'Food', 'amount': 100.0}])
+    
+    def test_home_query_count_independent_of_categories(self):
+        """Test that adding categories does not add dashboard queries."""
+        from .versioning import bump_categories_data_version
+        self.client.get(reverse('home'))
+        # Both measured requests reload the category registry
+        bump_categories_data_version()
+        cache.clear()
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse('home'))
+        
+        for i in range(5):
+            category = Category.objects.create(name=f'Extra {i}', type='expense')
+            Transaction.objects.create(user=self.user, category=category, amount=Decimal('5.00'),
+                                       type='expense', date=date.today())
+        cache.clear()
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(reverse('home'))
+        self.assertEqual(len(before), len(after))
+
+
+class TransactionDailyRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.transport = Category.objects.create(name='Transport', type='expense')
+    
+    def _rollups(self):
+        return set(
+            TransactionDailyRollup.objects.filter(user=self.user)
+            .values_list('category_id', 'type', 'day', 'total', 'count')
+        )
+    
+    def _expected(self):
+        from django.db.models import Count, Sum
+        return set(
+            Transaction.objects.filter(user=self.user)
+            .values('category_id', 'type', 'date')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .values_list('category_id', 'type', 'date', 'total', 'count')
+        )
+    
+    def test_rollups_follow_create_update_and_delete(self):
+        today = date.today()
+        first = Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('10.00'),
+                                           type='expense', date=today)
+        Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('5.50'),
+                                   type='expense', date=today)
+        self.assertEqual(self._rollups(), {(self.food.id, 'expense', today, Decimal('15.50'), 2)})
+        
+        # Update through a freshly loaded instance, as the views do
+        transaction = Transaction.objects.get(pk=first.pk)
+        transaction.amount = Decimal('20.00')
+        transaction.date = today - timedelta(days=3)
+        transaction.category = self.transport
+        transaction.save()
+        self.assertEqual(self._rollups(), self._expected())
+        
+        transaction.type = 'income'
+        transaction.save()
+        self.assertEqual(self._rollups(), self._expected())
+        
+        Transaction.objects.get(pk=first.pk).delete()
+        self.assertEqual(self._rollups(), {(self.food.id, 'expense', today, Decimal('5.50'), 1)})
+
+    def test_rollups_follow_deferred_instances(self):
+        from .category_stats import check_stats
+        today = date.today()
+        first = Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('5.00'),
+                                           type='expense', date=today)
+
+        transaction = Transaction.objects.only('id', 'note').get(pk=first.pk)
+        transaction.note = 'Lunch'
+        transaction.save()
+        self.assertEqual(self._rollups(), {(self.food.id, 'expense', today, Decimal('5.00'), 1)})
+
+        transaction = Transaction.objects.defer('amount').get(pk=first.pk)
+        transaction.amount = Decimal('7.00')
+        transaction.save()
+        self.assertEqual(self._rollups(), self._expected())
+        self.assertEqual(check_stats([self.user.id]), [])
+
+        Transaction.objects.only('id').get(pk=first.pk).delete()
+        self.assertEqual(self._rollups(), set())
+        self.assertEqual(check_stats([self.user.id]), [])
+
+    def test_rebuild_command(self):
+        from django.core.management import call_command
+        from io import StringIO
+        
+        Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('10.00'),
+                                   type='expense', date=date.today())
+        # Simulate drift from a write that bypassed signals
+        Transaction.objects.filter(user=self.user).update(amount=Decimal('99.00'))
+        TransactionDailyRollup.objects.create(user=self.user, category=self.transport, type='expense',
+                                              day=date.today(), total=Decimal('1.00'), count=1)
+        self.assertNotEqual(self._rollups(), self._expected())
+        
+        call_command('rebuild_transaction_rollups', stdout=StringIO())
+        self.assertEqual(self._rollups(), self._expected())
+
+
+class BudgetEvaluationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _add_budget(self, name, period, limit, spent):
+        category = Category.objects.create(name=name, type='expense')
+        budget = Budget.objects.create(user=self.user, category=category,
+                                       limit_amount=Decimal(limit), period=period)
+        Transaction.objects.create(user=self.user, category=category, amount=Decimal(spent),
+                                   type='expense', date=date.today())
+        # Older than both periods, never counted
+        Transaction.objects.create(user=self.user, category=category, amount=Decimal('1000.00'),
+                                   type='expense', date=date.today() - timedelta(days=45))
+        return budget
+    
+    def test_evaluate_budgets(self):
+        from .budgets import evaluate_budgets
+        
+        weekly = self._add_budget('Food', 'weekly', '100.00', '120.00')
+        monthly = self._add_budget('Rent', 'monthly', '500.00', '250.00')
+        
+        statuses = {status['budget'].pk: status for status in evaluate_budgets(self.user)}
+        self.assertEqual(statuses[weekly.pk]['spent'], Decimal('120.00'))
+        self.assertEqual(statuses[weekly.pk]['remaining'], Decimal('-20.00'))
+        self.assertTrue(statuses[weekly.pk]['over_budget'])
+        self.assertEqual(statuses[monthly.pk]['spent'], Decimal('250.00'))
+        self.assertEqual(statuses[monthly.pk]['percentage'], Decimal('50'))
+        self.assertFalse(statuses[monthly.pk]['over_budget'])
+    
+    def test_budgets_list_query_count_independent_of_budget_count(self):
+        """Test that more budgets do not add queries to the budgets page."""
+        from .versioning import bump_categories_data_version
+        self._add_budget('Food', 'weekly', '100.00', '10.00')
+        self._add_budget('Rent', 'monthly', '500.00', '10.00')
+        self.client.get(reverse('budgets_list'))
+        # Both measured requests reload the category registry
+        bump_categories_data_version()
+        cache.clear()
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(reverse('budgets_list'))
+        self.assertEqual(len(response.context['budget_data']), 2)
+        
+        for i in range(6):
+            self._add_budget(f'Extra {i}', 'monthly', '50.00', '60.00')
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('budgets_list'))
+        self.assertEqual(len(response.context['budget_data']), 8)
+        self.assertEqual(len(few), len(many))
+
+
+class TransactionImportTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.salary = Category.objects.create(name='Salary', type='income')
+    
+    def test_import_valid_and_invalid_rows(self):
+        """Test that bad rows are reported without aborting the rest of the file."""
+        from io import StringIO
+        from .importers import import_transactions
+        
+        csv_text = (
+            'Date,Amount,Category,Type,Note\n'
+            '2025-01-05,12.50,food,,Lunch\n'
+            '2025-01-06,2000,Salary,income,\n'
+            'not-a-date,10,Food,,\n'
+            '2025-01-07,-3,Food,,\n'
+            '2025-01-07,3,Unknown,,\n'
+            '2025-01-08,1.234,Food,,\n'
+            '2025-01-08,7,Food,expense,Snacks\n'
+        )
+        result = import_transactions(self.user, StringIO(csv_text), batch_size=2)
+        
+        self.assertEqual(result.created, 3)
+        self.assertEqual(result.error_count, 4)
+        self.assertEqual([line for line, _ in result.errors], [4, 5, 6, 7])
+        self.assertEqual(Transaction.objects.filter(user=self.user, type='expense').count(), 2)
+        
+        # Rollups stay consistent with bulk inserts
+        summary = TransactionDailyRollup.objects.filter(user=self.user, type='expense').aggregate(
+            total=models.Sum('total'), count=models.Sum('count'))
+        self.assertEqual(summary, {'total': Decimal('19.50'), 'count': 2})
+    
+    def test_missing_columns_rejected(self):
+        from io import StringIO
+        from .importers import TransactionImportError, import_transactions
+        
+        with self.assertRaises(TransactionImportError):
+            import_transactions(self.user, StringIO('date,amount\n2025-01-01,10\n'))
+    
+    def test_upload_view(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        
+        self.client.login(username='testuser', password='testpass123')
+        upload = SimpleUploadedFile('history.csv', b'date,amount,category\n2025-02-01,40,Food\n',
+                                    content_type='text/csv')
+        response = self.client.post(reverse('transaction_import'), {'file': upload})
+        self.assertRedirects(response, reverse('transactions_list'))
+        self.assertEqual(Transaction.objects.get(user=self.user).amount, Decimal('40.00'))
+
+    def test_upload_with_oversized_field(self):
+        """Test that a malformed CSV line is reported instead of failing the upload."""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        self.client.login(username='testuser', password='testpass123')
+        content = (
+            'date,amount,category,note\n'
+            '2025-02-01,40,Food,\n'
+            f'2025-02-02,10,Food,{"x" * 200000}\n'
+            '2025-02-03,5,Food,\n'
+        ).encode()
+        upload = SimpleUploadedFile('history.csv', content, content_type='text/csv')
+        response = self.client.post(reverse('transaction_import'), {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 2)
+        [(line, message)] = response.context['result'].errors
+        self.assertEqual(line, 3)
+        self.assertIn('field larger than field limit', message)
+
+    def test_management_command(self):
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from io import StringIO
+        
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('date,amount,category\n2025-02-01,40,Food\n2025-02-02,oops,Food\n')
+        try:
+            out = StringIO()
+            call_command('import_transactions', 'testuser', f.name, '--batch-size', '1', stdout=out)
+        finally:
+            os.unlink(f.name)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+        self.assertIn('Line 3', out.getvalue())
+
+    def test_undecodable_lines_are_row_errors(self):
+        """Test that a bad byte mid-file skips its line and the rest is still imported and signalled."""
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from io import StringIO
+        from .versioning import get_data_version
+
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+            f.write(b'date,amount,category,note\n2025-02-01,40,Food,Caf\xc3\xa9\n'
+                    b'2025-02-02,10,Food,Caf\xe9\n2025-02-03,5,Food,\n')
+        try:
+            out = StringIO()
+            call_command('import_transactions', 'testuser', f.name, '--batch-size', '1', stdout=out)
+        finally:
+            os.unlink(f.name)
+        self.assertEqual(sorted(Transaction.objects.filter(user=self.user).values_list('note', flat=True)),
+                         ['', 'Café'])
+        self.assertIn('Line 3: not valid utf-8-sig', out.getvalue())
+        self.assertIn('Imported 2 transactions', out.getvalue())
+        self.assertEqual(get_data_version(self.user.id), 1)
+
+    def test_text_decoding_error_reports_saved_rows(self):
+        """Test that batches committed before an unreadable text line are signalled and counted."""
+        from .importers import TransactionImportError, import_transactions
+        from .versioning import get_data_version
+
+        def lines():
+            yield 'date,amount,category\n'
+            yield '2025-02-01,40,Food\n'
+            yield '2025-02-02,10,Food\n'
+            yield '2025-02-03,5,Food\n'
+            raise UnicodeDecodeError('utf-8', b'\xe9', 0, 1, 'invalid continuation byte')
+
+        with self.assertRaisesMessage(TransactionImportError, 'Line 5: not valid text (invalid continuation '
+                                                              'byte); 3 rows before it were imported.'):
+            import_transactions(self.user, lines(), batch_size=2)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(get_data_version(self.user.id), 1)
+
+
+class TransactionExportTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.salary = Category.objects.create(name='Salary', type='income')
+        Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('12.50'),
+                                   type='expense', date=date(2025, 1, 5), note='Lunch, with "friends"')
+        Transaction.objects.create(user=self.user, category=self.salary, amount=Decimal('2000.00'),
+                                   type='income', date=date(2025, 1, 6))
+        Transaction.objects.create(user=self.other, category=self.food, amount=Decimal('99.00'),
+                                   type='expense', date=date(2025, 1, 6))
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+    
+    def test_csv_export_applies_filters(self):
+        response = self.client.get(reverse('transaction_export'), {'type': 'expense'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(
+            self._content(response).splitlines(),
+            ['date,amount,category,type,note', '2025-01-05,12.50,Food,expense,"Lunch, with ""friends"""'],
+        )
+    
+    def test_ndjson_export(self):
+        import json
+        
+        response = self.client.get(reverse('transaction_export'), {'format': 'ndjson', 'date_from': '2025-01-01'})
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([row['amount'] for row in rows], ['2000.00', '12.50'])
+        self.assertEqual(rows[0], {'date': '2025-01-06', 'amount': '2000.00', 'category': 'Salary',
+                                   'type': 'income', 'note': ''})
+    
+    def test_csv_export_round_trips_through_import(self):
+        from io import StringIO
+        from .importers import import_transactions
+        
+        exported = self._content(self.client.get(reverse('transaction_export')))
+        result = import_transactions(self.other, StringIO(exported))
+        self.assertEqual((result.created, result.error_count), (2, 0))
+
+    async def test_asgi_export_streams_asynchronously(self):
+        """Test that ASGI requests get an async iterator, which Django streams without buffering."""
+        from django.test import AsyncClient
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(reverse('transaction_export'), {'type': 'expense'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(
+            content.splitlines(),
+            ['date,amount,category,type,note', '2025-01-05,12.50,Food,expense,"Lunch, with ""friends"""'],
+        )
+
+    def test_unknown_format_rejected(self):
+        response = self.client.get(reverse('transaction_export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_filters_ignored(self):
+        """Test that malformed filter values are ignored rather than failing the request."""
+        malformed = {'category': 'abc', 'type': 'other', 'date_from': 'nope', 'date_to': '2025-13-01'}
+        for name, value in malformed.items():
+            response = self.client.get(reverse('transaction_export'), {name: value})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(self._content(response).splitlines()), 3, name)
+        for params in ({'category': '9' * 30}, {'category': '-1', 'date_from': '2025-01-06'}):
+            response = self.client.get(reverse('transaction_export'), params)
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(reverse('transactions_list'), malformed)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['transaction_count'], 2)
+
+
+# Test processes share their locmem cache with themselves
+@override_settings(CACHE_SHARED=True)
+class PayloadCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _add_expense(self, amount):
+        return Transaction.objects.create(user=self.user, category=self.food, amount=Decimal(amount),
+                                          type='expense', date=date.today())
+    
+    def _dashboard_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        return response, [q['sql'] for q in queries.captured_queries if 'transactions_' in q['sql']]
+    
+    def test_home_served_from_cache(self):
+        """Test that a repeated dashboard request runs no transaction queries."""
+        self._add_expense('25.00')
+        response, queries = self._dashboard_queries()
+        self.assertTrue(queries)
+        response, queries = self._dashboard_queries()
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['total_expense'], Decimal('25.00'))
+    
+    @override_settings(CACHE_SHARED=False)
+    def test_per_process_cache_is_bypassed(self):
+        """Test that payloads are not cached where other processes cannot invalidate them."""
+        from .caching import cache_stats, reset_cache_stats
+        reset_cache_stats()
+        self._add_expense('25.00')
+        self._dashboard_queries()
+        response, queries = self._dashboard_queries()
+        self.assertTrue(queries)
+        self.assertEqual(cache_stats(), {})
+    
+    def test_transaction_write_invalidates_dashboard(self):
+        """Test that creating, updating and deleting a transaction refreshes the dashboard."""
+        self.client.get(reverse('home'))
+        transaction = self._add_expense('25.00')
+        self.assertEqual(self.client.get(reverse('home')).context['total_expense'], Decimal('25.00'))
+        
+        transaction.amount = Decimal('30.00')
+        transaction.save()
+        self.assertEqual(self.client.get(reverse('home')).context['total_expense'], Decimal('30.00'))
+        
+        transaction.delete()
+        self.assertEqual(self.client.get(reverse('home')).context['total_expense'], 0)
+    
+    def test_other_users_writes_do_not_invalidate(self):
+        """Test that another user's transactions leave the cached dashboard alone."""
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.get(reverse('home'))
+        Transaction.objects.create(user=other, category=self.food, amount=Decimal('10.00'),
+                                   type='expense', date=date.today())
+        response, queries = self._dashboard_queries()
+        self.assertEqual(queries, [])
+    
+    def test_budget_write_invalidates_budgets(self):
+        """Test that adding a budget refreshes the cached budget list."""
+        self._add_expense('25.00')
+        self.assertEqual(self.client.get(reverse('budgets_list')).context['budget_data'], [])
+        Budget.objects.create(user=self.user, category=self.food, limit_amount=Decimal('100.00'), period='monthly')
+        budget_data = self.client.get(reverse('budgets_list')).context['budget_data']
+        self.assertEqual(len(budget_data), 1)
+        self.assertEqual(budget_data[0]['spent'], Decimal('25.00'))
+    
+    def test_version_keys_invalidate_each_cached_view(self):
+        """Test that data and insight writes bump only the version keys of the pages showing them."""
+        from insights.models import SpendingInsight
+        SpendingInsight.objects.create(user=self.user, insight_type='tip', title='Tip', message='Save more')
+        self._add_expense('25.00')
+        pages = {'home': 'transactions_', 'budgets_list': 'transactions_', 'insights_dashboard': 'insights_spendinginsight'}
+
+        def refreshed():
+            result = set()
+            for name, tables in pages.items():
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+                if any(tables in q['sql'] for q in queries.captured_queries):
+                    result.add(name)
+            return result
+
+        self.assertEqual(refreshed(), set(pages))
+        self.assertEqual(refreshed(), set())
+
+        Budget.objects.create(user=self.user, category=self.food, limit_amount=Decimal('100.00'), period='monthly')
+        self.assertEqual(refreshed(), {'home', 'budgets_list'})
+        self.assertEqual(self.client.get(reverse('budgets_list')).context['budget_data'][0]['spent'],
+                         Decimal('25.00'))
+
+        SpendingInsight.objects.create(user=self.user, insight_type='tip', title='Tip 2', message='Spend less')
+        self.assertEqual(refreshed(), {'insights_dashboard'})
+        self.assertEqual(self.client.get(reverse('insights_dashboard')).context['total_insights'], 2)
+
+        self._add_expense('5.00')
+        self.assertEqual(refreshed(), {'home', 'budgets_list'})
+        self.assertEqual(self.client.get(reverse('home')).context['total_expense'], Decimal('30.00'))
+
+    def test_category_write_invalidates(self):
+        """Test that renaming a category refreshes cached payloads showing it."""
+        self._add_expense('25.00')
+        self.client.get(reverse('home'))
+        self.food.name = 'Groceries'
+        self.food.save()
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['recent_transactions'][0].category.name, 'Groceries')
+    
+    def test_file_based_backend(self):
+        """Test that payloads round-trip through the file-based cache."""
+        import tempfile
+        with tempfile.TemporaryDirectory() as location:
+            caches_setting = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+                'OPTIONS': {'MAX_ENTRIES': 100},
+            }}
+            with override_settings(CACHES=caches_setting):
+                self._add_expense('25.00')
+                self.client.get(reverse('home'))
+                response, queries = self._dashboard_queries()
+                self.assertEqual(queries, [])
+                self.assertEqual(response.context['total_expense'], Decimal('25.00'))
+                self._add_expense('5.00')
+                self.assertEqual(self.client.get(reverse('home')).context['total_expense'], Decimal('30.00'))
+    
+    def test_cache_stats(self):
+        """Test the hit/miss counters and that the endpoint is staff only."""
+        from .caching import reset_cache_stats
+        reset_cache_stats()
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.assertEqual(self.client.get(reverse('cache_stats')).status_code, 302)
+        
+        self.user.is_staff = True
+        self.user.save()
+        stats = self.client.get(reverse('cache_stats')).json()['payloads']
+        self.assertEqual(stats['dashboard'], {'hits': 2, 'misses': 1, 'hit_ratio': 0.6667})
+
+
+class CategoryRegistryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.salary = Category.objects.create(name='Salary', type='income')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _category_queries(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            result = func()
+        return result, [q['sql'] for q in queries.captured_queries if '"transactions_category"' in q['sql']]
+    
+    def test_registry_lookups(self):
+        """Test lookups by id and type."""
+        from .categories import category_registry
+        self.assertEqual(category_registry.get(self.food.pk).name, 'Food')
+        self.assertIsNone(category_registry.get(0))
+        self.assertEqual(category_registry.all('income'), [self.salary])
+        self.assertEqual(category_registry.all(), [self.food, self.salary])
+    
+    def test_steady_state_costs_no_queries(self):
+        """Test that forms and the transaction list do not query categories once loaded."""
+        from .forms import BudgetForm, TransactionForm
+        Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('5.00'),
+                                   type='expense', date=date.today())
+        self.client.get(reverse('transactions_list'))
+        
+        response, queries = self._category_queries(lambda: self.client.get(reverse('transactions_list')))
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'Food')
+        
+        html, queries = self._category_queries(lambda: str(TransactionForm(user=self.user)))
+        self.assertEqual(queries, [])
+        self.assertIn('Salary (income)', html)
+        
+        html, queries = self._category_queries(lambda: str(BudgetForm(user=self.user)))
+        self.assertEqual(queries, [])
+        self.assertNotIn('Salary', html)
+    
+    def test_category_views_invalidate_registry(self):
+        """Test that creating, renaming and deleting a category is seen on the next request."""
+        from .categories import category_registry
+        category_registry.all()
+        
+        self.client.post(reverse('category_create'), {'name': 'Rent', 'type': 'expense'})
+        rent = Category.objects.get(name='Rent')
+        self.assertEqual(category_registry.get(rent.pk), rent)
+        
+        self.client.post(reverse('category_update', args=[rent.pk]), {'name': 'Housing', 'type': 'expense'})
+        self.assertEqual(category_registry.get(rent.pk).name, 'Housing')
+        
+        self.client.post(reverse('category_delete', args=[rent.pk]))
+        self.assertIsNone(category_registry.get(rent.pk))
+
+    def test_writes_from_other_processes_are_seen(self):
+        """Test that the registry follows the database version when the cache is per process."""
+        from django.core.exceptions import ValidationError
+        from .categories import category_registry
+        from .forms import CategoryChoiceField
+        from .versioning import bump_categories_data_version
+        category_registry.all()
+
+        # Another process changes the rows and the version, but not this process's cache
+        Category.objects.filter(pk=self.food.pk).update(name='Groceries')
+        Category.objects.filter(pk=self.salary.pk).delete()
+        bump_categories_data_version()
+        self.assertEqual(category_registry.get(self.food.pk).name, 'Groceries')
+        with self.assertRaises(ValidationError):
+            CategoryChoiceField().clean(str(self.salary.pk))
+
+    def test_category_field_validation(self):
+        """Test that the registry-backed field rejects unknown and wrong-type categories."""
+        from .forms import BudgetForm
+        data = {'limit_amount': '100.00', 'period': 'monthly'}
+        self.assertTrue(BudgetForm(dict(data, category=self.food.pk), user=self.user).is_valid())
+        self.assertIn('category', BudgetForm(dict(data, category=self.salary.pk), user=self.user).errors)
+        self.assertIn('category', BudgetForm(dict(data, category='999'), user=self.user).errors)
+        self.assertIn('category', BudgetForm(dict(data, category='abc'), user=self.user).errors)
+
+
+# Tables that grow with usage and must always be reached through an index
+LARGE_TABLES = {
+    'transactions_transaction',
+    'transactions_transactiondailyrollup',
+    'transactions_budget',
+    'insights_spendinginsight',
+}
+
+
+class QueryPlanAssertions:
+    """
+    Helpers running EXPLAIN QUERY PLAN (SQLite) on every SELECT issued by a
+    callable.
+    """
+    
+    def query_plans(self, func, *args, **kwargs):
+        """Call ``func`` and return ``(result, [(sql, plan_lines), ...])``."""
+        with CaptureQueriesContext(connection) as queries:
+            result = func(*args, **kwargs)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        self.assertTrue(plans, 'No SELECT queries were captured')
+        return result, plans
+    
+    def assertNoFullScans(self, func, *args, **kwargs):
+        """Fail if any SELECT issued by ``func`` scans a large table."""
+        result, plans = self.query_plans(func, *args, **kwargs)
+        for sql, lines in plans:
+            # Subqueries refer to tables through aliases such as U0
+            aliases = {alias: table for table, alias in re.findall(r'"(\w+)" (U\d+|T\d+)', sql)}
+            for line in lines:
+                match = re.match(r'SCAN (\w+)', line)
+                if match and aliases.get(match.group(1), match.group(1)) in LARGE_TABLES:
+                    self.fail(f'Full scan ({line}) in query:\n{sql}')
+        return result, plans
+    
+    def assertUsesIndex(self, plans, index_name):
+        """Fail unless some query plan reads through ``index_name``."""
+        lines = [line for sql, query_lines in plans for line in query_lines]
+        self.assertTrue(any(f'INDEX {index_name} ' in line for line in lines),
+                        f'{index_name} not used:\n' + '\n'.join(lines))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class QueryPlanTest(QueryPlanAssertions, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.salary = Category.objects.create(name='Salary', type='income')
+        Budget.objects.create(user=self.user, category=self.food, limit_amount=Decimal('100.00'), period='weekly')
+        for i in range(12):
+            Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('10.00'),
+                                       type='expense', date=date.today() - timedelta(days=i))
+        Transaction.objects.create(user=self.user, category=self.salary, amount=Decimal('900.00'),
+                                   type='income', date=date.today())
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _get(self, name, params=None):
+        cache.clear()
+        response = self.client.get(reverse(name), params or {})
+        self.assertEqual(response.status_code, 200)
+        if hasattr(response, 'streaming_content'):
+            b''.join(response.streaming_content)
+        return response
+    
+    def test_home(self):
+        response, plans = self.assertNoFullScans(self._get, 'home')
+        self.assertUsesIndex(plans, 'txn_user_keyset')
+    
+    def test_budgets_list(self):
+        self.assertNoFullScans(self._get, 'budgets_list')
+    
+    def test_transactions_list(self):
+        week_ago = str(date.today() - timedelta(days=5))
+        for params, index_name in (
+            ({}, 'txn_user_keyset'),
+            ({'date_from': week_ago, 'date_to': str(date.today())}, 'txn_user_keyset'),
+            ({'type': 'expense'}, 'txn_user_type_keyset'),
+            ({'type': 'expense', 'date_from': week_ago}, 'txn_user_type_keyset'),
+            ({'category': str(self.food.pk)}, 'txn_user_cat_keyset'),
+            ({'category': str(self.food.pk), 'type': 'expense'}, 'txn_user_cat_keyset'),
+        ):
+            with self.subTest(params=params):
+                response, plans = self.assertNoFullScans(self._get, 'transactions_list', params)
+                self.assertUsesIndex(plans, index_name)
+        
+        with override_settings(TRANSACTIONS_PAGE_SIZE=5):
+            first = self._get('transactions_list')
+            response, plans = self.assertNoFullScans(
+                self._get, 'transactions_list', {'after': first.context['page']['next_cursor']}
+            )
+            self.assertUsesIndex(plans, 'txn_user_keyset')
+    
+    def test_export(self):
+        response, plans = self.assertNoFullScans(self._get, 'transaction_export', {'type': 'expense'})
+        self.assertUsesIndex(plans, 'txn_user_type_keyset')
+    
+    def test_unindexed_filter_is_reported(self):
+        """Test that the plan check itself catches a full scan."""
+        with self.assertRaises(AssertionError):
+            self.assertNoFullScans(lambda: list(Transaction.objects.filter(note='lunch')))
+
+
+class SeedFinanceDataTest(TestCase):
+    def test_seed_command(self):
+        """Test that seeding creates users, budgets and consistent rollups."""
+        from io import StringIO
+        from django.core.management import call_command
+        from .rollups import rebuild_rollups
+        
+        call_command('seed_finance_data', users=2, transactions=150, months=6, seed=3, stdout=StringIO())
+        users = User.objects.filter(username__startswith='seed_user_')
+        self.assertEqual(users.count(), 2)
+        for user in users:
+            self.assertEqual(Transaction.objects.filter(user=user).count(), 150)
+            self.assertEqual(Budget.objects.filter(user=user).count(), 4)
+            self.assertTrue(Transaction.objects.filter(user=user, type='income').exists())
+        self.assertTrue(users[0].check_password('password'))
+        
+        rollups = sorted(TransactionDailyRollup.objects.values_list('user_id', 'category_id', 'type', 'day', 'total', 'count'))
+        rebuild_rollups()
+        self.assertEqual(
+            rollups,
+            sorted(TransactionDailyRollup.objects.values_list('user_id', 'category_id', 'type', 'day', 'total', 'count')),
+        )
+    
+    def test_seed_is_reproducible(self):
+        """Test that the same seed generates the same rows."""
+        import random
+        from .seeding import ensure_categories, generate_transactions
+        categories = ensure_categories()
+        first = list(generate_transactions(random.Random(7), categories, 200, date(2025, 6, 30), 12))
+        second = list(generate_transactions(random.Random(7), categories, 200, date(2025, 6, 30), 12))
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), 200)
+        self.assertTrue(all(date(2024, 7, 5) <= row[3] <= date(2025, 6, 30) for row in first))
+
+
+class RequestInstrumentationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.food = Category.objects.create(name='Food', type='expense')
+        Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('5.00'),
+                                   type='expense', date=date.today())
+    
+    def _get(self, name):
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        return client.get(reverse(name))
+    
+    def test_disabled_by_default(self):
+        """Test that no header is added when instrumentation is off."""
+        self.assertNotIn('Server-Timing', self._get('transactions_list'))
+    
+    @override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_SLOW_THRESHOLD_MS=100000)
+    async def test_async_requests_are_not_adapted(self):
+        """Test that the middleware runs async views without thread adapters."""
+        from asgiref.sync import sync_to_async
+        from django.core.handlers.asgi import ASGIHandler
+        from django.test import AsyncClient
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            # Loaded on the thread running the view's queries, as at startup
+            await sync_to_async(ASGIHandler().load_middleware)(is_async=True)
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(re.search(r'"(\d+) queries"', response['Server-Timing']).group(1)), 0)
+    
+    @override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_SLOW_THRESHOLD_MS=100000)
+    def test_server_timing_header(self):
+        """Test the Server-Timing header of an instrumented request."""
+        response = self._get('transactions_list')
+        header = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'view;dur=', 'total;dur='):
+            self.assertIn(metric, header)
+        queries = int(re.search(r'"(\d+) queries"', header).group(1))
+        self.assertEqual(queries, len(response.wsgi_request.performance_stats.queries))
+        self.assertGreater(queries, 0)
+        self.assertGreater(response.wsgi_request.performance_stats.template_ms, 0)
+    
+    @override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_SLOW_THRESHOLD_MS=0)
+    def test_slow_request_logged(self):
+        """Test that requests over the threshold are logged with their SQL."""
+        with self.assertLogs('mydjango.performance', 'WARNING') as logs:
+            self._get('home')
+        self.assertTrue(any('Slow request GET /' in line and 'SELECT' in line for line in logs.output))
+    
+    def test_repeated_queries_detected(self):
+        """Test that a statement run per row is reported as a possible N+1."""
+        from mydjango.middleware import RequestStats
+        for i in range(3):
+            Transaction.objects.create(user=self.user, category=self.food, amount=Decimal('5.00'),
+                                       type='expense', date=date.today())
+        stats = RequestStats()
+        with connection.execute_wrapper(stats):
+            for transaction in Transaction.objects.all():
+                Category.objects.get(pk=transaction.category_id)
+        repeated = stats.repeated_queries(threshold=4)
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual(repeated[0][0], 4)
+        self.assertIn('transactions_category', repeated[0][1])
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        import tempfile
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.metrics_dir.cleanup)
+        override = override_settings(METRICS_DIR=self.metrics_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _series(self, text, prefix):
+        return {
+            line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if line.startswith(prefix)
+        }
+    
+    def test_endpoint_is_staff_only(self):
+        """Test that /metrics requires a staff account."""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+    
+    def test_request_metrics(self):
+        """Test per-view counters and cumulative latency histograms."""
+        from mydjango.metrics import collect
+        before = collect()['counters'].get(
+            ('http_requests_total', (('method', 'GET'), ('status', '200'), ('view', 'home'))), 0
+        )
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        
+        requests = self._series(text, 'http_requests_total{')
+        self.assertEqual(requests['http_requests_total{method="GET",status="200",view="home"}'], before + 2)
+        buckets = [value for key, value in self._series(text, 'http_request_duration_seconds_bucket{').items()
+                   if 'view="home"' in key]
+        self.assertEqual(buckets, sorted(buckets))
+        count = self._series(text, 'http_request_duration_seconds_count{view="home"}')
+        self.assertEqual(buckets[-1], list(count.values())[0])
+    
+    def test_snapshots_of_all_processes_are_merged(self):
+        """Test that totals written by other worker processes are added up."""
+        from mydjango.metrics import collect, render_exposition, write_snapshot
+        key = ('insight_generation_runs_total', (('result', 'generated'),))
+        before = collect()['counters'].get(key, 0)
+        histogram = [1] + [0] * 11 + [0.004, 1]
+        for identity in ('999991-1', '999992-1'):
+            write_snapshot({'counters': {key: 3},
+                            'histograms': {('insight_generation_duration_seconds', ()): histogram}}, identity)
+        data = collect()
+        self.assertEqual(data['counters'][key], before + 6)
+        text = render_exposition(data)
+        self.assertIn('insight_generation_duration_seconds_bucket{le="0.005"}', text)
+        self.assertIn(f'insight_generation_runs_total{{result="generated"}} {before + 6}', text)
+    
+    def test_exited_processes_are_folded(self):
+        """Test that snapshots of exited processes are folded once and a reused pid adds to them."""
+        import os
+        from mydjango.metrics import RETIRED_SNAPSHOT, collect, write_snapshot
+        key = ('insight_generation_runs_total', (('result', 'failed'),))
+        before = collect()['counters'].get(key, 0)
+        write_snapshot({'counters': {key: 2}, 'histograms': {}}, '999991-1')
+        self.assertEqual(collect()['counters'][key], before + 2)
+        self.assertEqual(collect()['counters'][key], before + 2)
+        names = os.listdir(self.metrics_dir.name)
+        self.assertIn(RETIRED_SNAPSHOT, names)
+        self.assertNotIn('metrics-999991-1.json', names)
+        
+        # A later process with the same pid does not overwrite those totals
+        write_snapshot({'counters': {key: 1}, 'histograms': {}}, '999991-2')
+        self.assertEqual(collect()['counters'][key], before + 3)
+        
+        # A snapshot left behind by an interrupted fold is not counted twice
+        write_snapshot({'counters': {key: 1}, 'histograms': {}}, '999991-2')
+        self.assertEqual(collect()['counters'][key], before + 3)
+
+    def test_shards_of_exited_threads_are_folded(self):
+        """Test that short-lived threads do not leave a shard each behind."""
+        import threading
+        from mydjango.metrics import MetricsRegistry
+        metrics = MetricsRegistry()
+        key = ('insight_generation_runs_total', (('result', 'generated'),))
+
+        def record():
+            metrics.inc(key[0], dict(key[1]))
+            metrics.observe('insight_generation_duration_seconds', 0.02)
+
+        for _ in range(20):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        record()
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'][key], 21)
+        self.assertEqual(snapshot['histograms'][('insight_generation_duration_seconds', ())][-1], 21)
+        self.assertEqual(len(metrics._shards), 1)
+        self.assertEqual(metrics.snapshot(), snapshot)
+
+
+class ConcurrentQueriesTest(TransactionTestCase):
+    """Test the async dashboard and budget loaders."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Food', type='expense')
+        Budget.objects.create(user=self.user, category=self.category,
+                              limit_amount=Decimal('100.00'), period='monthly')
+        for amount in ('10.00', '25.00', '40.00'):
+            Transaction.objects.create(user=self.user, category=self.category, amount=Decimal(amount),
+                                       type='expense', date=date.today())
+    
+    def _thread_names(self, enabled):
+        import threading
+        from asgiref.sync import async_to_sync
+        from mydjango.concurrency import run_queries
+        
+        def current():
+            return threading.current_thread().name
+        with patch('mydjango.concurrency.concurrent_queries_enabled', return_value=enabled):
+            return async_to_sync(run_queries)(current, current, current)
+    
+    def test_sequential_fallback(self):
+        """On SQLite everything runs on the request's thread."""
+        self.assertEqual(len(set(self._thread_names(enabled=False))), 1)
+    
+    def test_concurrent_results_match_sync(self):
+        from asgiref.sync import async_to_sync
+        from .budgets import aevaluate_budgets, evaluate_budgets
+        from .dashboard import abuild_dashboard, build_dashboard
+        
+        with patch('mydjango.concurrency.concurrent_queries_enabled', return_value=True):
+            dashboard = async_to_sync(abuild_dashboard)(self.user)
+            budgets = async_to_sync(aevaluate_budgets)(self.user)
+        self.assertEqual(dashboard, build_dashboard(self.user))
+        self.assertEqual(
+            [(status['budget'].pk, status['spent']) for status in budgets],
+            [(status['budget'].pk, status['spent']) for status in evaluate_budgets(self.user)],
+        )
+        self.assertEqual(budgets[0]['spent'], Decimal('75.00'))
+
+
+class TransactionSearchTest(QueryPlanAssertions, TestCase):
+    """Test full-text search over transaction notes."""
+    
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='otheruser', password='testpass123')
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.salary = Category.objects.create(name='Salary', type='income')
+        self.lunch = self._add('12.50', 'Lunch with friends at the café')
+        self.groceries = self._add('80.00', 'Weekly groceries', days=1)
+        self.lunch_lunch = self._add('20.00', 'Lunch, lunch again', days=2)
+        self._add('3000.00', 'Salary for lunch month', category=self.salary, type='income', days=3)
+        Transaction.objects.create(user=self.other, category=self.food, amount=Decimal('9.00'),
+                                   type='expense', date=date.today(), note='Lunch')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _add(self, amount, note, category=None, type='expense', days=0):
+        return Transaction.objects.create(user=self.user, category=category or self.food, amount=Decimal(amount),
+                                          type=type, date=date.today() - timedelta(days=days), note=note)
+    
+    def _search(self, text, **params):
+        from .search import search_transactions
+        return list(search_transactions(Transaction.objects.filter(user=self.user, **params), text, self.user.id))
+    
+    def test_words_and_prefixes_match(self):
+        self.assertEqual(self._search('GROC'), [self.groceries])
+        self.assertEqual(self._search('cafe'), [self.lunch])
+        self.assertEqual(self._search('lunch friends'), [self.lunch])
+        self.assertEqual(self._search('lunch dinner'), [])
+        self.assertEqual(self._search('"; DROP TABLE'), [])
+        self.assertEqual(self._search('  '), [])
+    
+    def test_results_are_ranked_and_scoped_to_user(self):
+        results = self._search('lunch')
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], self.lunch_lunch)
+        self.assertEqual(self._search('lunch', type='expense'), [self.lunch_lunch, self.lunch])
+    
+    def test_index_follows_writes(self):
+        self.groceries.note = 'Market vegetables'
+        self.groceries.save()
+        self.assertEqual(self._search('groceries'), [])
+        self.assertEqual(self._search('vegetables'), [self.groceries])
+        self.groceries.delete()
+        self.assertEqual(self._search('vegetables'), [])
+        
+        from .importers import insert_transactions
+        insert_transactions(self.user.id, [
+            (self.food.id, 'expense', Decimal('5.00'), date.today(), 'Imported vegetables'),
+            (self.food.id, 'expense', Decimal('6.00'), date.today(), 'Imported fruit'),
+        ])
+        self.assertEqual([t.note for t in self._search('vegetables')], ['Imported vegetables'])
+        self.assertEqual(sorted(t.note for t in self._search('imported')), ['Imported fruit', 'Imported vegetables'])
+    
+    def test_list_view_search(self):
+        response = self.client.get(reverse('transactions_list'), {'q': 'lunch', 'type': 'expense'})
+        self.assertEqual(list(response.context['transactions']), [self.lunch_lunch, self.lunch])
+        self.assertEqual(response.context['transaction_count'], 2)
+        self.assertEqual(response.context['total_expense'], Decimal('32.50'))
+        self.assertContains(response, 'value="lunch"')
+    
+    @override_settings(TRANSACTIONS_PAGE_SIZE=2)
+    def test_list_view_search_pages(self):
+        response = self.client.get(reverse('transactions_list'), {'q': 'lunch'})
+        self.assertTrue(response.context['page']['has_next'])
+        response = self.client.get(reverse('transactions_list'), {'q': 'lunch', 'page': 2})
+        self.assertEqual(len(response.context['transactions']), 1)
+        self.assertFalse(response.context['page']['has_next'])
+        self.assertTrue(response.context['page']['has_previous'])
+    
+    @override_settings(TRANSACTIONS_PAGE_SIZE=2)
+    def test_search_page_past_the_end(self):
+        for page_number in ('3', '9' * 30):
+            response = self.client.get(reverse('transactions_list'), {'q': 'lunch', 'page': page_number})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['page']['previous_page'], 1)
+            self.assertEqual(len(response.context['transactions']), 1)
+    
+    def test_export_search(self):
+        response = self.client.get(reverse('transaction_export'), {'q': 'groceries'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(content.strip().splitlines()), 2)
+        self.assertIn('Weekly groceries', content)
+    
+    @skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+    def test_search_uses_full_text_index(self):
+        result, plans = self.assertNoFullScans(self._search, 'lunch')
+        lines = [line for sql, query_lines in plans for line in query_lines]
+        self.assertTrue(any('VIRTUAL TABLE INDEX' in line for line in lines), '\n'.join(lines))
+
+        # Ranked, the index drives the join rather than being probed per row
+        # of the user, even once counting drops the ordering
+        from .search import search_transactions
+
+        def ranked_count():
+            return search_transactions(Transaction.objects.filter(user=self.user), 'lunch', self.user.id).count()
+        result, plans = self.assertNoFullScans(ranked_count)
+        self.assertEqual(result, 3)
+        lines = plans[-1][1]
+        self.assertIn('VIRTUAL TABLE INDEX', lines[0], '\n'.join(lines))
+
+        # Unranked, the index is read once as a list rather than probed per row
+        def unranked():
+            return list(search_transactions(Transaction.objects.filter(user=self.user), 'lunch',
+                                            self.user.id, ranked=False))
+        result, plans = self.assertNoFullScans(unranked)
+        self.assertEqual(len(result), 3)
+        lines = [line for sql, query_lines in plans for line in query_lines]
+        self.assertTrue(any('LIST SUBQUERY' in line for line in lines), '\n'.join(lines))
+
+    @skipUnless(connection.vendor == 'sqlite', 'Only SQLite has a search index to check')
+    def test_check_search_index_finds_rows_inserted_without_signals(self):
+        from io import StringIO
+        from django.core.management import call_command
+        bulk = Transaction.objects.bulk_create([
+            Transaction(user=self.user, category=self.food, amount=Decimal('7.00'), type='expense',
+                        date=date.today(), note='Bulk vegetables'),
+            Transaction(user=self.other, category=self.food, amount=Decimal('8.00'), type='expense',
+                        date=date.today(), note='Other vegetables'),
+        ])
+        self.assertEqual(self._search('vegetables'), [])
+
+        out = StringIO()
+        call_command('check_search_index', '--user', 'testuser', stdout=out)
+        self.assertIn(f'transaction {bulk[0].pk} is not indexed', out.getvalue())
+        self.assertIn('1 transactions of user testuser are not indexed', out.getvalue())
+
+        call_command('check_search_index', '--repair', stdout=StringIO())
+        self.assertEqual([t.note for t in self._search('vegetables')], ['Bulk vegetables'])
+        out = StringIO()
+        call_command('check_search_index', stdout=out)
+        self.assertIn('The search index of all users is complete', out.getvalue())
+
+
+class BalanceHistoryTest(TestCase):
+    """Test balance series built with window functions and monthly checkpoints."""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.salary = Category.objects.create(name='Salary', type='income')
+        self.food = Category.objects.create(name='Food', type='expense')
+        self._add(self.salary, 'income', '1000.00', date(2025, 11, 28))
+        self._add(self.food, 'expense', '40.00', date(2025, 12, 31))
+        self._add(self.food, 'expense', '25.50', date(2026, 1, 2))
+        self._add(self.salary, 'income', '500.00', date(2026, 1, 2))
+        self._add(self.food, 'expense', '10.00', date(2026, 1, 6))
+        self._add(self.food, 'expense', '4.50', date(2026, 2, 3))
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _add(self, category, type, amount, day):
+        return Transaction.objects.create(user=self.user, category=category, type=type,
+                                          amount=Decimal(amount), date=day)
+    
+    def _series(self, granularity, start=None, end=date(2026, 2, 28)):
+        from .balances import balance_series
+        return balance_series(self.user.id, granularity, start, end)
+    
+    def test_daily_weekly_and_monthly_series(self):
+        series = self._series('day', date(2026, 1, 1))
+        self.assertEqual(series['opening_balance'], 960.0)
+        self.assertEqual(series['dates'], ['2026-01-02', '2026-01-06', '2026-02-03'])
+        self.assertEqual(series['net'], [474.5, -10.0, -4.5])
+        self.assertEqual(series['balance'], [1434.5, 1424.5, 1420.0])
+        
+        series = self._series('week', date(2026, 1, 1))
+        self.assertEqual(series['start'], '2025-12-29')
+        self.assertEqual(series['opening_balance'], 1000.0)
+        self.assertEqual(series['dates'], ['2025-12-29', '2026-01-05', '2026-02-02'])
+        self.assertEqual(series['balance'], [1434.5, 1424.5, 1420.0])
+        
+        series = self._series('month', date(2025, 1, 1))
+        self.assertEqual(series['dates'], ['2025-11-01', '2025-12-01', '2026-01-01', '2026-02-01'])
+        self.assertEqual(series['balance'], [1000.0, 960.0, 1424.5, 1420.0])
+    
+    def test_running_balance_uses_window_function(self):
+        with CaptureQueriesContext(connection) as queries:
+            self._series('day', date(2026, 1, 1))
+        self.assertTrue(any(re.search(r'\bOVER \(ORDER BY', q['sql']) for q in queries.captured_queries))
+    
+    def test_checkpoints_are_reused_and_invalidated(self):
+        from .models import BalanceCheckpoint
+        self._series('day', date(2026, 2, 10))
+        self.assertEqual(
+            dict(BalanceCheckpoint.objects.filter(user=self.user).values_list('month', 'balance')),
+            {date(2025, 12, 1): Decimal('1000.00'), date(2026, 1, 1): Decimal('960.00'),
+             date(2026, 2, 1): Decimal('1424.50')},
+        )
+        # Checkpoint lookup, days of the month before start, the series
+        with self.assertNumQueries(3):
+            self.assertEqual(self._series('day', date(2026, 2, 10))['opening_balance'], 1420.0)
+        
+        # A backdated write drops the checkpoints after its day only
+        self._add(self.food, 'expense', '100.00', date(2025, 12, 15))
+        self.assertEqual(
+            list(BalanceCheckpoint.objects.filter(user=self.user).values_list('month', flat=True)),
+            [date(2025, 12, 1)],
+        )
+        self.assertEqual(self._series('day', date(2026, 2, 10))['opening_balance'], 1320.0)
+        
+        from .importers import insert_transactions
+        insert_transactions(self.user.id, [(self.salary.id, 'income', Decimal('80.00'), date(2026, 1, 20), '')])
+        self.assertEqual(self._series('day', date(2026, 2, 10))['opening_balance'], 1400.0)
+        
+        from .rollups import rebuild_rollups
+        rebuild_rollups(self.user)
+        self.assertFalse(BalanceCheckpoint.objects.filter(user=self.user).exists())
+        self.assertEqual(self._series('month', date(2026, 2, 1))['opening_balance'], 1404.5)
+
+    def test_checkpoints_computed_before_a_write_are_not_saved(self):
+        from .models import BalanceCheckpoint
+        from . import balances
+        running_totals = balances._running_totals
+
+        def stale_running_totals(*args, **kwargs):
+            # The rollups are read, then a backdated write commits before the checkpoints are saved
+            rows = list(running_totals(*args, **kwargs))
+            self._add(self.food, 'expense', '100.00', date(2025, 12, 15))
+            return rows
+
+        with patch.object(balances, '_running_totals', stale_running_totals):
+            self.assertEqual(balances.checkpoint_balance(self.user.id, date(2026, 2, 1)), Decimal('1424.50'))
+        self.assertFalse(BalanceCheckpoint.objects.filter(user=self.user).exists())
+        self.assertEqual(self._series('day', date(2026, 2, 10))['opening_balance'], 1320.0)
+
+    def test_balance_history_view(self):
+        response = self.client.get(reverse('balance_history'), {
+            'granularity': 'month', 'start': '2026-01-15', 'end': '2026-02-28',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b', ', response.content)
+        series = response.json()
+        self.assertEqual(series['opening_balance'], 960.0)
+        self.assertEqual(series['balance'], [1424.5, 1420.0])
+        
+        url = reverse('balance_history')
+        self.assertEqual(self.client.get(url, {'granularity': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '15/01/2026'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2026-02-01', 'end': '2026-01-01'}).status_code, 400)
+        
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class UserCategoryStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.food = Category.objects.create(name='Food', type='expense')
+        self.rent = Category.objects.create(name='Rent', type='expense')
+        self.today = date.today()
+    
+    def _add(self, category, amount, day, type_='expense'):
+        return Transaction.objects.create(user=self.user, category=category, amount=Decimal(amount),
+                                          type=type_, date=day)
+    
+    def _stats(self, category, type_='expense'):
+        from .models import UserCategoryStats
+        return UserCategoryStats.objects.filter(user=self.user, category=category, type=type_).first()
+    
+    def test_statistics_follow_writes(self):
+        from .category_stats import check_stats, current_periods
+        month, week = current_periods()
+        old = self._add(self.food, '30.00', month - timedelta(days=40))
+        small = self._add(self.food, '5.00', self.today)
+        self._add(self.food, '12.50', self.today)
+        
+        stats = self._stats(self.food)
+        self.assertEqual((stats.count, stats.total), (3, Decimal('47.50')))
+        self.assertEqual((stats.min_amount, stats.max_amount), (Decimal('5.00'), Decimal('30.00')))
+        self.assertEqual((stats.first_date, stats.last_date), (old.date, self.today))
+        self.assertEqual((stats.month, stats.month_total), (month, Decimal('17.50')))
+        self.assertEqual((stats.week, stats.week_total), (week, Decimal('17.50')))
+        
+        # Removing the extremes re-reads them
+        small.amount = Decimal('20.00')
+        small.save()
+        old.delete()
+        stats = self._stats(self.food)
+        self.assertEqual((stats.count, stats.total), (2, Decimal('32.50')))
+        self.assertEqual((stats.min_amount, stats.max_amount), (Decimal('12.50'), Decimal('20.00')))
+        self.assertEqual(stats.first_date, self.today)
+        self.assertEqual(stats.month_total, Decimal('32.50'))
+        
+        # Moving a transaction between categories and types
+        small.category = self.rent
+        small.save()
+        self.assertEqual(self._stats(self.rent).total, Decimal('20.00'))
+        self.assertEqual(self._stats(self.food).total, Decimal('12.50'))
+        small.type = 'income'
+        small.save()
+        self.assertIsNone(self._stats(self.rent))
+        self.assertEqual(self._stats(self.rent, 'income').count, 1)
+        self.assertEqual(check_stats(), [])
+    
+    def test_write_and_derived_rows_commit_together(self):
+        self._add(self.food, '5.00', self.today)
+        with patch('transactions.category_stats.apply_changes', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self._add(self.food, '7.00', self.today)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(TransactionDailyRollup.objects.get().count, 1)
+        
+        # One statistics row is read and written, spread included
+        with CaptureQueriesContext(connection) as queries:
+            self._add(self.food, '7.00', self.today)
+        self.assertEqual(len([q for q in queries if 'stats' in q['sql']]), 2)
+        self.assertEqual(self._stats(self.food).sketch['heights'], [5.0, 7.0])
+    
+    def test_periods_roll_over(self):
+        from .balances import next_month
+        from .category_stats import current_stats, month_totals
+        self._add(self.food, '10.00', self.today)
+        following = next_month(self.today)
+        self._add(self.food, '25.00', following + timedelta(days=3))
+        stats = self._stats(self.food)
+        self.assertEqual(stats.month_total, Decimal('10.00'))
+        
+        later = following + timedelta(days=10)
+        self.assertEqual(month_totals([self.user.id], today=later),
+                         {self.user.id: {'income': Decimal('0'), 'expenses': Decimal('25.00')}})
+        stats = self._stats(self.food)
+        self.assertEqual((stats.month, stats.month_total), (following, Decimal('25.00')))
+        self.assertEqual(stats.week_total, 0)
+        with self.assertNumQueries(1):
+            current_stats([self.user.id], today=later)
+    
+    def test_bulk_writes_and_drift_repair(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .importers import insert_transactions
+        from .models import UserCategoryStats
+        insert_transactions(self.user.id, [
+            (self.food.id, 'expense', Decimal('8.00'), self.today, ''),
+            (self.food.id, 'expense', Decimal('2.00'), self.today - timedelta(days=400), ''),
+            (self.rent.id, 'expense', Decimal('500.00'), self.today, ''),
+        ])
+        stats = self._stats(self.food)
+        self.assertEqual((stats.count, stats.total, stats.min_amount), (2, Decimal('10.00'), Decimal('2.00')))
+        
+        out = StringIO()
+        call_command('check_category_stats', stdout=out)
+        self.assertIn('are consistent', out.getvalue())
+        
+        UserCategoryStats.objects.filter(category=self.food).update(total=Decimal('99.00'), count=7)
+        UserCategoryStats.objects.filter(category=self.rent).delete()
+        out = StringIO()
+        call_command('check_category_stats', '--user', 'testuser', stdout=out)
+        self.assertIn('total is 99.00, expected 10', out.getvalue())
+        self.assertIn('missing row for 1 transactions', out.getvalue())
+        self.assertIn('2 category statistics rows drifted', out.getvalue())
+        
+        out = StringIO()
+        call_command('check_category_stats', '--repair', stdout=out)
+        self.assertIn('Repaired 2 category statistics rows', out.getvalue())
+        self.assertEqual(self._stats(self.food).total, Decimal('10.00'))
+        self.assertEqual(self._stats(self.rent).count, 1)
+        self.assertEqual(self._stats(self.rent).sketch['heights'], [500.0])
+        out = StringIO()
+        call_command('check_category_stats', stdout=out)
+        self.assertIn('are consistent', out.getvalue())
+
+
+class TransactionRowsTest(TestCase):
+    """Test that the compiled row renderer matches the template loop."""
+    
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        salary = Category.objects.create(name='Salary', type='income')
+        snacks = Category.objects.create(name='Snacks & <Treats>', type='expense')
+        today = date.today()
+        Transaction.objects.create(user=self.user, category=salary, amount=Decimal('2500.5'), type='income', date=today)
+        Transaction.objects.create(user=self.user, category=snacks, amount=Decimal('12.00'), type='expense',
+                                   date=today, note='<script>"tea" & cake</script>')
+        Transaction.objects.create(user=self.user, category=snacks, amount=Decimal('0.99'), type='expense',
+                                   date=today - timedelta(days=40))
+    
+    @staticmethod
+    def normalize(html):
+        return re.sub(r'\s+<', '<', re.sub(r'>\s+', '>', html)).strip()
+    
+    def rows(self, compiled):
+        with override_settings(TRANSACTION_ROWS_COMPILED=compiled):
+            response = self.client.get(reverse('transactions_list'))
+        self.assertEqual(response.status_code, 200)
+        html = response.content.decode()
+        return self.normalize(html[html.index('<tbody>'):html.index('</tbody>')])
+    
+    def test_compiled_rows_match_template(self):
+        compiled = self.rows(True)
+        self.assertEqual(compiled, self.rows(False))
+        self.assertEqual(compiled.count('<tr>'), 3)
+        self.assertIn('Snacks &amp; &lt;Treats&gt;', compiled)
+        self.assertIn('&lt;script&gt;&quot;tea&quot; &amp; cake&lt;/script&gt;', compiled)
+        self.assertIn('+GH₵2500.50', compiled)
+        self.assertIn('-GH₵0.99', compiled)
+        self.assertIn('>—<', compiled)
+        transaction = Transaction.objects.get(amount=Decimal('0.99'))
+        self.assertIn(f'href="{reverse("transaction_delete", args=[transaction.pk])}"', compiled)
+    
+    def test_render_benchmark_scenarios(self):
+        from insights.benchmarks import ROWS_PER_RENDER, render_sample, run_benchmarks
+        self.assertEqual(len(render_sample(self.user)), ROWS_PER_RENDER)
+        results = run_benchmarks(
+            self.user, ['transaction_rows_template', 'transaction_rows_compiled'], iterations=1, warmup=0,
+        )
+        self.assertEqual([result['queries'] for result in results], [0, 0])
+    
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [settings.BASE_DIR / 'templates'],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'context_processors': settings.TEMPLATES[0]['OPTIONS']['context_processors'],
+            'loaders': [('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ])],
+        },
+    }])
+    def test_explicit_cached_loader(self):
+        # The loader configuration of production_settings
+        self.assertEqual(self.rows(True), self.rows(False))
+        from django.template.loader import get_template
+        self.assertTrue(get_template('admin/base.html'))
@@ -7,6 +7,9 @@ urlpatterns = [
     # Transactions
     path('transactions/', views.transactions_list, name='transactions_list'),
     path('transactions/add/', views.transaction_create, name='transaction_create'),
+    path('transactions/import/', views.transaction_import, name='transaction_import'),
+    path('transactions/export/', views.transaction_export, name='transaction_export'),
+    path('balance/history/', views.balance_history, name='balance_history'),
     path('transactions/<int:pk>/edit/', views.transaction_update, name='transaction_update'),
     path('transactions/<int:pk>/delete/', views.transaction_delete, name='transaction_delete'),
     
@@ -22,6 +25,9 @@ urlpatterns = [
     path('budgets/<int:pk>/edit/', views.budget_update, name='budget_update'),
     path('budgets/<int:pk>/delete/', views.budget_delete, name='budget_delete'),
     
+    # Cache monitoring (staff only)
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+    
     # Placeholder
     path('<str:page>/', views.placeholder, name='placeholder'),
 ]
@@ -0,0 +1,77 @@
+"""
+Per-user data version markers, and the version marker of the Category table.
+"""
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import CategoryVersion, UserDataVersion
+
+
+def bump_data_version(user_id, create=True):
+    """
+    Increment the data version of a user.
+    The marker is created if missing unless ``create`` is False, which delete
+    handlers use so a cascading user deletion never recreates it.
+    """
+    if UserDataVersion.objects.filter(user_id=user_id).update(version=F('version') + 1):
+        return
+    if not create:
+        return
+    try:
+        with transaction.atomic():
+            UserDataVersion.objects.create(user_id=user_id, version=1)
+    except IntegrityError:
+        # Created concurrently by another writer
+        UserDataVersion.objects.filter(user_id=user_id).update(version=F('version') + 1)
+
+
+def get_data_version(user_id):
+    """
+    Return the current data version of a user (0 if never written).
+    """
+    return (
+        UserDataVersion.objects.filter(user_id=user_id)
+        .values_list('version', flat=True)
+        .first()
+    ) or 0
+
+
+def ensure_data_version(user_id):
+    """
+    Return the current data version of a user, creating the marker if needed
+    so that later deletes have a row to bump.
+    """
+    marker, _ = UserDataVersion.objects.get_or_create(user_id=user_id)
+    return marker.version
+
+
+# Primary key of the single CategoryVersion row
+CATEGORY_VERSION_ID = 1
+
+
+def bump_categories_data_version():
+    """
+    Increment the version of the Category table. A new marker starts from a
+    timestamp, like the cache versions, so a recreated one never matches an
+    older registry snapshot.
+    """
+    markers = CategoryVersion.objects.filter(pk=CATEGORY_VERSION_ID)
+    if markers.update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            CategoryVersion.objects.create(pk=CATEGORY_VERSION_ID, version=time.time_ns())
+    except IntegrityError:
+        # Created concurrently by another writer
+        markers.update(version=F('version') + 1)
+
+
+def get_categories_data_version():
+    """Return the current version of the Category table (0 if never written)."""
+    return (
+        CategoryVersion.objects.filter(pk=CATEGORY_VERSION_ID)
+        .values_list('version', flat=True)
+        .first()
+    ) or 0
@@ -1,125 +1,252 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Sum, Q
-from datetime import datetime, timedelta
-from .models import Transaction, Category, Budget
-from .forms import TransactionForm, CategoryForm, BudgetForm
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Sum, Q
+import csv
+from datetime import date
+from itertools import islice
+import json
+from .models import Transaction, TransactionDailyRollup, Category, Budget
+from .forms import TransactionForm, CategoryForm, BudgetForm, TransactionImportForm
+from .balances import GRANULARITIES, balance_series
+from .budgets import aevaluate_budgets
+from .caching import acached_payload, cache_stats as get_cache_stats
+from .categories import category_registry
+from .dashboard import abuild_dashboard
+from .importers import TransactionImportError, import_transactions
+from .pagination import paginate_ranked, paginate_transactions
+from .search import search_transactions
 
 
-def home(request):
-    if request.user.is_authenticated:
+async def home(request):
+    user = await request.auser()
+    if user.is_authenticated:
         # Authenticated users see dashboard with real data
-        import json
-        from datetime import datetime, timedelta
-        
-        # Calculate summary stats
-        transactions = Transaction.objects.filter(user=request.user)
-        total_income = transactions.filter(type='income').aggregate(Sum('amount'))['amount__sum'] or 0
-        total_expense = transactions.filter(type='expense').aggregate(Sum('amount'))['amount__sum'] or 0
-        balance = total_income - total_expense
-        
-        # Get current month data for charts
-        now = datetime.now()
-        current_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # Monthly income vs expenses (last 4 weeks)
-        weekly_data = []
-        for i in range(4):
-            week_start = current_month_start - timedelta(weeks=3-i)
-            week_end = week_start + timedelta(days=7)
-            
-            week_income = transactions.filter(
-                type='income',
-                date__gte=week_start,
-                date__lt=week_end
-            ).aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            week_expense = transactions.filter(
-                type='expense',
-                date__gte=week_start,
-                date__lt=week_end
-            ).aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            weekly_data.append({
-                'week': f'Week {i+1}',
-                'income': float(week_income),
-                'expense': float(week_expense)
-            })
-        
-        # Category breakdown
-        categories = Category.objects.filter(type='expense')
-        category_data = []
-        for category in categories:
-            amount = transactions.filter(
-                type='expense',
-                category=category
-            ).aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            if amount > 0:
-                category_data.append({
-                    'name': category.name,
-                    'amount': float(amount)
-                })
-        
-        # Recent transactions
-        recent_transactions = transactions.order_by('-date', '-created_at')[:5]
+        dashboard = await acached_payload('dashboard', user.id, lambda: abuild_dashboard(user))
         
         context = {
-            'total_income': total_income,
-            'total_expense': total_expense,
-            'balance': balance,
-            'weekly_data': json.dumps(weekly_data),
-            'category_data': json.dumps(category_data),
-            'recent_transactions': recent_transactions,
+            'total_income': dashboard['total_income'],
+            'total_expense': dashboard['total_expense'],
+            'balance': dashboard['balance'],
+            'weekly_data': json.dumps(dashboard['weekly_data']),
+            'category_data': json.dumps(dashboard['category_data']),
+            'recent_transactions': dashboard['recent_transactions'],
         }
         
-        return render(request, 'index.html', context)
+        # Rendering reads the session and messages, which are synchronous
+        return await sync_to_async(render)(request, 'index.html', context)
     else:
         # Non-authenticated users see landing page
-        return render(request, 'landing.html')
+        return await sync_to_async(render)(request, 'landing.html')
+
+
+TRANSACTION_FILTERS = ('category', 'type', 'date_from', 'date_to')
+
+
+def _valid_filter(name, value):
+    if name == 'category':
+        return value.isdigit() and int(value) < 2 ** 63
+    if name == 'type':
+        return value in ('income', 'expense')
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _transaction_filters(request):
+    """
+    The transaction list filters from the query string; malformed values
+    (a non-numeric category, a date that is not YYYY-MM-DD) are ignored.
+    """
+    filters = {}
+    for name in TRANSACTION_FILTERS:
+        value = (request.GET.get(name) or '').strip()
+        filters[name] = value if value and _valid_filter(name, value) else None
+    return filters
+
+
+def _apply_transaction_filters(queryset, filters, date_field='date'):
+    """
+    Apply the transaction list filters to a Transaction or rollup queryset.
+    """
+    if filters['category']:
+        queryset = queryset.filter(category_id=filters['category'])
+    if filters['type']:
+        queryset = queryset.filter(type=filters['type'])
+    if filters['date_from']:
+        queryset = queryset.filter(**{f'{date_field}__gte': filters['date_from']})
+    if filters['date_to']:
+        queryset = queryset.filter(**{f'{date_field}__lte': filters['date_to']})
+    return queryset
 
 
 @login_required
 def transactions_list(request):
-    transactions = Transaction.objects.filter(user=request.user).order_by('-date', '-created_at')
-    
     # Filtering
-    category_filter = request.GET.get('category')
-    type_filter = request.GET.get('type')
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    if category_filter:
-        transactions = transactions.filter(category_id=category_filter)
-    if type_filter:
-        transactions = transactions.filter(type=type_filter)
-    if date_from:
-        transactions = transactions.filter(date__gte=date_from)
-    if date_to:
-        transactions = transactions.filter(date__lte=date_to)
+    filters = _transaction_filters(request)
+    transactions = _apply_transaction_filters(
+        Transaction.objects.filter(user=request.user), filters
+    )
     
-    # Summary calculations
-    total_income = transactions.filter(type='income').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_expense = transactions.filter(type='expense').aggregate(Sum('amount'))['amount__sum'] or 0
+    search = (request.GET.get('q') or '').strip()
+    page_size = getattr(settings, 'TRANSACTIONS_PAGE_SIZE', 50)
+    if search:
+        # Search results are ranked by relevance and paged by number;
+        # rollups have no notes, so the summary is computed over the matches
+        summary = search_transactions(transactions, search, request.user.id, ranked=False).aggregate(
+            total_income=Sum('amount', filter=Q(type='income')),
+            total_expense=Sum('amount', filter=Q(type='expense')),
+            count=Count('id'),
+        )
+        page = paginate_ranked(
+            search_transactions(transactions, search, request.user.id),
+            request.GET.get('page'),
+            page_size=page_size,
+            count=summary['count'],
+        )
+    else:
+        # Summary calculations from the daily rollups
+        summary = _apply_transaction_filters(
+            TransactionDailyRollup.objects.filter(user=request.user), filters, date_field='day'
+        ).aggregate(
+            total_income=Sum('total', filter=Q(type='income')),
+            total_expense=Sum('total', filter=Q(type='expense')),
+            count=Sum('count'),
+        )
+        # Keyset pagination; categories are attached from the registry
+        page = paginate_transactions(
+            transactions,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=page_size,
+        )
+    total_income = summary['total_income'] or 0
+    total_expense = summary['total_expense'] or 0
     balance = total_income - total_expense
     
-    categories = Category.objects.all()
+    category_registry.attach(page['object_list'])
+    categories = category_registry.all()
     
     context = {
-        'transactions': transactions,
+        'transactions': page['object_list'],
+        'page': page,
+        'transaction_count': summary['count'] or 0,
         'categories': categories,
         'total_income': total_income,
         'total_expense': total_expense,
         'balance': balance,
-        'category_filter': category_filter,
-        'type_filter': type_filter,
-        'date_from': date_from,
-        'date_to': date_to,
+        'category_filter': filters['category'],
+        'type_filter': filters['type'],
+        'date_from': filters['date_from'],
+        'date_to': filters['date_to'],
+        'search': search,
     }
     return render(request, 'transactions/transactions_list.html', context)
 
 
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv output."""
+    
+    def write(self, value):
+        return value
+
+
+EXPORT_FIELDS = ('date', 'amount', 'category__name', 'type', 'note')
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _export_csv_rows(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['date', 'amount', 'category', 'type', 'note'])
+    for day, amount, category, type_, note in rows:
+        yield writer.writerow([day.isoformat(), amount, category, type_, note])
+
+
+async def _aiterate(chunks, batch_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterate ``chunks`` (a synchronous generator reading the database)
+    asynchronously, a batch at a time on the request's sync thread. Under
+    ASGI, Django would otherwise read a synchronous streaming response into
+    a list before sending any of it.
+    """
+    chunks = iter(chunks)
+    next_batch = sync_to_async(lambda: list(islice(chunks, batch_size)))
+    while batch := await next_batch():
+        for chunk in batch:
+            yield chunk
+
+
+def _export_ndjson_rows(rows):
+    for day, amount, category, type_, note in rows:
+        yield json.dumps({
+            'date': day.isoformat(),
+            'amount': str(amount),
+            'category': category,
+            'type': type_,
+            'note': note,
+        }) + '\n'
+
+
+@login_required
+def transaction_export(request):
+    """
+    Stream the filtered transaction list as CSV or NDJSON (?format=ndjson).
+    Rows are read in chunks as plain tuples, so memory use stays flat and the
+    first bytes are sent before the whole result set has been read.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return HttpResponseBadRequest('Unsupported export format.')
+    
+    rows = _apply_transaction_filters(
+        Transaction.objects.filter(user=request.user), _transaction_filters(request)
+    )
+    search = (request.GET.get('q') or '').strip()
+    if search:
+        rows = search_transactions(rows, search, request.user.id, ranked=False)
+    rows = rows.order_by('-date', '-created_at', 'id').values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+    
+    if export_format == 'csv':
+        content, content_type = _export_csv_rows(rows), 'text/csv'
+    else:
+        content, content_type = _export_ndjson_rows(rows), 'application/x-ndjson'
+    if isinstance(request, ASGIRequest):
+        content = _aiterate(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="transactions.{export_format}"'
+    return response
+
+
+@login_required
+def balance_history(request):
+    """
+    The user's running balance per day, week or month (?granularity=) as
+    JSON, optionally limited to ?start= and ?end= (YYYY-MM-DD).
+    """
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return HttpResponseBadRequest('Unsupported granularity.')
+    try:
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be YYYY-MM-DD.')
+    if start and end and start > end:
+        return HttpResponseBadRequest('start must not be after end.')
+    
+    series = balance_series(request.user.id, granularity, start, end)
+    return JsonResponse(series, json_dumps_params={'separators': (',', ':')})
+
+
 @login_required
 def transaction_create(request):
     if request.method == 'POST':
@@ -164,9 +291,37 @@ def transaction_delete(request, pk):
     return render(request, 'transactions/transaction_confirm_delete.html', {'transaction': transaction})
 
 
+@login_required
+def transaction_import(request):
+    result = None
+    if request.method == 'POST':
+        form = TransactionImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                # Byte lines are decoded one at a time, so an undecodable line is a row error
+                result = import_transactions(
+                    request.user,
+                    form.cleaned_data['file'],
+                    batch_size=getattr(settings, 'TRANSACTION_IMPORT_BATCH_SIZE', 20000),
+                )
+            except TransactionImportError as e:
+                form.add_error('file', str(e))
+            else:
+                if result.created:
+                    messages.success(request, f'Imported {result.created} transactions.')
+                if result.error_count:
+                    messages.warning(request, f'{result.error_count} rows could not be imported.')
+                if not result.error_count:
+                    return redirect('transactions_list')
+    else:
+        form = TransactionImportForm()
+    
+    return render(request, 'transactions/transaction_import.html', {'form': form, 'result': result})
+
+
 @login_required
 def categories_list(request):
-    categories = Category.objects.all()
+    categories = category_registry.all()
     return render(request, 'transactions/categories_list.html', {'categories': categories})
 
 
@@ -213,38 +368,21 @@ def category_delete(request, pk):
 
 
 @login_required
-def budgets_list(request):
-    budgets = Budget.objects.filter(user=request.user).select_related('category')
-    
-    # Calculate spending for each budget
+async def budgets_list(request):
+    # Budgets and spending load concurrently (cached per data version)
+    user = await request.auser()
     budget_data = []
-    for budget in budgets:
-        # Calculate date range based on period
-        if budget.period == 'weekly':
-            start_date = datetime.now() - timedelta(days=7)
-        else:  # monthly
-            start_date = datetime.now().replace(day=1)
-        
-        spent = Transaction.objects.filter(
-            user=request.user,
-            category=budget.category,
-            type='expense',
-            date__gte=start_date
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        
-        percentage = (spent / budget.limit_amount * 100) if budget.limit_amount > 0 else 0
-        remaining = budget.limit_amount - spent
-        
+    for status in await acached_payload('budgets', user.id, lambda: aevaluate_budgets(user)):
         budget_data.append({
-            'budget': budget,
-            'spent': spent,
-            'percentage': min(percentage, 100),
-            'remaining': remaining,
-            'over_budget': spent > budget.limit_amount
+            'budget': status['budget'],
+            'spent': status['spent'],
+            'percentage': min(status['percentage'], 100),
+            'remaining': status['remaining'],
+            'over_budget': status['over_budget']
         })
     
     context = {'budget_data': budget_data}
-    return render(request, 'transactions/budgets_list.html', context)
+    return await sync_to_async(render)(request, 'transactions/budgets_list.html', context)
 
 
 @login_required
@@ -294,3 +432,11 @@ def budget_delete(request, pk):
 def placeholder(request, page):
     context = {"page": page}
     return render(request, 'placeholder.html', context)
+
+
+@staff_member_required
+def cache_stats(request):
+    """
+    Hit/miss counters of the page payload cache, as JSON.
+    """
+    return JsonResponse({'backend': settings.CACHES['default']['BACKEND'], 'payloads': get_cache_stats()})
@@ -0,0 +1,46 @@
+"""
+Authentication backend that caches users between requests.
+
+AuthenticationMiddleware loads the logged-in user from the database on
+every request. CachedModelBackend serves it from the cache for
+``AUTH_USER_CACHE_TIMEOUT`` seconds instead (0 turns caching off). The
+cached copy is dropped when the user is saved (password change, last
+login) or deleted and when they log out (see signals.py). Other processes
+only see that with a shared cache, so the backend is only configured when
+``CACHE_SHARED`` is set (see settings.py).
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    """
+    Drop a cached user now, and again on commit so a copy cached by a
+    concurrent request from the pre-commit row is not served afterwards.
+    """
+    key = _user_key(user_id)
+    cache.delete(key)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedModelBackend(ModelBackend):
+    """``ModelBackend`` whose per-request user lookup is cached."""
+
+    def get_user(self, user_id):
+        timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+        if not timeout:
+            return super().get_user(user_id)
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, timeout)
+        return user
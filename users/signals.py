@@ -0,0 +1,24 @@
+"""
+Signal handlers that drop cached users (see backends.py) when they change
+or log out.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_cached_user
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_cached_user(user.pk)
@@ -1,5 +1,9 @@
-from django.test import TestCase, Client
+from django.conf import settings
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.urls import reverse
 
 
@@ -38,3 +42,72 @@ class UserAuthenticationTest(TestCase):
         response = self.client.get(reverse('profile'))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'users/profile.html')
+
+
+class SessionDefaultsTest(TestCase):
+    """Without a shared cache, sessions and users are read from the database."""
+    
+    def test_deleted_session_is_logged_out(self):
+        from django.contrib.sessions.models import Session
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+        self.assertEqual(settings.AUTHENTICATION_BACKENDS, ['django.contrib.auth.backends.ModelBackend'])
+        User.objects.create_user(username='testuser', password='testpass123')
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        self.assertEqual(client.get(reverse('profile')).status_code, 200)
+        # As when another process logs the session out
+        Session.objects.all().delete()
+        self.assertEqual(client.get(reverse('profile')).status_code, 302)
+
+
+@override_settings(
+    CACHE_SHARED=True,
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['users.backends.CachedModelBackend'],
+)
+class CachedAuthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def profile_tables(self, client=None):
+        """Tables read while serving the profile page."""
+        with CaptureQueriesContext(connection) as queries:
+            response = (client or self.client).get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in queries if 'auth_user' in q['sql'] or 'django_session' in q['sql']]
+    
+    def test_session_and_user_are_cached(self):
+        self.profile_tables()
+        self.assertEqual(self.profile_tables(), [])
+    
+    @override_settings(AUTH_USER_CACHE_TIMEOUT=0)
+    def test_user_cache_can_be_disabled(self):
+        self.profile_tables()
+        self.assertEqual(len(self.profile_tables()), 1)
+    
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        self.profile_tables(client)
+        self.assertEqual(self.profile_tables(client), [])
+    
+    def test_password_change_and_logout_drop_cached_user(self):
+        other = Client()
+        other.login(username='testuser', password='testpass123')
+        self.profile_tables(other)
+        
+        response = self.client.post(reverse('password_change'), {
+            'old_password': 'testpass123', 'new_password1': 'N3w-passw0rd!', 'new_password2': 'N3w-passw0rd!',
+        })
+        self.assertEqual(response.status_code, 302)
+        # The changing session stays logged in, the other one is logged out
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+        self.assertEqual(other.get(reverse('profile')).status_code, 302)
+        
+        self.profile_tables()
+        self.client.get(reverse('logout'))
+        self.assertIsNone(cache.get(f'auth:user:{self.user.pk}'))